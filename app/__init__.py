@@ -2,24 +2,32 @@
 Initializes the Flask application and imports the routes module.
 """
 
+import atexit
 import logging
-import logging.handlers
+import os
 import time
-from threading import Lock
 from flask import Flask
+from app.admission import AdmissionController
 from app.data_ingestor import DataIngestor
+from app.dataset_reloader import DatasetReloader
+from app.log_writer import configure_logging
 from app.task_runner import ThreadPool
 
 # Initialize the Flask application
 webserver = Flask(__name__)
 # Set the webserver configuration
 webserver.tasks_runner = ThreadPool()
+# Set the admission control of the job submissions
+webserver.admission = AdmissionController.from_env(webserver.tasks_runner)
 # Set the data ingestor
 webserver.data_ingestor = DataIngestor("./nutrition_activity_obesity_usa_subset.csv")
-# Set the lock
-webserver.lock = Lock()
-# Set the job counter
-webserver.job_counter = 1
+# Set the reloader of the dataset, watching the CSV file if DATA_WATCH_INTERVAL is set
+webserver.dataset_reloader = DatasetReloader.from_env(webserver)
+webserver.dataset_reloader.start_watching()
+# Set how long a synchronous request waits for its result before falling back to a job_id
+webserver.sync_budget = float(os.getenv('SYNC_BUDGET_MS', '50')) / 1000
+# Set the longest a long poll or a result stream may wait, in seconds
+webserver.long_poll_max_wait = float(os.getenv('LONG_POLL_MAX_WAIT', '30'))
 
 # Logger configuration
 logging.basicConfig(level=logging.INFO)
@@ -27,14 +35,11 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 # Set logger level to INFO
 logger.setLevel(logging.INFO)
-# Create a file handler
-handler = logging.handlers.RotatingFileHandler("webserver.log", maxBytes=1000000, backupCount=5)
-# Create a logging format
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-# Set the formatter
-handler.setFormatter(formatter)
-# Add the handler to the logger
-logger.addHandler(handler)
+# Write the records to the log file from a background thread, unless LOG_MODE says otherwise
+webserver.log_writer = configure_logging(logger, os.getenv('LOG_FILE', 'webserver.log'))
+if webserver.log_writer is not None:
+    # Write the records that are still queued when the process exits
+    atexit.register(webserver.log_writer.stop)
 # Tie logger to the webserver
 webserver.logger = logger
 # Set logger time to UTC/GMT
@@ -0,0 +1,144 @@
+"""
+admission.py module contains the admission control of the job submission endpoints: a bound on
+the queue depth and a token bucket rate limit per client address.
+"""
+
+from collections import deque
+from threading import Lock
+import math
+import os
+import time
+
+class TokenBucket:
+    """
+    TokenBucket class is used to rate limit a client: it holds up to burst tokens, refilled at
+    rate tokens per second, and every request takes one.
+    """
+    def __init__(self, rate, burst):
+        """
+        Initialize a full TokenBucket.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+
+    def refill(self, now):
+        """
+        Add the tokens earned since the last update.
+        """
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self, now):
+        """
+        Take a token. Returns 0 if there was one, otherwise the number of seconds until there is.
+        """
+        self.refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+class AdmissionController:
+    """
+    AdmissionController class decides if a job submission is admitted. A submission is rejected
+    with 503 when the task queue of the thread pool already holds max_queue_depth tasks, and with
+    429 when its client is over the rate limit. The rate limit is keyed on the remote address of
+    the client, which it cannot choose freely, and not on the X-Client-Id header: a client
+    sending a new id with every request would otherwise never run out of tokens. The header is
+    only used for fair scheduling. Both answers come with a Retry-After estimate: the time to
+    drain the queue at the current throughput, or the time until the client has a token again.
+    """
+    # Seconds of completions used to estimate the throughput
+    THROUGHPUT_WINDOW = 10
+    SAMPLE_INTERVAL = 0.1
+    # Buckets kept before the full (idle) ones are dropped
+    MAX_BUCKETS = 10000
+
+    def __init__(self, thread_pool, max_queue_depth=0, rate=0, burst=0):
+        """
+        Initialize the AdmissionController; a max_queue_depth or rate of 0 disables that limit.
+        """
+        self.thread_pool = thread_pool
+        self.max_queue_depth = max_queue_depth
+        self.rate = rate
+        self.burst = max(burst, 1)
+        # remote address -> TokenBucket
+        self.buckets = {}
+        # (time, completed tasks) samples of the last THROUGHPUT_WINDOW seconds
+        self.samples = deque()
+        self.lock = Lock()
+        self.rejected = 0
+
+    @classmethod
+    def from_env(cls, thread_pool):
+        """
+        Create the AdmissionController configured by the environment variables:
+        MAX_QUEUE_DEPTH - queued tasks above which submissions are rejected (default 10000, 0 for
+        no limit); RATE_LIMIT_RPS - submissions per second per client address (default 0, no
+        limit); RATE_LIMIT_BURST - submissions an address can make at once (default
+        2 * RATE_LIMIT_RPS).
+        """
+        rate = float(os.getenv('RATE_LIMIT_RPS', '0'))
+        return cls(thread_pool,
+                   max_queue_depth=int(os.getenv('MAX_QUEUE_DEPTH', '10000')),
+                   rate=rate,
+                   burst=int(os.getenv('RATE_LIMIT_BURST', str(math.ceil(2 * rate)))))
+
+    def throughput(self, now):
+        """
+        Estimate the throughput of the thread pool, in tasks per second.
+        """
+        # At most one sample every SAMPLE_INTERVAL seconds keeps the window small
+        if not self.samples or now - self.samples[-1][0] >= self.SAMPLE_INTERVAL:
+            self.samples.append((now, self.thread_pool.completed_tasks))
+        while now - self.samples[0][0] > self.THROUGHPUT_WINDOW:
+            self.samples.popleft()
+
+        first_time, first_completed = self.samples[0]
+        if now - first_time < 1:
+            return 0
+        return (self.samples[-1][1] - first_completed) / (now - first_time)
+
+    def admit(self, remote_addr):
+        """
+        Check if a submission from a remote address is admitted. Returns None if it is,
+        otherwise the (status code, Retry-After seconds, message) of the rejection.
+        """
+        now = time.monotonic()
+
+        with self.lock:
+            # Sample the completions on every submission, so the estimate is ready on overload
+            throughput = self.throughput(now)
+
+            queue_depth = self.thread_pool.task_queue.qsize()
+            if self.max_queue_depth and queue_depth >= self.max_queue_depth:
+                self.rejected += 1
+                retry_after = queue_depth / throughput if throughput else self.THROUGHPUT_WINDOW
+                return 503, max(1, math.ceil(retry_after)), "Server is overloaded."
+
+            if not self.rate:
+                return None
+
+            bucket = self.buckets.get(remote_addr)
+            if bucket is None:
+                if len(self.buckets) >= self.MAX_BUCKETS:
+                    self.drop_idle_buckets(now)
+                bucket = self.buckets[remote_addr] = TokenBucket(self.rate, self.burst)
+
+            wait = bucket.try_acquire(now)
+            if wait:
+                self.rejected += 1
+                return 429, max(1, math.ceil(wait)), "Too many requests."
+
+        return None
+
+    def drop_idle_buckets(self, now):
+        """
+        Drop the buckets that refilled completely, a new bucket would be the same.
+        """
+        for remote_addr, bucket in list(self.buckets.items()):
+            bucket.refill(now)
+            if bucket.tokens >= bucket.burst:
+                del self.buckets[remote_addr]
@@ -0,0 +1,102 @@
+"""
+AggregateCube class to keep the sums and counts needed to answer every request type.
+"""
+
+class AggregateCube:
+    """
+    class AggregateCube to keep the sums and counts of the data values grouped by question, state,
+    stratification category and stratification segment, together with the roll-ups per state and
+    per question. Every cell is a [sum, count] list. Values are added in file order, so the sums
+    are exactly the ones a scan over the rows would produce.
+    """
+    def __init__(self):
+        """
+        Initialize the AggregateCube class with empty aggregates.
+        """
+        # question -> [sum, count]
+        self.question_totals = {}
+        # question -> state -> [sum, count]
+        self.state_totals = {}
+        # question -> category -> segment -> state -> [sum, count]
+        self.category_totals = {}
+        # question -> state -> category -> segment -> [sum, count]
+        self.state_category_totals = {}
+
+    def add(self, question: str, state: str, category: str, segment: str, value: float):
+        """
+        add method to add a data value to every aggregate it belongs to.
+        """
+        self.add_question_total(question, value, 1)
+        self.add_state_total(question, state, value, 1)
+
+        # Values without a category or a category segment are not stratified
+        if category == '' or segment == '':
+            return
+
+        self.add_category_total(question, state, category, segment, value, 1)
+
+    def add_question_total(self, question: str, values_sum: float, count: int):
+        """
+        add_question_total method to add a sum and a count to the roll-up of a question.
+        """
+        cell = self.question_totals.setdefault(question, [0, 0])
+        cell[0] += values_sum
+        cell[1] += count
+
+    def add_state_total(self, question: str, state: str, values_sum: float, count: int):
+        """
+        add_state_total method to add a sum and a count to the roll-up of a question for a state.
+        """
+        cell = self.state_totals.setdefault(question, {}).setdefault(state, [0, 0])
+        cell[0] += values_sum
+        cell[1] += count
+
+    def add_category_total(self, question: str, state: str, category: str, segment: str,
+                           values_sum: float, count: int):
+        """
+        add_category_total method to add a sum and a count to the cell of a question, state,
+        category and segment.
+        """
+        # Add to the category, segment and state cell
+        cell = self.category_totals.setdefault(question, {}).setdefault(category, {}) \
+            .setdefault(segment, {}).setdefault(state, [0, 0])
+        cell[0] += values_sum
+        cell[1] += count
+
+        # Add to the state, category and segment cell
+        cell = self.state_category_totals.setdefault(question, {}).setdefault(state, {}) \
+            .setdefault(category, {}).setdefault(segment, [0, 0])
+        cell[0] += values_sum
+        cell[1] += count
+
+    def question_total(self, question: str):
+        """
+        question_total method to get the [sum, count] of a question.
+        """
+        return self.question_totals.get(question, [0, 0])
+
+    def question_state_totals(self, question: str):
+        """
+        question_state_totals method to get the state -> [sum, count] aggregates of a question.
+        """
+        return self.state_totals.get(question, {})
+
+    def question_state_total(self, question: str, state: str):
+        """
+        question_state_total method to get the [sum, count] of a question for a state.
+        """
+        return self.state_totals.get(question, {}).get(state, [0, 0])
+
+    def question_category_totals(self, question: str):
+        """
+        question_category_totals method to get the category -> segment -> state -> [sum, count]
+        aggregates of a question.
+        """
+        return self.category_totals.get(question, {})
+
+    def question_state_category_totals(self, question: str, state: str):
+        """
+        question_state_category_totals method to get the category -> segment -> [sum, count]
+        aggregates of a question for a state.
+        """
+        return self.state_category_totals.get(question, {}).get(state, {})
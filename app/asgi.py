@@ -0,0 +1,259 @@
+"""
+asgi.py module defines an asyncio (ASGI) variant of the job API. It serves the job submission,
+result and queue size endpoints of routes.py on the same webserver state (data ingestor, thread
+pool, result store and job registry), but every request is a coroutine: waiting for a job does not
+hold a thread, so a single process can keep a very large number of pollers open.
+
+Run it with an ASGI server, e.g.: uvicorn app.asgi:application
+"""
+
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from werkzeug.http import parse_etags, quote_etag
+
+from app import webserver
+from app.result_encoding import EncodedResult, negotiate_encoding, sync_document
+from app.routes import create_task, next_job_id
+from app.task_queue import parse_priority
+
+# Job submission endpoints and the request type of their jobs
+JOB_ENDPOINTS = {
+    '/api/states_mean': 'states_mean_request',
+    '/api/state_mean': 'state_mean_request',
+    '/api/best5': 'best5_request',
+    '/api/worst5': 'worst5_request',
+    '/api/global_mean': 'global_mean_request',
+    '/api/diff_from_mean': 'diff_from_mean_request',
+    '/api/state_diff_from_mean': 'state_diff_from_mean_request',
+    '/api/mean_by_category': 'mean_by_category_request',
+    '/api/state_mean_by_category': 'state_mean_by_category_request',
+    '/api/batch': 'batch_request',
+}
+
+RESULTS_PREFIX = '/api/get_results/'
+
+async def application(scope, receive, send):
+    """
+    application is the ASGI entry point.
+    """
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    method = scope['method']
+    path = scope['path']
+    query = parse_qs(scope['query_string'].decode('latin-1'))
+    headers = {name.decode('latin-1').lower(): value.decode('latin-1')
+               for name, value in scope['headers']}
+
+    if method == 'POST' and path in JOB_ENDPOINTS:
+        body = await read_body(receive)
+        remote_addr = (scope.get('client') or ('',))[0]
+        status, response = await submit_job(JOB_ENDPOINTS[path], body, headers, query,
+                                             remote_addr)
+    elif method == 'GET' and path.startswith(RESULTS_PREFIX):
+        status, response = await get_results(path[len(RESULTS_PREFIX):], query)
+        if isinstance(response, EncodedResult):
+            await send_result(send, response, headers)
+            return
+    elif method == 'GET' and path == '/api/num_jobs':
+        status, response = 200, num_jobs()
+    else:
+        status, response = 404, {'status': 'error', 'message': 'Not found'}
+
+    if isinstance(response, bytes):
+        await send_body(send, status, response)
+        return
+
+    response_headers = []
+    if 'retry_after' in response:
+        response_headers.append((b'retry-after', str(response['retry_after']).encode('latin-1')))
+
+    await send_json(send, status, response, response_headers)
+
+async def lifespan(receive, send):
+    """
+    lifespan method answers the ASGI lifespan events; the pool is shut down on shutdown.
+    """
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await asyncio.to_thread(webserver.tasks_runner.shutdown)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def read_body(receive):
+    """
+    read_body method reads the whole body of a request.
+    """
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body', False):
+            return body
+
+async def send_json(send, status, response, headers=()):
+    """
+    send_json method sends a JSON response, with the given extra headers.
+    """
+    await send_body(send, status, json.dumps(response).encode('utf-8'), headers)
+
+async def send_body(send, status, body, headers=()):
+    """
+    send_body method sends a response of JSON bytes, with the given extra headers.
+    """
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'),
+                    (b'content-length', str(len(body)).encode('latin-1')), *headers],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+async def send_result(send, encoded, headers):
+    """
+    send_result method sends the response of a done job from its EncodedResult, like
+    routes.result_response: 304 if the If-None-Match header has its ETag, otherwise its JSON,
+    compressed with the best content coding of the Accept-Encoding header.
+    """
+    etag = quote_etag(encoded.etag(), weak=True).encode('latin-1')
+    response_headers = [(b'etag', etag), (b'vary', b'Accept-Encoding')]
+
+    if parse_etags(headers.get('if-none-match')).contains_weak(encoded.etag()):
+        await send({'type': 'http.response.start', 'status': 304, 'headers': response_headers})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+
+    body = encoded.document()
+    encoding = negotiate_encoding(headers.get('accept-encoding'), len(body))
+    if encoding is not None:
+        body = encoded.compressed_document(encoding)
+        response_headers.append((b'content-encoding', encoding.encode('latin-1')))
+
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-type', b'application/json'),
+                    (b'content-length', str(len(body)).encode('latin-1')), *response_headers],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+async def wait_for_task(job_id, timeout):
+    """
+    wait_for_task method waits up to timeout seconds for a job to finish, without blocking the
+    event loop. Returns True if the job is done.
+    """
+    future = webserver.tasks_runner.completion_future(job_id)
+    try:
+        return await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        return webserver.tasks_runner.jobs.is_done(job_id)
+
+async def submit_job(request_type, body, headers, query, remote_addr):
+    """
+    submit_job method registers a job, like routes.submit_job: the job is scheduled for the
+    client of the X-Client-Id header (or the remote address) and rate limited by the remote
+    address. With the X-Sync: 1 header or the sync=1 query parameter the result is awaited for
+    up to webserver.sync_budget seconds and, if the job is done, answered as the JSON bytes of
+    routes.run_sync.
+    """
+    # Log the request
+    webserver.logger.info("Received %s", request_type, extra={'request_type': request_type})
+
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return 400, {'status': 'error', 'message': 'Invalid JSON'}
+
+    # Check if server is in drain mode
+    if webserver.tasks_runner.shutdown_event.is_set():
+        return 503, {"status": "Server is shutting down."}
+
+    # The body of a batch must be a list of requests, any other body a request of its type
+    if request_type == 'batch_request':
+        if not isinstance(data, list):
+            return 400, {'status': 'error', 'message': 'Expected a list of requests'}
+    else:
+        try:
+            webserver.data_ingestor.check_request(data, request_type)
+        except ValueError as e:
+            return 400, {'status': 'error', 'message': str(e)}
+
+    # Reject the job if the server is overloaded or the client address is over its rate limit
+    rejection = webserver.admission.admit(remote_addr)
+    if rejection is not None:
+        status_code, retry_after, message = rejection
+        return status_code, {"status": message, "retry_after": retry_after}
+
+    job_id = next_job_id()
+    client_id = headers.get('x-client-id') or remote_addr
+    task = create_task(job_id, data, request_type, client_id,
+                       parse_priority(headers.get('x-priority')))
+    thread_pool = webserver.tasks_runner
+
+    if headers.get('x-sync') != '1' and query.get('sync') != ['1']:
+        thread_pool.add_task(task)
+        return 200, {"job_id": job_id}
+
+    if task.is_cached():
+        thread_pool.run_task(task)
+    else:
+        thread_pool.add_task(task)
+    # A cached job is done already, unless it was attached to an identical running job
+    if not await wait_for_task(job_id, webserver.sync_budget):
+        return 200, {"job_id": job_id}
+
+    # Splice the encoded result instead of decoding it, like routes.run_sync
+    return 200, sync_document(thread_pool.result_store.get_encoded(job_id), job_id)
+
+async def get_results(job_id, query):
+    """
+    get_results method returns the result of a job, like routes.get_response, as its
+    EncodedResult if the job is done or an error if it failed; with the wait query parameter it
+    awaits the job for up to that many seconds.
+    """
+    # Check if job_id is convertible to an integer and wait is a number of seconds
+    try:
+        job_id = int(job_id)
+        wait = min(float(query.get('wait', ['0'])[0]), webserver.long_poll_max_wait)
+    except ValueError:
+        return 400, {'status': 'error', 'message': 'Invalid job_id or wait'}
+
+    thread_pool = webserver.tasks_runner
+
+    # Long poll: await the job until it is done or the wait is over
+    if wait > 0:
+        await wait_for_task(job_id, wait)
+
+    if thread_pool.jobs.is_expired(job_id):
+        return 404, {'status': 'error', 'message': 'Result expired'}
+
+    status = thread_pool.job_status(job_id)
+    if status == 'error':
+        return 500, {'status': 'error', 'message': 'Job failed'}
+    if status != 'done':
+        return 200, {'status': 'running'}
+
+    encoded = thread_pool.result_store.get_encoded(job_id)
+    if encoded is None:
+        return 404, {'status': 'error', 'message': 'Result expired'}
+
+    return 200, encoded
+
+def num_jobs():
+    """
+    num_jobs method returns the number of jobs in the queue or running, like routes.num_jobs.
+    """
+    jobs_counter = webserver.tasks_runner.task_queue.qsize()
+    for thread in webserver.tasks_runner.threads:
+        if thread.has_task:
+            jobs_counter += 1
+
+    return {"num_jobs": jobs_counter}
@@ -0,0 +1,330 @@
+"""
+ColumnStore class to keep the CSV data as NumPy columns.
+"""
+
+from array import array
+from itertools import islice
+import csv
+import multiprocessing
+import os
+
+import numpy as np
+
+class ColumnStore:
+    """
+    class ColumnStore to keep the CSV data as NumPy columns. The categorical columns are
+    dictionary-encoded: each distinct string gets a small integer code (in order of first
+    appearance) and the column only stores the codes.
+    """
+    # Categorical columns and their position in the CSV file
+    CATEGORICAL_COLUMNS = {
+        "Question": 8,
+        "LocationDesc": 4,
+        "StratificationCategory1": 30,
+        "Stratification1": 31,
+    }
+
+    # Numeric columns and their position in the CSV file
+    NUMERIC_COLUMNS = {
+        "YearStart": 1,
+        "YearEnd": 2,
+        "Data_Value": 11,
+    }
+
+    def __init__(self, columns: dict, strings: dict):
+        """
+        Initialize the ColumnStore class with the column arrays and, for every categorical
+        column, the list of strings indexed by code.
+        """
+        self.columns = columns
+        self.strings = strings
+        # string -> code, for every categorical column
+        self.codes = {column: {value: code for code, value in enumerate(values)}
+                      for column, values in strings.items()}
+
+    @classmethod
+    def empty(cls):
+        """
+        empty method to create a ColumnStore without rows.
+        """
+        return cls({}, {column: [] for column in cls.CATEGORICAL_COLUMNS})
+
+    @classmethod
+    def from_csv(cls, csv_path: str, chunk_rows: int = 65536, workers: int = 1):
+        """
+        from_csv method to read a csv file into a ColumnStore. The file is streamed chunk_rows
+        rows at a time and every chunk is encoded to its compact columns right away, so only one
+        chunk of rows is ever held in Python objects. With more than one worker, the file is
+        split into byte ranges that are read in parallel by forked worker processes (except in
+        a daemon process, such as a worker of the process backend, which cannot fork workers).
+        """
+        if workers > 1 and not multiprocessing.current_process().daemon:
+            return cls.from_csv_parallel(csv_path, chunk_rows, workers)
+
+        store = cls.empty()
+
+        with open(csv_path, 'r', encoding='utf-8') as file:
+            csv_reader = csv.reader(file)
+            # Skip the header
+            next(csv_reader)
+
+            store.columns = concatenate_chunks(store.read_chunks(csv_reader, chunk_rows))
+
+        return store
+
+    @classmethod
+    def from_csv_parallel(cls, csv_path: str, chunk_rows: int, workers: int):
+        """
+        from_csv_parallel method to read the byte ranges of a csv file in parallel. Every worker
+        encodes its range with its own codes; the ranges are then merged in file order, mapping
+        their codes to the codes of the whole file, so the result is the same as a sequential
+        read. The lines of the file must not contain quoted newlines.
+        """
+        # Forked processes need nothing pickled but their results, so this also works while the
+        # app package is still being imported
+        context = multiprocessing.get_context('fork')
+        readers = []
+        for start, end in csv_byte_ranges(csv_path, workers):
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(target=send_csv_range,
+                                      args=(sender, csv_path, start, end, chunk_rows), daemon=True)
+            process.start()
+            sender.close()
+            readers.append((process, receiver))
+
+        parts = []
+        for process, receiver in readers:
+            try:
+                part = receiver.recv()
+            except EOFError:
+                part = ValueError(f"Error reading {csv_path}")
+            process.join()
+            if isinstance(part, Exception):
+                raise part
+            parts.append(part)
+
+        store = cls.empty()
+
+        # Give the strings of every range their code in the whole file, in file order
+        mappings = []
+        for strings, _ in parts:
+            mappings.append({column: [store.code(column, value) for value in values]
+                             for column, values in strings.items()})
+
+        chunks = []
+        for (_, columns), mapping in zip(parts, mappings):
+            for column in cls.CATEGORICAL_COLUMNS:
+                dtype = np.min_scalar_type(max(len(store.strings[column]) - 1, 0))
+                codes = np.array(mapping[column], dtype=dtype)
+                columns[column] = codes[columns[column]]
+            chunks.append(columns)
+
+        store.columns = concatenate_chunks(chunks)
+        return store
+
+    def code(self, column: str, value: str):
+        """
+        code method to get the code of a string of a categorical column, giving a new string
+        the next code.
+        """
+        code = self.codes[column].get(value)
+        if code is None:
+            code = len(self.strings[column])
+            self.codes[column][value] = code
+            self.strings[column].append(value)
+        return code
+
+    def read_chunks(self, rows, chunk_rows: int):
+        """
+        read_chunks method to encode rows chunk_rows at a time. Returns the list of the columns
+        of every chunk.
+        """
+        rows = iter(rows)
+        chunks = []
+        while True:
+            # The rows are encoded as they are read, never held as a list
+            columns = self.encode_rows(islice(rows, chunk_rows))
+            if not len(columns["Data_Value"]):
+                return chunks
+            chunks.append(columns)
+
+    def append_rows(self, rows):
+        """
+        append_rows method to append rows (lists of CSV values) at the end of the columns. New
+        strings get the next codes, and a categorical column is widened if its codes no longer
+        fit its type. Returns the number of rows appended.
+        """
+        chunk = self.encode_rows(rows)
+        self.columns = concatenate_chunks([self.columns, chunk]) if self.columns else chunk
+
+        return len(chunk["Data_Value"])
+
+    def encode_rows(self, rows):
+        """
+        encode_rows method to encode rows (lists of CSV values) into columns, with the codes of
+        this store. New strings get the next codes.
+        """
+        buffers = {column: array('l') for column in self.CATEGORICAL_COLUMNS}
+        buffers["YearStart"] = array('l')
+        buffers["YearEnd"] = array('l')
+        buffers["Data_Value"] = array('d')
+
+        # read line by line
+        for values in rows:
+            for column, position in self.CATEGORICAL_COLUMNS.items():
+                buffers[column].append(self.code(column, values[position]))
+
+            buffers["YearStart"].append(parse_year(values[1]))
+            buffers["YearEnd"].append(parse_year(values[2]))
+            buffers["Data_Value"].append(parse_value(values[11]))
+
+        return to_columns(buffers, self.strings)
+
+    def __len__(self):
+        """
+        Return the number of rows.
+        """
+        return len(self.columns["Data_Value"])
+
+    def decode(self, column: str, code: int):
+        """
+        decode method to get the string of a code of a categorical column.
+        """
+        return self.strings[column][code]
+
+    def year_window_mask(self, year_start: int, year_end: int, first_row: int = 0):
+        """
+        year_window_mask method to get the mask of the rows with a numeric data value that
+        started in or after year_start and ended in or before year_end, for the rows from
+        first_row on.
+        """
+        return ((self.columns["YearStart"][first_row:] >= year_start)
+                & (self.columns["YearEnd"][first_row:] <= year_end)
+                & ~np.isnan(self.columns["Data_Value"][first_row:]))
+
+    def group_totals(self, group_columns: tuple, mask):
+        """
+        group_totals method to get the sum and the count of the data values of the masked rows,
+        grouped by the given categorical columns. The groups are returned as
+        (codes, sum, count) tuples in order of first appearance. np.bincount adds the values of
+        a group one by one in row order, so the sums match a row by row scan.
+        """
+        rows = np.flatnonzero(mask)
+        if len(rows) == 0:
+            return []
+
+        # Combine the codes of the group columns into a single key per row
+        keys = np.zeros(len(rows), dtype=np.int64)
+        for column in group_columns:
+            keys = keys * len(self.strings[column]) + self.columns[column][rows]
+
+        _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        sums = np.bincount(inverse, weights=self.columns["Data_Value"][rows])
+        counts = np.bincount(inverse)
+
+        groups = []
+        for group in np.argsort(first, kind='stable'):
+            first_row = rows[first[group]]
+            codes = tuple(int(self.columns[column][first_row]) for column in group_columns)
+            groups.append((codes, float(sums[group]), int(counts[group])))
+
+        return groups
+
+def concatenate_chunks(chunks: list):
+    """
+    concatenate_chunks function to concatenate the columns of consecutive chunks of rows. NumPy
+    promotes the codes of the earlier chunks to the type of the later ones if it is wider.
+    """
+    if not chunks:
+        return ColumnStore.empty().encode_rows([])
+    if len(chunks) == 1:
+        return chunks[0]
+    return {column: np.concatenate([chunk[column] for chunk in chunks]) for column in chunks[0]}
+
+def csv_byte_ranges(csv_path: str, parts: int):
+    """
+    csv_byte_ranges function to split the rows of a csv file (after the header) into at most
+    parts byte ranges of about the same size, each starting at the beginning of a line.
+    """
+    size = os.path.getsize(csv_path)
+    with open(csv_path, 'rb') as file:
+        file.readline()
+        boundaries = [file.tell()]
+
+        for part in range(1, parts):
+            position = boundaries[0] + (size - boundaries[0]) * part // parts
+            # Move to the start of the next line, unless the position already is one
+            file.seek(max(position - 1, boundaries[-1]))
+            file.readline()
+            boundaries.append(max(file.tell(), boundaries[-1]))
+
+    boundaries.append(size)
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if start < end]
+
+def send_csv_range(connection, csv_path: str, start: int, end: int, chunk_rows: int):
+    """
+    send_csv_range function to read a byte range of a csv file in a worker process and send the
+    strings and the columns of the range, or the error, through the connection.
+    """
+    try:
+        connection.send(read_csv_range(csv_path, start, end, chunk_rows))
+    except (OSError, ValueError, IndexError) as e:
+        connection.send(e)
+    finally:
+        connection.close()
+
+def read_csv_range(csv_path: str, start: int, end: int, chunk_rows: int):
+    """
+    read_csv_range function to encode the lines of a byte range of a csv file, with codes of its
+    own. Returns the strings and the columns of the range.
+    """
+    def lines():
+        with open(csv_path, 'rb') as file:
+            file.seek(start)
+            remaining = end - start
+            for line in file:
+                if remaining <= 0:
+                    return
+                remaining -= len(line)
+                yield line.decode('utf-8')
+
+    store = ColumnStore.empty()
+    columns = concatenate_chunks(store.read_chunks(csv.reader(lines()), chunk_rows))
+    return store.strings, columns
+
+def parse_year(value: str):
+    """
+    parse_year function to parse a year, 0 if it is missing.
+    """
+    try:
+        return int(value)
+    except ValueError:
+        return 0
+
+def parse_value(value: str):
+    """
+    parse_value function to parse a data value, NaN if it is not numeric.
+    """
+    try:
+        return float(value)
+    except ValueError:
+        return float('nan')
+
+def to_columns(buffers: dict, strings: dict):
+    """
+    to_columns function to turn the read buffers into NumPy columns. Each categorical column uses
+    the smallest unsigned integer type that can hold its codes.
+    """
+    columns = {}
+
+    for column, buffer in buffers.items():
+        if column in strings:
+            dtype = np.min_scalar_type(max(len(strings[column]) - 1, 0))
+        elif column == "Data_Value":
+            dtype = np.float64
+        else:
+            dtype = np.int16
+
+        columns[column] = np.frombuffer(buffer, dtype=np.dtype(buffer.typecode)).astype(dtype)
+
+    return columns
@@ -2,17 +2,63 @@
 DataIngestor class to read and process data from a CSV file.
 """
 
+from threading import RLock
 import csv
+import io
+import itertools
+import os
+import shutil
+import weakref
+
+from app.aggregate_cube import AggregateCube
+from app.column_store import ColumnStore
+from app.result_cache import ResultCache
+from app.snapshot import load_snapshot, snapshot_mmap, write_snapshot, write_version_snapshot
 
 class DataIngestor:
     """
     class DataIngestor to read and process data from a CSV file.
     """
-    def __init__(self, csv_path: str):
+    # Request types that are answered for a single state
+    STATE_REQUEST_TYPES = (
+        'state_mean_request',
+        'state_diff_from_mean_request',
+        'state_mean_by_category_request',
+    )
+
+    def __init__(self, csv_path: str, versions=None, data=None):
         """
-        Initialize the DataIngestor class with the csv_path to read the data from the csv file.
+        Initialize the DataIngestor class with the csv_path to read the data from the csv file
+        and the counter the versions of the dataset are drawn from (a new itertools.count by
+        default). The DataIngestors that replace one another on a reload share one counter, so
+        two datasets never get the same version. The results of the requests are memoized in a
+        ResultCache holding RESULT_CACHE_SIZE results (1024 by default, 0 disables it).
+
+        data is the ColumnStore of the dataset when it is already loaded (e.g. from a version
+        snapshot, in a worker process): the csv file is then not read, and no tail can be
+        appended.
         """
-        self.data = self.read_csv(csv_path)
+        self.csv_path = csv_path
+        # Bytes of the csv file that are in the data, the rows after them can be appended
+        self.csv_size = None
+        if data is None:
+            stat = os.stat(csv_path)
+            self.csv_size = stat.st_size
+            data = self.read_csv(csv_path, stat)
+        self.data = data
+        # Sums and counts used to answer the requests, built once and updated by appends
+        self.cube = self.build_cube(self.data)
+        # Held while the answer of a request is computed or rows are appended
+        self.lock = RLock()
+        # Drawn from versions when the data is loaded and on every append, part of the result
+        # cache keys
+        self.versions = itertools.count() if versions is None else versions
+        self.version = next(self.versions)
+        self.result_cache = ResultCache(int(os.getenv('RESULT_CACHE_SIZE', '1024')))
+        # DataIngestor that replaced this one on a reload, the appends are forwarded to it
+        self.replaced_by = None
+        # (version, path, finalizer deleting it) of the last version snapshot of the data
+        self.saved_version = None
 
         self.questions_best_is_min = [
             'Percent of adults aged 18 years and older who have an overweight classification',
@@ -37,36 +83,339 @@ class DataIngestor:
                 a week',
         ]
 
-    def read_csv(self, csv_path: str):
+    def read_csv(self, csv_path: str, stat=None):
+        """
+        read_csv method to read the csv file and return the data as a ColumnStore. The parsed
+        data is loaded from the snapshot of the file when there is a valid one, otherwise the file
+        is parsed and a snapshot is written for the next start. stat is the os.stat_result of the
+        file taken before it is read (a new one by default); the snapshot is checked against it
+        and labelled with it. The file is parsed in chunks of CSV_CHUNK_ROWS rows (65536 by
+        default), by CSV_LOAD_WORKERS processes reading byte ranges of the file in parallel (1 by
+        default).
+        """
+        if stat is None:
+            stat = os.stat(csv_path)
+        data = load_snapshot(csv_path, stat)
+        if data is not None:
+            return data
+
+        data = ColumnStore.from_csv(csv_path,
+                                    chunk_rows=int(os.getenv('CSV_CHUNK_ROWS', '65536')),
+                                    workers=int(os.getenv('CSV_LOAD_WORKERS', '1')))
+        try:
+            written = write_snapshot(csv_path, data, stat)
+        except OSError as e:
+            print(f"Error writing snapshot of {csv_path}: {e}")
+            return data
+
+        # Drop the private copy of the columns in favour of the shared mapping
+        if written and snapshot_mmap():
+            mapped = load_snapshot(csv_path, stat)
+            if mapped is not None:
+                data = mapped
+
+        return data
+
+    def build_cube(self, data: ColumnStore):
         """
-        read_csv method to read the csv file and return the data as a list of dictionaries.
+        build_cube method to aggregate the rows inside the 2011 - 2022 year window into an
+        AggregateCube. Rows without a numeric data value cannot contribute to a mean, so they are
+        left out.
         """
-        with open(csv_path, 'r', encoding='utf-8') as file:
-            csv_reader = csv.reader(file)
-            # Skip the header
-            next(csv_reader)
+        cube = AggregateCube()
+        mask = data.year_window_mask(2011, 2022)
 
-            # read line by line
-            data = []
+        # Roll-up per question
+        for (question,), values_sum, count in data.group_totals(("Question",), mask):
+            cube.add_question_total(data.decode("Question", question), values_sum, count)
 
-            for values in csv_reader:
-                # create a dictionary from the values
-                data.append({
-                    "YearStart": values[1],
-                    "YearEnd": values[2],
-                    "LocationDesc": values[4],
-                    "Question": values[8],
-                    "Data_Value": values[11],
-                    "StratificationCategory1": values[30],
-                    "Stratification1": values[31],
-                })
+        # Roll-up per question and state
+        group_columns = ("Question", "LocationDesc")
+        for codes, values_sum, count in data.group_totals(group_columns, mask):
+            question, state = map(data.decode, group_columns, codes)
+            cube.add_state_total(question, state, values_sum, count)
 
-        # Return the list of dictionaries containing the data
-        return data
+        # Cells per question, state, category and segment
+        group_columns = ("Question", "LocationDesc", "StratificationCategory1", "Stratification1")
+        for codes, values_sum, count in data.group_totals(group_columns, mask):
+            question, state, category, segment = map(data.decode, group_columns, codes)
+
+            # Skip if category or category_segment is empty
+            if category == '' or segment == '':
+                continue
+
+            cube.add_category_total(question, state, category, segment, values_sum, count)
+
+        return cube
+
+    def append_rows(self, rows):
+        """
+        append_rows method to append rows (lists of CSV values) to the data and add them to the
+        aggregates in place. The rows are added one by one in order, like the rows of a full
+        build, so the aggregates are exactly the ones a rebuild would produce. The data gets a new
+        version and the cached results are dropped. Returns the number of rows appended. Raises
+        ValueError, before changing anything, if a row is too short.
+        """
+        rows = self.check_rows(rows)
+
+        with self.lock:
+            first_row = len(self.data)
+            count = self.data.append_rows(rows)
+
+            data = self.data
+            mask = data.year_window_mask(2011, 2022, first_row)
+            group_columns = ("Question", "LocationDesc", "StratificationCategory1",
+                             "Stratification1")
+            for row in mask.nonzero()[0] + first_row:
+                codes = (data.columns[column][row] for column in group_columns)
+                question, state, category, segment = map(data.decode, group_columns, codes)
+                self.cube.add(question, state, category, segment,
+                              float(data.columns["Data_Value"][row]))
+
+            self.version = next(self.versions)
+            self.result_cache.clear()
+
+        return count
+
+    @staticmethod
+    def check_rows(rows):
+        """
+        check_rows method to check that every row has all the columns that are read. Returns the
+        rows as a list.
+        """
+        rows = list(rows)
+        row_length = max(*ColumnStore.CATEGORICAL_COLUMNS.values(),
+                         *ColumnStore.NUMERIC_COLUMNS.values()) + 1
+        for values in rows:
+            if len(values) < row_length:
+                raise ValueError(f"Expected {row_length} columns, got {len(values)}")
+        return rows
+
+    def append_tail(self):
+        """
+        append_tail method to append the complete lines that were written at the end of the csv
+        file since it was read. Returns the number of rows appended. Once the DataIngestor has
+        been replaced by a reload, the lines are appended to the DataIngestor that replaced it,
+        so they are not lost in the swap and the data of this one no longer changes.
+        """
+        with self.lock:
+            if self.replaced_by is not None:
+                return self.replaced_by.append_tail()
+
+            with open(self.csv_path, 'rb') as file:
+                file.seek(self.csv_size)
+                tail = file.read()
+
+            # A last line without its newline may still be being written
+            end = tail.rfind(b'\n') + 1
+            if not end:
+                return 0
+
+            count = self.append_rows(csv.reader(io.StringIO(tail[:end].decode('utf-8'))))
+            self.csv_size += end
+
+        return count
+
+    def append_csv(self, text: str):
+        """
+        append_csv method to append CSV lines (with or without the header line) to the csv file
+        and then to the data. Returns the number of rows appended.
+        """
+        with open(self.csv_path, 'r', encoding='utf-8') as file:
+            header = file.readline()
+
+        lines = text.splitlines(keepends=True)
+        if lines and lines[0].strip() == header.strip():
+            lines = lines[1:]
+        if not lines:
+            return 0
+        if not lines[-1].endswith('\n'):
+            lines[-1] += '\n'
+        self.check_rows(csv.reader(lines))
+
+        with self.lock:
+            if self.replaced_by is not None:
+                return self.replaced_by.append_csv(text)
+
+            with open(self.csv_path, 'a', encoding='utf-8') as file:
+                file.writelines(lines)
+
+            return self.append_tail()
+
+    def replace_with(self, data_ingestor):
+        """
+        replace_with method to hand over to the DataIngestor that replaces this one on a reload:
+        the lines written at the end of the csv file since the new one read it are appended to
+        it, and the later appends to this one are forwarded to it. The caller swaps the new one
+        in before the lock of this one is released.
+        """
+        with self.lock:
+            data_ingestor.append_tail()
+            self.replaced_by = data_ingestor
+
+    def dataset_snapshot(self):
+        """
+        dataset_snapshot method to get the path of a snapshot of the data at its current version,
+        for the worker processes of the process backend: a worker computes a job against the
+        data of the version of the job, loaded from this snapshot, and not against whatever the
+        csv file holds by then. The snapshot is written on the first call for a version, and
+        deleted when a newer version is saved or the DataIngestor is garbage collected. Returns
+        None if the snapshots are disabled or the snapshot cannot be written.
+        """
+        with self.lock:
+            if self.saved_version is not None and self.saved_version[0] == self.version:
+                return self.saved_version[1]
+
+            if self.saved_version is not None:
+                self.saved_version[2]()
+                self.saved_version = None
+
+            # Unique between the servers sharing the snapshot directory and between the datasets
+            # of this one
+            name = f"{os.getpid()}-{id(self.versions)}-{self.version}"
+            try:
+                path = write_version_snapshot(self.data, name)
+            except OSError as e:
+                print(f"Error writing snapshot of version {self.version}: {e}")
+                return None
+            if path is None:
+                return None
+
+            finalizer = weakref.finalize(self, shutil.rmtree, path, True)
+            self.saved_version = (self.version, path, finalizer)
+            return path
+
+    @classmethod
+    def check_request(cls, req_data, request_type):
+        """
+        check_request method to check that a request has the fields its request type uses: a
+        question and, for the STATE_REQUEST_TYPES, a state, both strings. Raises ValueError if it
+        does not.
+        """
+        if not isinstance(req_data, dict) or not isinstance(req_data.get('question'), str):
+            raise ValueError('Expected a question')
+        if request_type in cls.STATE_REQUEST_TYPES and not isinstance(req_data.get('state'), str):
+            raise ValueError('Expected a state')
+
+    def cache_key(self, req_data, request_type):
+        """
+        cache_key method to get the result cache key of a request. Only the fields used by the
+        request type are part of the key, so requests that differ in other fields share a result.
+        """
+        state = req_data['state'] if request_type in self.STATE_REQUEST_TYPES else None
+        return (self.version, request_type, req_data['question'], state)
+
+    def cached_result(self, req_data, request_type):
+        """
+        cached_result method to get the cached result of a request, None if it is not cached.
+        """
+        return self.result_cache.peek(self.cache_key(req_data, request_type))
+
+    def process_question(self, req_data, request_type, compute_many=None):
+        """
+        process_question method to process the question based on the request type. The result is
+        taken from the result cache when the same request was already answered, otherwise it is
+        computed by compute_many (compute_questions by default).
+        """
+        key = self.cache_key(req_data, request_type)
+        result = self.result_cache.get(key)
+        if result is not None:
+            return result
+
+        result = (compute_many or self.compute_questions)([(req_data, request_type)])[0]
+        if 'error' not in result:
+            self.result_cache.put(key, result)
+
+        return result
+
+    def process_batch(self, items, compute_many=None):
+        """
+        process_batch method to process a list of {request_type, question, state} items in one
+        go. The items are grouped by question, so all the items of a question are answered one
+        after the other from the same aggregates, and identical items are computed only once.
+        The items that are not cached are computed together, in one call of compute_many
+        (compute_questions by default). The results are returned in the order of the items; an
+        invalid item gets an error result instead of failing the whole batch.
+        """
+        results = [None] * len(items)
+        # Cache key of every valid item
+        keys = [None] * len(items)
+
+        # Group the positions of the valid items by question
+        positions_by_question = {}
+        for position, item in enumerate(items):
+            if not self.valid_batch_item(item):
+                results[position] = {'error': 'Invalid batch item'}
+                continue
+
+            positions_by_question.setdefault(item['question'], []).append(position)
+
+        # key -> result, of the cached items
+        answered = {}
+        # key -> (item, request_type), of the items to compute
+        missing = {}
+        for positions in positions_by_question.values():
+            for position in positions:
+                item = items[position]
+                request_type = item['request_type']
+                if not request_type.endswith('_request'):
+                    request_type += '_request'
+
+                if request_type in self.STATE_REQUEST_TYPES and 'state' not in item:
+                    results[position] = {'error': 'Missing state'}
+                    continue
+
+                key = keys[position] = self.cache_key(item, request_type)
+                if key in answered or key in missing:
+                    continue
+                result = self.result_cache.get(key)
+                if result is not None:
+                    answered[key] = result
+                else:
+                    missing[key] = (item, request_type)
+
+        if missing:
+            computed = (compute_many or self.compute_questions)(list(missing.values()))
+            for key, result in zip(missing, computed):
+                if 'error' not in result:
+                    self.result_cache.put(key, result)
+                answered[key] = result
+
+        for position, key in enumerate(keys):
+            if key is not None:
+                results[position] = answered[key]
+
+        return results
+
+    @staticmethod
+    def valid_batch_item(item):
+        """
+        valid_batch_item method to check that a batch item is a dictionary whose question,
+        request_type and state (if any) are strings.
+        """
+        return (isinstance(item, dict)
+                and isinstance(item.get('question'), str)
+                and isinstance(item.get('request_type'), str)
+                and isinstance(item.get('state', ''), str))
+
+    def compute_questions(self, requests):
+        """
+        compute_questions method to compute the answers of (req_data, request_type) requests.
+        """
+        return [self.compute_question(req_data, request_type)
+                for req_data, request_type in requests]
 
-    def process_question(self, req_data, request_type):
+    def compute_question(self, req_data, request_type):
         """
-        process_question method to process the question based on the request type.
+        compute_question method to compute the answer of the question based on the request type.
+        """
+        # Appended rows must not change the aggregates in the middle of a computation
+        with self.lock:
+            return self.compute_answer(req_data, request_type)
+
+    def compute_answer(self, req_data, request_type):
+        """
+        compute_answer method to dispatch the request type to the method that answers it.
         """
         question = req_data['question']
 
@@ -91,50 +440,24 @@ class DataIngestor:
 
         return {'error': 'Invalid request type'}
 
+    def state_means(self, question: str):
+        """
+        state_means method to get the mean of every state for a question.
+        """
+        return {state: total[0] / total[1]
+                for state, total in self.cube.question_state_totals(question).items()}
+
     def states_mean_request(self, question: str):
         """
         states_mean_request method to get the mean of all states for a question.
         """
-        # Get all data corresponding to the question
-        filtered_data = [d for d in self.data if d['Question'] == question and
-                         d['YearStart'] >= '2011' and d['YearEnd'] <= '2022']
-
-        # Get all states
-        states = list(set(d['LocationDesc'] for d in filtered_data))
-
-        # Get the mean for each state
-        mean_by_state = {}
-
-        # Go through all the data
-        for d in filtered_data:
-            state = d['LocationDesc']
-            mean = float(d['Data_Value'])
-
-            # Add state to the dictionary if it doesn't exist
-            if state not in mean_by_state:
-                mean_by_state[state] = { 'mean': 0, 'divisor': 0}
-
-            # Add the value to the total and increment the count
-            mean_by_state[state]['mean'] += mean
-            mean_by_state[state]['divisor'] += 1
-
-        # Calculate the mean for each state
-        for state in states:
-            mean_by_state[state] = mean_by_state[state]['mean'] / mean_by_state[state]['divisor']
-
-        return mean_by_state
+        return self.state_means(question)
 
     def state_mean_request(self, question: str, state: str):
         """
         state_mean_request method to get the mean of a state for a question.
         """
-        filtered_data = [d for d in self.data if d['Question'] == question
-                         and d['LocationDesc'] == state and d['YearStart'] >= '2011'
-                         and d['YearEnd'] <= '2022']
-
-        # Calculate the mean for the state
-        values_sum = sum(float(d['Data_Value']) for d in filtered_data)
-        count = len(filtered_data)
+        values_sum, count = self.cube.question_state_total(question, state)
 
         # Calculate the mean
         mean = values_sum / count if count else 0
@@ -145,26 +468,7 @@ class DataIngestor:
         """
         best5_request method to get the best 5 states for a question.
         """
-        filtered_data = [d for d in self.data if d['Question'] == question and
-                         d['YearStart'] >= '2011' and d['YearEnd'] <= '2022']
-
-        # Combine aggregation and mean calculation for each state
-        state_means = {}
-        for entry in filtered_data:
-            state = entry['LocationDesc']
-            value = float(entry['Data_Value'])
-
-            # Add state to the dictionary if it doesn't exist
-            if state not in state_means:
-                state_means[state] = {'mean': 0, 'divisor': 0}
-
-            # Add the value to the total and increment the count
-            state_means[state]['mean'] += value
-            state_means[state]['divisor'] += 1
-
-        # Calculate mean for each state in a more compact form
-        best = {state: aggregates['mean'] / aggregates['divisor']
-                for state, aggregates in state_means.items()}
+        best = self.state_means(question)
 
         # Determine if the best values are the highest or lowest
         min_max = 'min' if question in self.questions_best_is_min else 'max'
@@ -184,26 +488,7 @@ class DataIngestor:
         """
         worst5_request method to get the worst 5 states for a question.
         """
-        filtered_data = [d for d in self.data if d['Question'] == question
-                         and d['YearStart'] >= '2011' and d['YearEnd'] <= '2022']
-
-        # Combine aggregation and mean calculation for each state
-        state_means = {}
-        for d in filtered_data:
-            state = d['LocationDesc']
-            value = float(d['Data_Value'])
-
-            # Add state to the dictionary if it doesn't exist
-            if state not in state_means:
-                state_means[state] = {'mean': 0, 'divisor': 0}
-
-            # Add the value to the total and increment the count
-            state_means[state]['mean'] += value
-            state_means[state]['divisor'] += 1
-
-        # Calculate mean for each state in a more compact form
-        worst = {state: aggregates['mean'] / aggregates['divisor']
-                 for state, aggregates in state_means.items()}
+        worst = self.state_means(question)
 
         # Determine if the best values are the highest or lowest
         min_max = 'min' if question in self.questions_best_is_min else 'max'
@@ -219,74 +504,40 @@ class DataIngestor:
 
         return worst5_states
 
-    def global_mean_request(self, question: str):
+    def global_mean(self, question: str):
         """
-        global_mean_request method to get the global mean for a question.
+        global_mean method to get the mean of all the values of a question.
         """
-        filtered_data = [d for d in self.data if d['Question'] == question
-                         and d['YearStart'] >= '2011' and d['YearEnd'] <= '2022']
+        values_sum, count = self.cube.question_total(question)
 
-        # Get the global mean
-        mean = sum(float(d['Data_Value']) for d in filtered_data) \
-            / len(filtered_data) if filtered_data else 0
+        return values_sum / count if count else 0
 
-        return {'global_mean': mean}
+    def global_mean_request(self, question: str):
+        """
+        global_mean_request method to get the global mean for a question.
+        """
+        return {'global_mean': self.global_mean(question)}
 
     def diff_from_mean_request(self, question: str):
         """
         diff_from_mean_request method to get the difference of each state from the global mean.
         """
-        filtered_data = [d for d in self.data if d['Question'] == question
-                         and d['YearStart'] >= '2011' and d['YearEnd'] <= '2022']
-
-        # Calculate the global mean
-        global_mean = sum(float(d['Data_Value']) for d in filtered_data) \
-            / len(filtered_data) if filtered_data else 0
-
-        # Calculate mean for each state
-        state_means = {}
-        for d in filtered_data:
-            state = d['LocationDesc']
-            value = float(d['Data_Value'])
-
-            # Add state to the dictionary if it doesn't exist
-            if state not in state_means:
-                state_means[state] = {'mean': 0, 'divisor': 0}
-
-            # Add the value to the total and increment the count
-            state_means[state]['mean'] += value
-            state_means[state]['divisor'] += 1
+        global_mean = self.global_mean(question)
 
-        # Calculate mean for each state and compute the difference from the global mean
-        diff_from_global_mean = {}
-        for state, data in state_means.items():
-            state_mean = data['mean'] / data['divisor']
-            diff_from_global_mean[state] = global_mean - state_mean
-
-        return diff_from_global_mean
+        # Compute the difference of each state mean from the global mean
+        return {state: global_mean - state_mean
+                for state, state_mean in self.state_means(question).items()}
 
     def state_diff_from_mean_request(self, question: str, state: str):
         """
         state_diff_from_mean_request method to get the difference between the state mean and the
         global mean for a question.
         """
-        filtered_data = [d for d in self.data if d['Question'] == question
-                         and d['YearStart'] >= '2011' and d['YearEnd'] <= '2022']
-
-        # Calculate the global mean
-        value_sum = sum(float(d['Data_Value']) for d in filtered_data)
-        count = len(filtered_data)
-
-        global_mean = value_sum / count if count else 0
-
-        # Filter data further for the specified state
-        state_filtered_data = [d for d in filtered_data if d['LocationDesc'] == state]
+        global_mean = self.global_mean(question)
 
         # Calculate the mean for the specified state
-        value_sum = sum(float(d['Data_Value']) for d in state_filtered_data)
-        count = len(state_filtered_data)
-
-        state_mean = value_sum / count if count else 0
+        values_sum, count = self.cube.question_state_total(question, state)
+        state_mean = values_sum / count if count else 0
 
         # Calculate the difference from the global mean
         diff = global_mean - state_mean
@@ -299,63 +550,15 @@ class DataIngestor:
         mean_by_category_request method to get the mean of each category and segment for a
         question.
         """
-        filtered_data = [d for d in self.data if d['Question'] == question
-                         and d['YearStart'] >= '2011' and d['YearEnd'] <= '2022']
-
-        mean_by_category = {}
-
-        for d in filtered_data:
-            state = d['LocationDesc']
-            category = d['StratificationCategory1']
-            category_segment = d['Stratification1']
-
-            # Skip if category or category_segment is empty
-            if category == '' or category_segment == '':
-                continue
-
-            # Add category to the dictionary if it doesn't exist
-            if category not in mean_by_category:
-                mean_by_category[category] = {}
-
-            # Add category segment to the dictionary if it doesn't exist
-            if category_segment not in mean_by_category[category]:
-                mean_by_category[category][category_segment] = {}
-
-            # Initialize the state dictionary if it doesn't exist
-            if state not in mean_by_category[category][category_segment]:
-                mean_by_category[category][category_segment][state] = {'mean': 0, 'divisor': 0}
-
-            # Add the value to the total and increment the count
-            mean_by_category[category][category_segment][state]['mean'] += float(d['Data_Value'])
-            mean_by_category[category][category_segment][state]['divisor'] += 1
-
-        # Prepare a new dictionary to hold the mean values
-        mean_values = {}
-
-        # Calculate the mean for each category, segment, and state, and store in the new dictionary
-        for category, category_segments in mean_by_category.items():
-            for category_segment, states in category_segments.items():
-                for state, data in states.items():
-                    # Initialize the category dictionary if it doesn't exist
-                    if category not in mean_values:
-                        mean_values[category] = {}
-
-                    # Initialize the category_segment dictionary if it doesn't exist
-                    if category_segment not in mean_values[category]:
-                        mean_values[category][category_segment] = {}
-
-                    # Calculate the mean and store it
-                    mean_values[category][category_segment][state] =\
-                        data['mean'] / data['divisor'] if data['divisor'] else 0
-
         # Normalize result to: "('state', 'category', 'category_segment')": mean
         mean_by_category_normalized = {}
 
-        for category, category_segments in mean_values.items():
+        category_totals = self.cube.question_category_totals(question)
+        for category, category_segments in category_totals.items():
             for category_segment, states in category_segments.items():
-                for state, mean in states.items():
+                for state, (values_sum, count) in states.items():
                     key_formatted = f"('{state}', '{category}', '{category_segment}')"
-                    mean_by_category_normalized[key_formatted] = mean
+                    mean_by_category_normalized[key_formatted] = values_sum / count
 
         return mean_by_category_normalized
 
@@ -364,45 +567,13 @@ class DataIngestor:
         state_mean_by_category_request method to get the mean of each category and segment for an
         indicated state.
         """
-        filtered_data = [d for d in self.data if d['Question'] == question
-                         and d['LocationDesc'] == state and d['YearStart'] >= '2011'
-                         and d['YearEnd'] <= '2022']
-
-        mean_by_category = {}
-
-        for d in filtered_data:
-            value = float(d['Data_Value'])
-            category = d['StratificationCategory1']
-            category_segment = d['Stratification1']
-
-            # Skip if category or category_segment is empty
-            if category == '' or category_segment == '':
-                continue
-
-            # Add category to the dictionary if it doesn't exist
-            if category not in mean_by_category:
-                mean_by_category[category] = {}
-
-            # Add category segment to the dictionary if it doesn't exist
-            if category_segment not in mean_by_category[category]:
-                mean_by_category[category][category_segment] = {'mean': 0, 'divisor': 0}
-
-            # Add the value to the total and increment the count
-            mean_by_category[category][category_segment]['mean'] += value
-            mean_by_category[category][category_segment]['divisor'] += 1
-
-        # Prepare a new dictionary to hold the mean values
         mean_values = {}
 
-        # Calculate the mean for each category, segment, and state, and store in the new dictionary
-        for category, category_segments in mean_by_category.items():
-            for category_segment, data in category_segments.items():
-                # Calculate the mean and store it
-                calculated_mean = data['mean'] / data['divisor'] if data['divisor'] else 0
-
+        category_totals = self.cube.question_state_category_totals(question, state)
+        for category, category_segments in category_totals.items():
+            for category_segment, (values_sum, count) in category_segments.items():
                 # Format the result
                 key_formatted = f"('{category}', '{category_segment}')"
-                mean_values[key_formatted] = calculated_mean
+                mean_values[key_formatted] = values_sum / count
 
         return {state : mean_values}
-    
\ No newline at end of file
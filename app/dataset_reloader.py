@@ -0,0 +1,133 @@
+"""
+dataset_reloader.py module contains the DatasetReloader class that reloads the dataset of the
+webserver without downtime.
+"""
+
+from threading import Event, Lock, Thread
+import os
+import time
+
+from app.data_ingestor import DataIngestor
+
+class DatasetReloader:
+    """
+    DatasetReloader class reloads the dataset of a server: a new DataIngestor (columns, aggregates
+    and result cache) is built in a background thread and then swapped in as the data_ingestor
+    attribute of the server, a single atomic assignment. Jobs that were already created keep the
+    DataIngestor they were created with and finish against the old data; new jobs use the new
+    one, and so do the appends from the swap on. Every DataIngestor gets a new version from the
+    counter shared with the one it replaces, which keys the result caches, the coalescing of
+    identical jobs and the dataset of the worker processes.
+
+    In watch mode, the CSV file is checked every watch_interval seconds and reloaded when its
+    size or modification time changed.
+    """
+    def __init__(self, server, watch_interval=0):
+        """
+        Initialize the DatasetReloader of the server whose data_ingestor it replaces.
+        """
+        self.server = server
+        self.watch_interval = watch_interval
+        # Only one reload at a time
+        self.lock = Lock()
+        self.reloading = False
+        self.last_error = None
+        self.reloaded_at = None
+        self.stop_event = Event()
+        self.watcher = None
+
+    @classmethod
+    def from_env(cls, server):
+        """
+        Create the DatasetReloader configured by the DATA_WATCH_INTERVAL environment variable:
+        seconds between two checks of the CSV file (default 0, no watching).
+        """
+        return cls(server, float(os.getenv('DATA_WATCH_INTERVAL', '0')))
+
+    def reload(self):
+        """
+        Start reloading the dataset in the background. Returns False if a reload is already
+        running.
+        """
+        with self.lock:
+            if self.reloading:
+                return False
+            self.reloading = True
+
+        Thread(target=self.run_reload, daemon=True).start()
+        return True
+
+    def run_reload(self):
+        """
+        Build the new DataIngestor and swap it in.
+        """
+        current = self.server.data_ingestor
+        try:
+            data_ingestor = DataIngestor(current.csv_path, current.versions)
+            # The rows appended to the current DataIngestor while the new one was loaded, and
+            # the ones appended to it from now on, go to the new one
+            with current.lock:
+                current.replace_with(data_ingestor)
+                self.server.data_ingestor = data_ingestor
+        except (OSError, ValueError, KeyError, IndexError, StopIteration) as e:
+            # A short CSV line raises IndexError, as in column_store.send_csv_range, and an
+            # empty CSV file (without its header line) StopIteration
+            self.last_error = str(e) or repr(e)
+            print(f"Error reloading {current.csv_path}: {self.last_error}")
+        else:
+            self.last_error = None
+            self.reloaded_at = time.time()
+        finally:
+            with self.lock:
+                self.reloading = False
+
+    def status(self):
+        """
+        Get the version of the dataset in use and the state of the reloads.
+        """
+        return {
+            'version': self.server.data_ingestor.version,
+            'reloading': self.reloading,
+            'reloaded_at': self.reloaded_at,
+            'last_error': self.last_error,
+        }
+
+    def start_watching(self):
+        """
+        Start the thread that reloads the dataset when the CSV file changes, if watch mode is on.
+        """
+        if self.watch_interval <= 0 or self.watcher is not None:
+            return
+
+        self.watcher = Thread(target=self.watch, daemon=True)
+        self.watcher.start()
+
+    def watch(self):
+        """
+        Check the CSV file every watch_interval seconds and reload it when it changed and then
+        stayed the same for one interval.
+        """
+        loaded = previous = self.file_signature()
+        while not self.stop_event.wait(self.watch_interval):
+            signature = self.file_signature()
+            # Wait until the file stops changing, a file being written is not reloaded
+            if (signature is not None and signature != loaded and signature == previous
+                    and self.reload()):
+                loaded = signature
+            previous = signature
+
+    def file_signature(self):
+        """
+        Get the size and modification time of the CSV file, None if it cannot be read.
+        """
+        try:
+            stat = os.stat(self.server.data_ingestor.csv_path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def stop_watching(self):
+        """
+        Stop the watching thread.
+        """
+        self.stop_event.set()
@@ -0,0 +1,187 @@
+"""
+job_registry.py module contains the JobRegistry class that allocates the job_ids and keeps the
+state of the jobs that are running or finished recently.
+"""
+
+from collections import deque
+from itertools import count
+from threading import Lock
+import math
+import os
+import time
+
+# States of a job
+RUNNING = 'running'
+DONE = 'done'
+ERROR = 'error'
+
+class JobShard:
+    """
+    JobShard class keeps the state of the jobs whose job_id falls in the shard, with its own lock.
+    A finished job is forgotten ttl seconds after it finished (ttl 0 means never) or once more
+    than max_jobs jobs of the shard finished after it.
+    """
+    def __init__(self, ttl, max_jobs):
+        """
+        Initialize an empty JobShard with the expiry of its finished jobs.
+        """
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        # job_id -> state, only for the live jobs
+        self.states = {}
+        # (time it finished, job_id) of the finished jobs, oldest first
+        self.finished = deque()
+        # Highest job_id registered, the lower ones of the shard that are not live expired
+        self.last_job_id = 0
+        self.lock = Lock()
+
+    def add(self, job_id):
+        """
+        Register a job as running. Returns the job_ids that expired.
+        """
+        with self.lock:
+            self.states[job_id] = RUNNING
+            self.last_job_id = max(self.last_job_id, job_id)
+            return self.expire(time.monotonic())
+
+    def finish(self, job_id, done):
+        """
+        Mark a job as done, or as failed if done is False. Returns the job_ids that expired.
+        """
+        with self.lock:
+            if job_id not in self.states:
+                return []
+            now = time.monotonic()
+            self.states[job_id] = DONE if done else ERROR
+            self.finished.append((now, job_id))
+            return self.expire(now)
+
+    def expire(self, now):
+        """
+        Forget the finished jobs that expired and return their job_ids. Must hold the lock.
+        """
+        expired = []
+        while self.finished and (len(self.finished) > self.max_jobs
+                                 or self.ttl and now - self.finished[0][0] > self.ttl):
+            _, job_id = self.finished.popleft()
+            del self.states[job_id]
+            expired.append(job_id)
+
+        return expired
+
+    def jobs(self, after, limit):
+        """
+        Get the (job_id, state) of the live jobs with a job_id greater than after, in job_id
+        order, at most limit of them if limit is not 0; and the job_ids that expired.
+        """
+        with self.lock:
+            expired = self.expire(time.monotonic())
+            job_ids = sorted(job_id for job_id in self.states if job_id > after)
+            if limit:
+                job_ids = job_ids[:limit]
+            return [(job_id, self.states[job_id]) for job_id in job_ids], expired
+
+class JobRegistry:
+    """
+    JobRegistry class allocates the job_ids and keeps the state of the jobs: running (queued or
+    executing), done or error. A finished job is forgotten, and its result deleted from the
+    result store, ttl seconds after it finished (ttl 0 means never) or once about max_jobs jobs
+    finished after it, so the registry only holds the live jobs and never grows without bound.
+
+    The job_ids come from an itertools.count, whose next() is atomic, so allocating one takes no
+    lock. The states are split by job_id between num_shards JobShards with a lock each: a
+    submission only locks the shard of its job, and listing the jobs locks one shard at a time.
+    """
+    def __init__(self, ttl=3600, max_jobs=100000, result_store=None, num_shards=16):
+        """
+        Initialize the JobRegistry with the expiry of the finished jobs, the result store their
+        results are deleted from and the number of shards.
+        """
+        self.result_store = result_store
+        self.job_ids = count(1)
+        self.shards = [JobShard(ttl, math.ceil(max_jobs / num_shards))
+                       for _ in range(num_shards)]
+
+    @classmethod
+    def from_env(cls, result_store):
+        """
+        Create the JobRegistry configured by the environment variables:
+        JOB_TTL - seconds a finished job and its result are kept, 0 for no limit (default 3600);
+        JOB_REGISTRY_MAX_JOBS - finished jobs kept at most (default 100000);
+        JOB_REGISTRY_SHARDS - number of shards of the job states (default 16).
+        """
+        return cls(ttl=float(os.getenv('JOB_TTL', '3600')),
+                   max_jobs=int(os.getenv('JOB_REGISTRY_MAX_JOBS', '100000')),
+                   result_store=result_store,
+                   num_shards=max(int(os.getenv('JOB_REGISTRY_SHARDS', '16')), 1))
+
+    def next_job_id(self):
+        """
+        Allocate the job_id of a new job.
+        """
+        return next(self.job_ids)
+
+    def shard(self, job_id):
+        """
+        Get the shard that keeps the state of a job.
+        """
+        return self.shards[job_id % len(self.shards)]
+
+    def add(self, job_id):
+        """
+        Register a job as running.
+        """
+        self.delete_results(self.shard(job_id).add(job_id))
+
+    def finish(self, job_id, done):
+        """
+        Mark a job as done, or as failed if done is False.
+        """
+        self.delete_results(self.shard(job_id).finish(job_id, done))
+
+    def delete_results(self, job_ids):
+        """
+        Delete the results of expired jobs, outside of the locks since the store may do I/O.
+        """
+        if self.result_store is not None:
+            for job_id in job_ids:
+                self.result_store.delete(job_id)
+
+    def state(self, job_id):
+        """
+        Get the state of a job, None if it is not live.
+        """
+        return self.shard(job_id).states.get(job_id)
+
+    def is_done(self, job_id):
+        """
+        Check if a job is done.
+        """
+        return self.state(job_id) == DONE
+
+    def is_expired(self, job_id):
+        """
+        Check if a job was registered but has been forgotten since.
+        """
+        shard = self.shard(job_id)
+        return 0 < job_id <= shard.last_job_id and job_id not in shard.states
+
+    def jobs(self, after=0, limit=0):
+        """
+        Get the (job_id, state) of the live jobs with a job_id greater than after, in job_id
+        order; at most limit of them if limit is not 0.
+        """
+        jobs = []
+        for shard in self.shards:
+            page, expired = shard.jobs(after, limit)
+            self.delete_results(expired)
+            jobs += page
+
+        jobs.sort()
+        return jobs[:limit] if limit else jobs
+
+    def __len__(self):
+        """
+        Return the number of live jobs.
+        """
+        return sum(len(shard.states) for shard in self.shards)
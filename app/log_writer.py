@@ -0,0 +1,213 @@
+"""
+log_writer.py module contains the logging pipeline of the webserver: the records are put on a
+queue by the request threads and written, in batches, by a background LogWriter thread.
+"""
+
+from threading import Thread
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+
+# Attributes of a record passed with extra= that are written in the JSON records
+RECORD_FIELDS = ('job_id', 'request_type', 'client_id', 'status')
+
+class JsonFormatter(logging.Formatter):
+    """
+    JsonFormatter class formats a record as a JSON object on a single line, with the time, level,
+    logger and message of the record and the job fields passed with extra=.
+    """
+    def format(self, record):
+        """
+        Format the record as a JSON line.
+        """
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in RECORD_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+
+        return json.dumps(entry)
+
+class SamplingFilter(logging.Filter):
+    """
+    SamplingFilter class keeps a sample_rate fraction of the info (and debug) records; warnings
+    and errors are always kept. The records of a job are all kept or all dropped, the choice
+    depending only on the job_id.
+    """
+    def __init__(self, sample_rate):
+        """
+        Initialize the SamplingFilter with the fraction of info records kept.
+        """
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record):
+        """
+        Check if a record is kept.
+        """
+        if record.levelno >= logging.WARNING or self.sample_rate >= 1:
+            return True
+
+        job_id = getattr(record, 'job_id', None)
+        if isinstance(job_id, int):
+            # Multiplicative hash, so consecutive job_ids are spread over the sample
+            return (job_id * 2654435761) % 2 ** 32 < self.sample_rate * 2 ** 32
+        return random.random() < self.sample_rate
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    DroppingQueueHandler class puts the records on a bounded queue without ever blocking the
+    caller: when the queue is full the record is dropped and counted.
+    """
+    def __init__(self, log_queue):
+        """
+        Initialize the DroppingQueueHandler with the queue of the LogWriter.
+        """
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        """
+        Put a record on the queue, or drop it if the queue is full.
+        """
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class LogWriter(Thread):
+    """
+    LogWriter class writes the records of a queue to its handlers in a background thread. It
+    takes every record that is waiting, up to batch_size, writes them and flushes the streams
+    once per batch instead of once per record. After a batch that is not full it sleeps for
+    flush_interval seconds, so the records pile up instead of waking the thread one by one.
+    """
+    def __init__(self, log_queue, handlers, batch_size=1024, flush_interval=0.05):
+        """
+        Initialize the LogWriter with the queue it takes the records from and the handlers it
+        writes them to.
+        """
+        super().__init__(daemon=True)
+        self.log_queue = log_queue
+        self.handlers = handlers
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+    def run(self):
+        """
+        Run the LogWriter thread, until it takes None from the queue.
+        """
+        while True:
+            batch = [self.log_queue.get()]
+            while batch[-1] is not None and len(batch) < self.batch_size:
+                try:
+                    batch.append(self.log_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = batch[-1] is None
+            if stop:
+                batch.pop()
+            for handler in self.handlers:
+                write_batch(handler, batch)
+            if stop:
+                return
+            if len(batch) < self.batch_size:
+                time.sleep(self.flush_interval)
+
+    def stop(self):
+        """
+        Write the records that are still queued and stop the thread.
+        """
+        if self.is_alive():
+            # Blocks if the queue is full, the writer is draining it
+            self.log_queue.put(None)
+            self.join()
+
+def write_batch(handler, records):
+    """
+    Write a batch of records with a stream handler (rotating the file when needed) and flush its
+    stream once.
+    """
+    records = [record for record in records
+               if record.levelno >= handler.level and handler.filter(record)]
+    if not records:
+        return
+
+    handler.acquire()
+    try:
+        for record in records:
+            try:
+                if (isinstance(handler, logging.handlers.RotatingFileHandler)
+                        and handler.shouldRollover(record)):
+                    handler.doRollover()
+                elif handler.stream is None:
+                    # A FileHandler opened with delay=True
+                    handler.stream = handler._open()  # pylint: disable=protected-access
+                handler.stream.write(handler.format(record) + handler.terminator)
+            except Exception:  # pylint: disable=broad-except
+                handler.handleError(record)
+        handler.flush()
+    finally:
+        handler.release()
+
+def configure_logging(logger, log_path):
+    """
+    Configure the logging of the webserver, from the environment variables:
+    LOG_MODE - queue (default): the records are written by a LogWriter thread; sync: they are
+    written by the request threads; off: no records below ERROR;
+    LOG_FORMAT - json (default) for one JSON object per line, text for the plain format;
+    LOG_SAMPLE_RATE - fraction of the info records kept (default 1);
+    LOG_QUEUE_SIZE - records queued at most, the next ones are dropped (default 10000);
+    LOG_BATCH_SIZE - records written per flush at most (default 1024);
+    LOG_FLUSH_INTERVAL - seconds the records are left to pile up between two flushes (default
+    0.05).
+    Returns the LogWriter, None if the records are not queued.
+    """
+    mode = os.getenv('LOG_MODE', 'queue')
+
+    # Create a file handler
+    file_handler = logging.handlers.RotatingFileHandler(log_path, maxBytes=1000000,
+                                                        backupCount=5)
+    if os.getenv('LOG_FORMAT', 'json') == 'json':
+        file_handler.setFormatter(JsonFormatter())
+    else:
+        file_handler.setFormatter(
+            logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+    # Drop the sampled out records before they reach any handler
+    logger.addFilter(SamplingFilter(float(os.getenv('LOG_SAMPLE_RATE', '1'))))
+
+    if mode == 'off':
+        logger.setLevel(logging.ERROR)
+        logger.addHandler(file_handler)
+        return None
+
+    if mode == 'sync':
+        logger.addHandler(file_handler)
+        return None
+
+    # The console output of logging.basicConfig moves to the writer thread too
+    console_handler = logging.StreamHandler(sys.stderr)
+    console_handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+    log_queue = queue.Queue(int(os.getenv('LOG_QUEUE_SIZE', '10000')))
+    logger.addHandler(DroppingQueueHandler(log_queue))
+    logger.propagate = False
+
+    writer = LogWriter(log_queue, [file_handler, console_handler],
+                       int(os.getenv('LOG_BATCH_SIZE', '1024')),
+                       float(os.getenv('LOG_FLUSH_INTERVAL', '0.05')))
+    writer.start()
+    return writer
@@ -0,0 +1,192 @@
+"""
+metrics.py module contains the metrics of the webserver: the latency histograms of the jobs and
+the gauges of the thread pool, the caches and the stores, rendered in the Prometheus text format.
+"""
+
+from threading import Lock
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5,
+                   10, float('inf'))
+
+# Phases of a job, and the timestamps they are measured between
+JOB_PHASES = {
+    'queue_wait': ('enqueued', 'dequeued'),
+    'compute': ('compute_started', 'compute_finished'),
+    'persist': ('compute_finished', 'persisted'),
+    'total': ('enqueued', 'persisted'),
+}
+
+class Histogram:
+    """
+    Histogram class counts observations in cumulative buckets, like a Prometheus histogram.
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """
+        Initialize an empty Histogram with the upper bounds of its buckets.
+        """
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        """
+        Add an observation.
+        """
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        """
+        Get the (upper bound, observations up to it) of every bucket.
+        """
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+
+class JobMetrics:
+    """
+    JobMetrics class aggregates the timestamps of the finished tasks into histograms per phase
+    and request type, counts the finished jobs and the time the workers were busy.
+    """
+    def __init__(self):
+        """
+        Initialize empty JobMetrics.
+        """
+        # (phase, request_type) -> Histogram
+        self.durations = {}
+        # (request_type, status) -> number of jobs
+        self.jobs = {}
+        # Seconds the TaskRunner threads spent running tasks
+        self.busy_seconds = 0
+        self.lock = Lock()
+
+    def observe_task(self, task, done, jobs=1):
+        """
+        Record a finished task, that answered jobs jobs (itself and the tasks attached to it).
+        """
+        timestamps = task.timestamps
+        # A task run inline was never queued
+        timestamps.setdefault('enqueued', timestamps.get('compute_started'))
+        timestamps.setdefault('dequeued', timestamps.get('compute_started'))
+
+        with self.lock:
+            status = 'done' if done else 'error'
+            key = (task.request_type, status)
+            self.jobs[key] = self.jobs.get(key, 0) + jobs
+
+            if not done:
+                return
+
+            for phase, (start, end) in JOB_PHASES.items():
+                if timestamps.get(start) is None or timestamps.get(end) is None:
+                    continue
+                histogram = self.durations.get((phase, task.request_type))
+                if histogram is None:
+                    histogram = self.durations[(phase, task.request_type)] = Histogram()
+                histogram.observe(timestamps[end] - timestamps[start])
+
+    def observe_busy(self, seconds):
+        """
+        Record the time a worker spent running a task.
+        """
+        with self.lock:
+            self.busy_seconds += seconds
+
+def format_labels(labels):
+    """
+    Format the labels of a sample, e.g. {request_type="best5_request"}.
+    """
+    if not labels:
+        return ''
+    pairs = ','.join(f'{name}="{value}"' for name, value in labels.items())
+    return f"{{{pairs}}}"
+
+def format_value(value):
+    """
+    Format the value of a sample.
+    """
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def metric(lines, name, metric_type, description, samples):
+    """
+    Add a metric, with its HELP and TYPE lines and its (labels, value) samples, to the lines.
+    """
+    lines.append(f"# HELP {name} {description}")
+    lines.append(f"# TYPE {name} {metric_type}")
+    for labels, value in samples:
+        lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+
+def histogram(lines, name, description, histograms):
+    """
+    Add a histogram metric, with the _bucket, _sum and _count samples of its (labels, Histogram)
+    histograms, to the lines.
+    """
+    lines.append(f"# HELP {name} {description}")
+    lines.append(f"# TYPE {name} histogram")
+    for labels, durations in histograms:
+        for bound, count in durations.cumulative_counts():
+            bucket_labels = {**labels, 'le': format_value(bound)}
+            lines.append(f"{name}_bucket{format_labels(bucket_labels)} {count}")
+        lines.append(f"{name}_sum{format_labels(labels)} {format_value(durations.sum)}")
+        lines.append(f"{name}_count{format_labels(labels)} {durations.count}")
+
+def render_metrics(server):
+    """
+    Render the metrics of the server (its thread pool, admission control, data ingestor and
+    result store) in the Prometheus text format.
+    """
+    thread_pool = server.tasks_runner
+    job_metrics = thread_pool.metrics
+    result_cache = server.data_ingestor.result_cache
+    lines = []
+
+    with job_metrics.lock:
+        histogram(lines, 'le_stats_job_duration_seconds',
+                  'Seconds the jobs spent in a phase: queue_wait, compute, persist or total.',
+                  [({'phase': phase, 'request_type': request_type}, durations)
+                   for (phase, request_type), durations in sorted(job_metrics.durations.items())])
+        metric(lines, 'le_stats_jobs_total', 'counter', 'Finished jobs.',
+               [({'request_type': request_type, 'status': status}, count)
+                for (request_type, status), count in sorted(job_metrics.jobs.items())])
+        metric(lines, 'le_stats_worker_busy_seconds_total', 'counter',
+               'Seconds the workers spent running tasks.', [({}, job_metrics.busy_seconds)])
+
+    metric(lines, 'le_stats_jobs_coalesced_total', 'counter',
+           'Jobs attached to an identical job instead of being queued.',
+           [({}, thread_pool.coalesced_tasks)])
+    metric(lines, 'le_stats_jobs_rejected_total', 'counter',
+           'Job submissions rejected by the admission control.',
+           [({}, server.admission.rejected)])
+    metric(lines, 'le_stats_queue_depth', 'gauge', 'Tasks waiting in the task queue.',
+           [({}, thread_pool.task_queue.qsize())])
+    metric(lines, 'le_stats_live_jobs', 'gauge', 'Jobs running or finished and not expired.',
+           [({}, len(thread_pool.jobs))])
+    metric(lines, 'le_stats_workers', 'gauge', 'TaskRunner threads.',
+           [({}, thread_pool.num_threads)])
+    metric(lines, 'le_stats_workers_busy', 'gauge', 'TaskRunner threads running a task.',
+           [({}, sum(1 for thread in thread_pool.threads if thread.has_task))])
+    metric(lines, 'le_stats_result_cache_hits_total', 'counter',
+           'Requests answered from the result cache of the current dataset.',
+           [({}, result_cache.hits)])
+    metric(lines, 'le_stats_result_cache_misses_total', 'counter',
+           'Requests not found in the result cache of the current dataset.',
+           [({}, result_cache.misses)])
+    metric(lines, 'le_stats_result_cache_entries', 'gauge', 'Results in the result cache.',
+           [({}, len(result_cache))])
+    metric(lines, 'le_stats_result_store_entries', 'gauge', 'Results in the result store.',
+           [({}, len(thread_pool.result_store))])
+    metric(lines, 'le_stats_dataset_version', 'gauge', 'Version of the dataset in use.',
+           [({}, server.data_ingestor.version)])
+    metric(lines, 'le_stats_dataset_rows', 'gauge', 'Rows of the dataset in use.',
+           [({}, len(server.data_ingestor.data))])
+
+    return '\n'.join(lines) + '\n'
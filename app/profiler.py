@@ -0,0 +1,215 @@
+"""
+profiler.py module contains the Profiler class that profiles a sample of the jobs and requests
+of the webserver and aggregates the profiles per request type.
+"""
+
+from threading import Lock, get_ident
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import random
+
+class Profiler:
+    """
+    Profiler class profiles a sample_rate fraction of the calls it runs, with cProfile, and
+    aggregates the profiles per key (a request type or an endpoint). The profiles can be read as
+    pstats data or as collapsed stacks for a flamegraph, rebuilt from the caller-callee times of
+    the profiles.
+
+    With a sample_rate of 0 (the default) a call costs one comparison and nothing is recorded.
+    """
+    def __init__(self, sample_rate=0):
+        """
+        Initialize the Profiler with the fraction of the calls profiled.
+        """
+        self.sample_rate = sample_rate
+        # key -> pstats.Stats merging the profiles of the key
+        self.stats = {}
+        # key -> number of calls profiled
+        self.profiled = {}
+        # Idents of the threads being profiled, a thread is profiled for one call at a time
+        self.active = set()
+        self.lock = Lock()
+
+    @classmethod
+    def from_env(cls):
+        """
+        Create the Profiler configured by the PROFILE_SAMPLE_RATE environment variable: fraction
+        of the jobs and requests profiled (default 0, none).
+        """
+        return cls(float(os.getenv('PROFILE_SAMPLE_RATE', '0')))
+
+    def sampled(self):
+        """
+        Draw if the next call is profiled.
+        """
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def start(self):
+        """
+        Start profiling the calling thread. Returns the cProfile.Profile to pass to stop, None if
+        the thread is already profiled or if the profile cannot be enabled: from Python 3.12 only
+        one profiler can be active in the process at a time, so a call sampled while another one
+        is profiled runs unprofiled.
+        """
+        ident = get_ident()
+        with self.lock:
+            if ident in self.active:
+                return None
+            self.active.add(ident)
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiling tool is already active
+            with self.lock:
+                self.active.discard(ident)
+            return None
+        return profile
+
+    def stop(self, key, profile):
+        """
+        Stop profiling the calling thread and add its profile to the profiles of the key.
+        """
+        try:
+            profile.disable()
+            stats = pstats.Stats(profile)
+        finally:
+            with self.lock:
+                self.active.discard(get_ident())
+
+        with self.lock:
+            if key in self.stats:
+                self.stats[key].add(stats)
+            else:
+                self.stats[key] = stats
+            self.profiled[key] = self.profiled.get(key, 0) + 1
+
+    def run(self, key, function, *args):
+        """
+        Call a function, profiling the call if it is sampled.
+        """
+        if not self.sampled():
+            return function(*args)
+
+        profile = self.start()
+        if profile is None:
+            return function(*args)
+        try:
+            return function(*args)
+        finally:
+            self.stop(key, profile)
+
+    def summary(self):
+        """
+        Get the sample rate and the number of calls profiled per key.
+        """
+        with self.lock:
+            return {'sample_rate': self.sample_rate, 'profiled': dict(self.profiled)}
+
+    def merged_stats(self, key=None, stream=None):
+        """
+        Get the profiles of a key, or of every key if key is None, merged in a pstats.Stats.
+        Returns None if there is no profile.
+        """
+        with self.lock:
+            profiles = [stats for stats_key, stats in self.stats.items()
+                        if key is None or stats_key == key]
+            if not profiles:
+                return None
+            merged = pstats.Stats(stream=stream)
+            merged.add(*profiles)
+
+        return merged
+
+    def pstats_data(self, key=None):
+        """
+        Get the profiles of a key (or of every key) in the format of a .pstats file, to load
+        with pstats.Stats or snakeviz. Returns None if there is no profile.
+        """
+        merged = self.merged_stats(key)
+        return None if merged is None else marshal.dumps(merged.stats)
+
+    def text_report(self, key=None, limit=50):
+        """
+        Get the limit functions with the highest cumulative time in the profiles of a key (or of
+        every key), as printed by pstats. Returns None if there is no profile.
+        """
+        stream = io.StringIO()
+        merged = self.merged_stats(key, stream)
+        if merged is None:
+            return None
+        merged.sort_stats('cumulative').print_stats(limit)
+        return stream.getvalue()
+
+    def collapsed_stacks(self, key=None):
+        """
+        Get the profiles of a key (or of every key) in the collapsed format of flamegraph.pl
+        and speedscope: one "key;frame;...;frame microseconds" line per stack, with the time
+        spent in the last frame of the stack.
+        """
+        with self.lock:
+            keys = [stats_key for stats_key in self.stats if key is None or stats_key == key]
+        stacks = {}
+        for stats_key in keys:
+            merged = self.merged_stats(stats_key)
+            if merged is not None:
+                add_stacks(stacks, stats_key, merged.stats)
+
+        lines = [f"{stack} {round(seconds * 1e6)}" for stack, seconds in stacks.items()
+                 if round(seconds * 1e6) > 0]
+        return '\n'.join(sorted(lines)) + '\n' if lines else ''
+
+    def set_sample_rate(self, sample_rate):
+        """
+        Change the fraction of the calls profiled.
+        """
+        self.sample_rate = sample_rate
+
+    def reset(self):
+        """
+        Drop the profiles.
+        """
+        with self.lock:
+            self.stats = {}
+            self.profiled = {}
+
+def add_stacks(stacks, key, stats):
+    """
+    Add the stacks of a pstats profile to stacks, a dictionary of "key;frame;...;frame" ->
+    seconds. cProfile only keeps the time of every caller-callee pair, so the time of a function
+    is split between its callees in proportion to the time of each pair, from the functions
+    that have no caller down; recursive calls are cut.
+    """
+    # caller -> [(callee, cumulative time of the calls from the caller)]
+    callees = {}
+    for function, (_, _, _, _, callers) in stats.items():
+        for caller, (_, _, _, cumulative) in callers.items():
+            callees.setdefault(caller, []).append((function, cumulative))
+
+    def walk(function, path, seconds):
+        _, _, own, cumulative, _ = stats[function]
+        # Fraction of the calls of the function made along this path
+        share = seconds / cumulative if cumulative else 0
+        stacks[path] = stacks.get(path, 0) + own * share
+        for callee, callee_seconds in callees.get(function, []):
+            label = frame_label(callee)
+            if f";{label};" not in f"{path};" and callee_seconds * share > 0:
+                walk(callee, f"{path};{label}", callee_seconds * share)
+
+    for function, (_, _, _, cumulative, callers) in stats.items():
+        if not any(caller in stats for caller in callers):
+            walk(function, f"{key};{frame_label(function)}", cumulative)
+
+def frame_label(function):
+    """
+    Format a pstats function, a (file, line, name) tuple, as "name (file:line)".
+    """
+    filename, line, name = function
+    if filename == '~':
+        # A built-in function
+        return name
+    return f"{name} ({os.path.basename(filename)}:{line})"
@@ -0,0 +1,70 @@
+"""
+ResultCache class to memoize the results of the requests.
+"""
+
+from collections import OrderedDict
+from threading import Lock
+
+class ResultCache:
+    """
+    class ResultCache to memoize the results of the requests. It holds at most max_entries results
+    and evicts the least recently used one when it is full. A max_entries of 0 disables the cache.
+    """
+    def __init__(self, max_entries: int):
+        """
+        Initialize the ResultCache class with its size bound and empty hit and miss counters.
+        """
+        self.max_entries = max_entries
+        self.results = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        get method to get the cached result of a key, None if it is not cached.
+        """
+        with self.lock:
+            result = self.results.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.results.move_to_end(key)
+            return result
+
+    def peek(self, key):
+        """
+        peek method to get the cached result of a key, None if it is not cached. Unlike get, it
+        does not update the hit and miss counters or the eviction order.
+        """
+        with self.lock:
+            return self.results.get(key)
+
+    def put(self, key, result):
+        """
+        put method to cache the result of a key, evicting the least recently used results if the
+        cache is full.
+        """
+        if self.max_entries <= 0:
+            return
+
+        with self.lock:
+            self.results[key] = result
+            self.results.move_to_end(key)
+            while len(self.results) > self.max_entries:
+                self.results.popitem(last=False)
+
+    def clear(self):
+        """
+        clear method to drop all the cached results.
+        """
+        with self.lock:
+            self.results.clear()
+
+    def __len__(self):
+        """
+        Return the number of cached results.
+        """
+        return len(self.results)
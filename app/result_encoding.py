@@ -0,0 +1,123 @@
+"""
+result_encoding.py module contains the EncodedResult class that keeps the result of a job as
+JSON bytes, encoded once when the job finishes and served as is, compressed or not.
+"""
+
+from hashlib import blake2b
+import gzip
+import json
+import os
+import zlib
+
+from werkzeug.http import parse_accept_header
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Content codings the results can be served with, best first
+ENCODINGS = ('gzip', 'deflate')
+
+# Responses smaller than this are not worth compressing
+COMPRESS_MIN_BYTES = int(os.getenv('RESPONSE_COMPRESS_MIN_BYTES', '1024'))
+COMPRESS_LEVEL = int(os.getenv('RESPONSE_COMPRESS_LEVEL', '6'))
+
+def encode_json(value):
+    """
+    Encode a value as compact JSON bytes with sorted keys. orjson is used when it is installed;
+    its bytes can differ from jsonify's: it writes non-ASCII characters as UTF-8 instead of
+    ASCII escapes, floats in their shortest form (1e-7, not 1e-07) and NaN and infinities as
+    null. The json module fallback writes jsonify's bytes.
+    """
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(value, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+def compress(body, encoding):
+    """
+    Compress a response body with a content coding: gzip or deflate (zlib format).
+    """
+    if encoding == 'gzip':
+        # A fixed mtime, so the same body always compresses to the same bytes
+        return gzip.compress(body, COMPRESS_LEVEL, mtime=0)
+    return zlib.compress(body, COMPRESS_LEVEL)
+
+def sync_document(encoded, job_id):
+    """
+    Get the JSON bytes of the synchronous answer of a done job, {"data": <result>, "job_id":
+    <job_id>, "status": "done"}, from its EncodedResult (None if the result is gone), without
+    decoding the result.
+    """
+    data = b'null' if encoded is None else encoded.body
+    return b'{"data":' + data + f',"job_id":{job_id},"status":"done"}}\n'.encode('utf-8')
+
+class EncodedResult:
+    """
+    EncodedResult class keeps the result of a job as JSON bytes. The response of a done job,
+    {"data": <result>, "status": "done"}, is built from them without decoding the result; it is
+    compressed at most once per content coding and identified by an ETag, so a poll of an
+    unchanged result can be answered with 304.
+    """
+    def __init__(self, body):
+        """
+        Initialize the EncodedResult with the JSON bytes of the result.
+        """
+        self.body = body
+        self.document_body = None
+        self.etag_value = None
+        # content coding -> compressed document
+        self.compressed_documents = {}
+
+    @classmethod
+    def encode(cls, result):
+        """
+        Create the EncodedResult of a result.
+        """
+        return cls(encode_json(result))
+
+    def decode(self):
+        """
+        Decode the result.
+        """
+        return json.loads(self.body)
+
+    def document(self):
+        """
+        Get the JSON bytes of the response of the done job.
+        """
+        if self.document_body is None:
+            self.document_body = b'{"data":' + self.body + b',"status":"done"}\n'
+        return self.document_body
+
+    def etag(self):
+        """
+        Get the ETag of the result, a hash of its JSON bytes.
+        """
+        if self.etag_value is None:
+            self.etag_value = blake2b(self.body, digest_size=16).hexdigest()
+        return self.etag_value
+
+    def compressed_document(self, encoding):
+        """
+        Get the response of the done job compressed with a content coding.
+        """
+        compressed = self.compressed_documents.get(encoding)
+        if compressed is None:
+            compressed = self.compressed_documents[encoding] = compress(self.document(),
+                                                                         encoding)
+        return compressed
+
+def negotiate_encoding(accept_encoding, body_size):
+    """
+    Choose the content coding of a response from the Accept-Encoding header of the request: the
+    first of ENCODINGS the client accepts, None to send it uncompressed.
+    """
+    if body_size < COMPRESS_MIN_BYTES or not accept_encoding:
+        return None
+
+    accepted = parse_accept_header(accept_encoding)
+    for encoding in ENCODINGS:
+        if accepted.quality(encoding) > 0:
+            return encoding
+    return None
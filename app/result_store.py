@@ -0,0 +1,215 @@
+"""
+result_store.py module contains the result stores used to keep the results of the finished jobs
+until they are requested.
+"""
+
+from collections import OrderedDict
+from threading import Lock
+import os
+import time
+
+from app.result_encoding import EncodedResult
+
+class FileResultStore:
+    """
+    FileResultStore class keeps every result as a results/<job_id>.json file, the encoded result
+    that is served.
+    """
+    def __init__(self, result_dir="results"):
+        """
+        Initialize the FileResultStore with the directory where the results are written.
+        """
+        self.result_dir = result_dir
+
+    def result_path(self, job_id):
+        """
+        Get the path of the result file of a job.
+        """
+        return os.path.join(self.result_dir, f"{job_id}.json")
+
+    def put(self, job_id, result):
+        """
+        Save the result of a job.
+        """
+        self.put_encoded(job_id, EncodedResult.encode(result))
+
+    def put_encoded(self, job_id, encoded):
+        """
+        Save the EncodedResult of a job. It is written to a temporary file that is then renamed,
+        so a reader never sees a partially written result.
+        """
+        os.makedirs(self.result_dir, exist_ok=True)
+        result_path = self.result_path(job_id)
+        tmp_path = f"{result_path}.tmp"
+        with open(tmp_path, 'wb') as file:
+            file.write(encoded.body)
+        os.replace(tmp_path, result_path)
+
+    def get(self, job_id):
+        """
+        Get the result of a job, None if there is no result. Raises ValueError if the result file
+        is not valid JSON.
+        """
+        encoded = self.get_encoded(job_id)
+        return None if encoded is None else encoded.decode()
+
+    def get_encoded(self, job_id):
+        """
+        Get the EncodedResult of a job, None if there is no result.
+        """
+        try:
+            with open(self.result_path(job_id), 'rb') as file:
+                return EncodedResult(file.read())
+        except FileNotFoundError:
+            return None
+
+    def contains(self, job_id):
+        """
+        Check if there is a result for a job.
+        """
+        return os.path.exists(self.result_path(job_id))
+
+    def delete(self, job_id):
+        """
+        Delete the result of a job.
+        """
+        try:
+            os.remove(self.result_path(job_id))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        """
+        Delete all the results.
+        """
+        if not os.path.isdir(self.result_dir):
+            return
+        for file in os.listdir(self.result_dir):
+            os.remove(os.path.join(self.result_dir, file))
+
+    def __len__(self):
+        """
+        Return the number of results.
+        """
+        if not os.path.isdir(self.result_dir):
+            return 0
+        return len(os.listdir(self.result_dir))
+
+class MemoryResultStore:
+    """
+    MemoryResultStore class keeps the encoded results in memory. It holds at most max_entries
+    results and evicts the least recently used one when it is full. Results older than ttl
+    seconds expire (ttl 0 means they never expire). If a spill store is given, evicted results
+    are moved to it instead of being dropped.
+    """
+    def __init__(self, max_entries=10000, ttl=0, spill_store=None):
+        """
+        Initialize the MemoryResultStore with its size bound, TTL and optional spill store.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.spill_store = spill_store
+        # job_id -> (EncodedResult, time it was saved), least recently used first
+        self.results = OrderedDict()
+        self.lock = Lock()
+
+    def put(self, job_id, result):
+        """
+        Save the result of a job, evicting the least recently used results if the store is full.
+        """
+        self.put_encoded(job_id, EncodedResult.encode(result))
+
+    def put_encoded(self, job_id, encoded):
+        """
+        Save the EncodedResult of a job, evicting the least recently used results if the store is
+        full. The jobs coalesced on one computation share the same EncodedResult.
+        """
+        evicted = []
+        with self.lock:
+            self.results[job_id] = (encoded, time.monotonic())
+            self.results.move_to_end(job_id)
+            while len(self.results) > self.max_entries:
+                evicted.append(self.results.popitem(last=False))
+
+        # Spill outside of the lock, the file store does I/O
+        if self.spill_store is not None:
+            for evicted_job_id, (evicted_result, _) in evicted:
+                self.spill_store.put_encoded(evicted_job_id, evicted_result)
+
+    def get(self, job_id):
+        """
+        Get the result of a job, None if there is no result or it expired.
+        """
+        encoded = self.get_encoded(job_id)
+        return None if encoded is None else encoded.decode()
+
+    def get_encoded(self, job_id):
+        """
+        Get the EncodedResult of a job, None if there is no result or it expired.
+        """
+        with self.lock:
+            entry = self.results.get(job_id)
+            if entry is not None:
+                encoded, saved_at = entry
+                if self.ttl and time.monotonic() - saved_at > self.ttl:
+                    del self.results[job_id]
+                    return None
+                self.results.move_to_end(job_id)
+                return encoded
+
+        if self.spill_store is not None:
+            return self.spill_store.get_encoded(job_id)
+        return None
+
+    def contains(self, job_id):
+        """
+        Check if there is a result for a job.
+        """
+        with self.lock:
+            entry = self.results.get(job_id)
+            if entry is not None:
+                return not self.ttl or time.monotonic() - entry[1] <= self.ttl
+
+        return self.spill_store is not None and self.spill_store.contains(job_id)
+
+    def delete(self, job_id):
+        """
+        Delete the result of a job.
+        """
+        with self.lock:
+            self.results.pop(job_id, None)
+        if self.spill_store is not None:
+            self.spill_store.delete(job_id)
+
+    def clear(self):
+        """
+        Delete all the results.
+        """
+        with self.lock:
+            self.results.clear()
+        if self.spill_store is not None:
+            self.spill_store.clear()
+
+    def __len__(self):
+        """
+        Return the number of results kept in memory.
+        """
+        return len(self.results)
+
+def create_result_store():
+    """
+    Create the result store configured by the environment variables:
+    RESULT_STORE - 'memory' (default) or 'file';
+    RESULT_STORE_MAX_ENTRIES - results kept in memory (default 10000);
+    RESULT_STORE_TTL - seconds a result is kept in memory, 0 for no limit (default 0);
+    RESULT_STORE_SPILL_DIR - directory evicted results are spilled to (default: not spilled).
+    """
+    if os.getenv('RESULT_STORE', 'memory') == 'file':
+        return FileResultStore()
+
+    spill_dir = os.getenv('RESULT_STORE_SPILL_DIR', '')
+    return MemoryResultStore(
+        max_entries=int(os.getenv('RESULT_STORE_MAX_ENTRIES', '10000')),
+        ttl=float(os.getenv('RESULT_STORE_TTL', '0')),
+        spill_store=FileResultStore(spill_dir) if spill_dir else None,
+    )
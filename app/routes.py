@@ -1,12 +1,34 @@
 """
 routes.py is a module that defines the endpoints for the webserver.
 """
-import os
 import json
+import time
 
-from flask import request, jsonify
+from flask import Response, g, request, jsonify, stream_with_context
 from app import webserver
-from app.task_runner import Task
+from app.metrics import render_metrics
+from app.result_encoding import compress, negotiate_encoding, sync_document
+from app.task_queue import parse_priority
+from app.task_runner import BatchTask, Task
+
+@webserver.before_request
+def start_profile():
+    """
+    start_profile method starts profiling a request if it is in the sample of the profiler.
+    """
+    profiler = webserver.tasks_runner.profiler
+    if profiler.sampled():
+        g.profile_key = f"request:{request.endpoint}"
+        g.profile = profiler.start()
+
+@webserver.teardown_request
+def stop_profile(_error):
+    """
+    stop_profile method stops profiling a request that was profiled.
+    """
+    profile = g.pop('profile', None)
+    if profile is not None:
+        webserver.tasks_runner.profiler.stop(g.profile_key, profile)
 
 # Example endpoint definition
 @webserver.route('/api/post_endpoint', methods=['POST'])
@@ -38,85 +60,191 @@ def post_endpoint():
 @webserver.route('/api/get_results/<job_id>', methods=['GET'])
 def get_response(job_id):
     """
-    get_response is a GET endpoint that returns the result of a given job_id.
+    get_response is a GET endpoint that returns the result of a given job_id. With the wait query
+    parameter, the request blocks until the job is done or for at most that many seconds (capped
+    by webserver.long_poll_max_wait) instead of answering 'running' right away. A job that
+    failed is answered with an error.
     """
-    # Log the request
-    webserver.logger.info("Received request for job_id: {job_id}")
-
     # Check if job_id is convertible to an integer
     try:
         job_id = int(job_id)
     except ValueError:
         return jsonify({'status': 'error', 'message': 'Invalid job_id'}), 400
 
-    # Check if the result file exists
-    result_path = f"results/{job_id}.json"
-    if (os.path.exists(result_path)
-        and job_id in webserver.tasks_runner.task_done
-        and webserver.tasks_runner.task_done[job_id]):
-        # Return the result if it exists
-        with open(result_path, "r", encoding='utf-8') as f:
-            try:
-                result = json.load(f)
-            except json.JSONDecodeError:
-                # Log the error
-                webserver.logger.error("Invalid JSON in result file: {result_path}")
-                return jsonify({'status': 'error', 'message': 'Invalid JSON in result file'}), 500
-            # Log the successful response
-            webserver.logger.info("Returning result for job_id: {job_id}")
-            return jsonify({
-                'status': 'done',
-                'data': result
-            })
-    else:
-        # Log the response
-        webserver.logger.info("Job_id: {job_id} is still running")
+    # Log the request
+    log_extra = {'job_id': job_id}
+    webserver.logger.info("Received request for job_id: %s", job_id, extra=log_extra)
 
-        return jsonify({'status': 'running'})
+    # Check if wait is a number of seconds
+    try:
+        wait = min(float(request.args.get('wait', 0)), webserver.long_poll_max_wait)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Invalid wait'}), 400
+
+    # Long poll: block until the job is done or the wait is over
+    if wait > 0:
+        webserver.tasks_runner.wait_for_task(job_id, wait)
+
+    # Check if the job expired
+    if webserver.tasks_runner.jobs.is_expired(job_id):
+        # Log the error
+        webserver.logger.error("Job_id: %s expired", job_id, extra=log_extra)
+        return jsonify({'status': 'error', 'message': 'Result expired'}), 404
+
+    # Check if the job failed
+    status = webserver.tasks_runner.job_status(job_id)
+    if status == 'error':
+        # Log the error
+        webserver.logger.error("Job_id: %s failed", job_id, extra=log_extra)
+        return jsonify({'status': 'error', 'message': 'Job failed'}), 500
+
+    # Check if the job is done
+    if status == 'done':
+        # Return the result if it exists, as it was encoded when the job finished
+        encoded = webserver.tasks_runner.result_store.get_encoded(job_id)
+        if encoded is None:
+            # Log the error
+            webserver.logger.error("Result of job_id: %s expired", job_id, extra=log_extra)
+            return jsonify({'status': 'error', 'message': 'Result expired'}), 404
+
+        # Log the successful response
+        webserver.logger.info("Returning result for job_id: %s", job_id, extra=log_extra)
+        return result_response(encoded)
 
-@webserver.route('/api/states_mean', methods=['POST'])
-def states_mean_request():
+    # Log the response
+    webserver.logger.info("Job_id: %s is still running", job_id, extra=log_extra)
+
+    return jsonify({'status': 'running'})
+
+def result_response(encoded):
     """
-    states_mean_request is a POST endpoint that receives JSON data in the request body
-    and returns a job_id that can be used to check the status of the job.
+    result_response method builds the response of a done job from its EncodedResult, without
+    decoding it: 304 if the If-None-Match header has its ETag, otherwise its JSON, compressed
+    with the best content coding of the Accept-Encoding header.
+    """
+    etag = encoded.etag()
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        body = encoded.document()
+        encoding = negotiate_encoding(request.headers.get('Accept-Encoding'), len(body))
+        if encoding is not None:
+            body = encoded.compressed_document(encoding)
+        response = Response(body, mimetype='application/json')
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+
+    response.set_etag(etag, weak=True)
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+def json_response(body):
+    """
+    json_response method builds the response of JSON bytes, compressed with the best content
+    coding of the Accept-Encoding header.
+    """
+    encoding = negotiate_encoding(request.headers.get('Accept-Encoding'), len(body))
+    response = Response(body if encoding is None else compress(body, encoding),
+                        mimetype='application/json')
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+@webserver.route('/api/stream_results', methods=['GET'])
+def stream_results():
+    """
+    stream_results is a GET endpoint that streams, as server-sent events, the results of the
+    comma-separated job_ids query parameter as the jobs finish. The stream ends with an 'end'
+    event once every job is reported or after the timeout query parameter (in seconds, capped by
+    webserver.long_poll_max_wait).
     """
     # Log the request
-    webserver.logger.info("Received states_mean request")
+    webserver.logger.info("Received request for result stream")
 
-    # Get request data
-    data = request.json
+    # Check if job_ids and timeout are valid
+    try:
+        job_ids = [int(job_id) for job_id in request.args.get('job_ids', '').split(',') if job_id]
+        timeout = min(float(request.args.get('timeout', webserver.long_poll_max_wait)),
+                      webserver.long_poll_max_wait)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Invalid job_ids or timeout'}), 400
 
-    # Check if server is in drain mode
-    if webserver.tasks_runner.shutdown_event.is_set():
-        # Log the response
-        webserver.logger.info("Server is shutting down.")
-        return jsonify({"status": "Server is shutting down."}), 503
+    thread_pool = webserver.tasks_runner
 
-    # Register job. Don't wait for task to finish
-    # Increment job_id counter
-    with webserver.lock:
-        job_id = webserver.job_counter
-        webserver.job_counter += 1
+    def events():
+        pending = set(job_ids)
+        deadline = time.monotonic() + timeout
 
-    task = Task(job_id, data, webserver.data_ingestor, 'states_mean_request')
+        while pending:
+            for job_id in sorted(pending):
+                status = thread_pool.job_status(job_id)
+                if status == 'running':
+                    continue
 
-    # Return associated job_id
-    webserver.tasks_runner.add_task(task)
+                pending.discard(job_id)
+                if status == 'done':
+                    # Splice the encoded result instead of decoding it
+                    encoded = thread_pool.result_store.get_encoded(job_id)
+                    data = 'null' if encoded is None else encoded.body.decode('utf-8')
+                    yield f'data: {{"job_id": {job_id}, "status": "done", "data": {data}}}\n\n'
+                    continue
 
-    # Log the response
-    webserver.logger.info("Job_id: {job_id} is running")
+                event = {'job_id': job_id, 'status': 'error',
+                         'message': 'Invalid job_id' if status is None else 'Job failed'}
+                yield f"data: {json.dumps(event)}\n\n"
 
-    return jsonify({"job_id": job_id})
+            remaining = deadline - time.monotonic()
+            if not pending or remaining <= 0:
+                break
 
-@webserver.route('/api/state_mean', methods=['POST'])
-def state_mean_request():
+            # Keep the connection alive while waiting for the next job to finish
+            if not thread_pool.wait_for_any(pending, min(remaining, 15)):
+                yield ": keepalive\n\n"
+
+        yield f"event: end\ndata: {json.dumps({'pending': sorted(pending)})}\n\n"
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
+
+def sync_requested():
     """
-    state_mean_request is a POST endpoint that receives JSON data in the request body
-    and returns a job_id that can be used to check the status of the job.
+    sync_requested method checks if the client asked for the result in the same response, with
+    the X-Sync: 1 header or the sync=1 query parameter.
     """
-    # Log the request
-    webserver.logger.info("Received state_mean request")
+    return request.headers.get('X-Sync') == '1' or request.args.get('sync') == '1'
+
+def request_client_id():
+    """
+    request_client_id method identifies the client of a request, for fair scheduling: the
+    X-Client-Id header if there is one, the remote address otherwise.
+    """
+    return request.headers.get('X-Client-Id') or request.remote_addr or ''
 
+def next_job_id():
+    """
+    next_job_id method allocates the job_id of a new job, without taking a lock.
+    """
+    return webserver.tasks_runner.jobs.next_job_id()
+
+def create_task(job_id, data, request_type, client_id='', priority=0):
+    """
+    create_task method creates the task that answers a job of the given request type.
+    """
+    if request_type == 'batch_request':
+        return BatchTask(job_id, data, webserver.data_ingestor, client_id, priority)
+    return Task(job_id, data, webserver.data_ingestor, request_type, client_id, priority)
+
+def submit_job(request_type):
+    """
+    submit_job method registers a job of the given request type for the JSON data in the request
+    body and returns its job_id, or 400 if the data lacks the fields of the request type. If
+    the client asked for a synchronous answer, the result is returned in the same response when
+    it is ready within the sync budget. The job is scheduled with the priority of the X-Priority
+    header (0 to 9, 0 by default) and fairly with the jobs of the other clients. Submissions over
+    the queue depth limit or the rate limit of the client address are rejected by
+    webserver.admission with a Retry-After header.
+    """
     # Get request data
     data = request.json
 
@@ -126,89 +254,109 @@ def state_mean_request():
         webserver.logger.info("Server is shutting down.")
         return jsonify({"status": "Server is shutting down."}), 503
 
+    # Check that the request has the fields of its request type, a batch checks every item
+    if request_type != 'batch_request':
+        try:
+            webserver.data_ingestor.check_request(data, request_type)
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    # Reject the job if the server is overloaded or the client address is over its rate limit
+    client_id = request_client_id()
+    rejection = webserver.admission.admit(request.remote_addr or '')
+    if rejection is not None:
+        status_code, retry_after, message = rejection
+        # Log the response
+        webserver.logger.info(message, extra={'request_type': request_type,
+                                              'client_id': client_id, 'status': status_code})
+        return (jsonify({"status": message, "retry_after": retry_after}), status_code,
+                {'Retry-After': str(retry_after)})
+
     # Register job. Don't wait for task to finish
-    # Increment job_id counter
-    with webserver.lock:
-        job_id = webserver.job_counter
-        webserver.job_counter += 1
+    job_id = next_job_id()
+    task = create_task(job_id, data, request_type, client_id,
+                       parse_priority(request.headers.get('X-Priority')))
 
-    task = Task(job_id, data, webserver.data_ingestor, 'state_mean_request')
+    if sync_requested():
+        return run_sync(task)
 
     # Return associated job_id
     webserver.tasks_runner.add_task(task)
 
     # Log the response
-    webserver.logger.info("Job_id: {job_id} is running")
+    webserver.logger.info("Job_id: %s is running", job_id,
+                          extra={'job_id': job_id, 'request_type': request_type})
 
     return jsonify({"job_id": job_id})
 
-@webserver.route('/api/best5', methods=['POST'])
-def best5_request():
+def run_sync(task):
     """
-    best5_request is a POST endpoint that receives JSON data in the request body
-    and returns a job_id that can be used to check the status of the job.
+    run_sync method answers a job in the same response. A cached result is computed inline, any
+    other job is queued and waited for up to webserver.sync_budget seconds. If the job is not done
+    by then, only its job_id is returned and the client polls for the result as usual.
     """
-    # Log the request
-    webserver.logger.info("Received best5 request")
-
-    # Get request data
-    data = request.json
+    thread_pool = webserver.tasks_runner
+    log_extra = {'job_id': task.job_id, 'request_type': task.request_type}
 
-    # Check if server is in drain mode
-    if webserver.tasks_runner.shutdown_event.is_set():
+    if task.is_cached():
+        thread_pool.run_task(task)
+    else:
+        thread_pool.add_task(task)
+    # A cached job is done already, unless it was attached to an identical running job
+    if not thread_pool.wait_for_task(task.job_id, webserver.sync_budget):
         # Log the response
-        webserver.logger.info("Server is shutting down.")
-        return jsonify({"status": "Server is shutting down."}), 503
-
-    # Register job. Don't wait for task to finish
-    # Increment job_id counter
-    with webserver.lock:
-        job_id = webserver.job_counter
-        webserver.job_counter += 1
-
-    task = Task(job_id, data, webserver.data_ingestor, 'best5_request')
-
-    # Return associated job_id
-    webserver.tasks_runner.add_task(task)
+        webserver.logger.info("Job_id: %s is running", task.job_id, extra=log_extra)
+        return jsonify({"job_id": task.job_id})
 
     # Log the response
-    webserver.logger.info("Job_id: {job_id} is running")
+    webserver.logger.info("Returning result for job_id: %s", task.job_id, extra=log_extra)
 
-    return jsonify({"job_id": job_id})
+    return json_response(sync_document(thread_pool.result_store.get_encoded(task.job_id),
+                                       task.job_id))
 
-@webserver.route('/api/worst5', methods=['POST'])
-def worst5_request():
+@webserver.route('/api/states_mean', methods=['POST'])
+def states_mean_request():
     """
-    worst5_request is a POST endpoint that receives JSON data in the request body
+    states_mean_request is a POST endpoint that receives JSON data in the request body
     and returns a job_id that can be used to check the status of the job.
     """
     # Log the request
-    webserver.logger.info("Received worst5 request")
+    webserver.logger.info("Received states_mean request")
 
-    # Get request data
-    data = request.json
+    return submit_job('states_mean_request')
 
-    # Check if server is in drain mode
-    if webserver.tasks_runner.shutdown_event.is_set():
-        # Log the response
-        webserver.logger.info("Server is shutting down.")
-        return jsonify({"status": "Server is shutting down."}), 503
+@webserver.route('/api/state_mean', methods=['POST'])
+def state_mean_request():
+    """
+    state_mean_request is a POST endpoint that receives JSON data in the request body
+    and returns a job_id that can be used to check the status of the job.
+    """
+    # Log the request
+    webserver.logger.info("Received state_mean request")
 
-    # Register job. Don't wait for task to finish
-    # Increment job_id counter
-    with webserver.lock:
-        job_id = webserver.job_counter
-        webserver.job_counter += 1
+    return submit_job('state_mean_request')
 
-    task = Task(job_id, data, webserver.data_ingestor, 'worst5_request')
+@webserver.route('/api/best5', methods=['POST'])
+def best5_request():
+    """
+    best5_request is a POST endpoint that receives JSON data in the request body
+    and returns a job_id that can be used to check the status of the job.
+    """
+    # Log the request
+    webserver.logger.info("Received best5 request")
 
-    # Return associated job_id
-    webserver.tasks_runner.add_task(task)
+    return submit_job('best5_request')
 
-    # Log the response
-    webserver.logger.info("Job_id: {job_id} is running")
+@webserver.route('/api/worst5', methods=['POST'])
+def worst5_request():
+    """
+    worst5_request is a POST endpoint that receives JSON data in the request body
+    and returns a job_id that can be used to check the status of the job.
+    """
+    # Log the request
+    webserver.logger.info("Received worst5 request")
 
-    return jsonify({"job_id": job_id})
+    return submit_job('worst5_request')
 
 @webserver.route('/api/global_mean', methods=['POST'])
 def global_mean_request():
@@ -219,28 +367,7 @@ def global_mean_request():
     # Log the request
     webserver.logger.info("Received global_mean request")
 
-    # Get request data
-    data = request.json
-
-    # Check if server is in drain mode
-    if webserver.tasks_runner.shutdown_event.is_set():
-        return jsonify({"status": "Server is shutting down."}), 503
-
-    # Register job. Don't wait for task to finish
-    # Increment job_id counter
-    with webserver.lock:
-        job_id = webserver.job_counter
-        webserver.job_counter += 1
-
-    task = Task(job_id, data, webserver.data_ingestor, 'global_mean_request')
-
-    # Return associated job_id
-    webserver.tasks_runner.add_task(task)
-
-    # Log the response
-    webserver.logger.info("Job_id: {job_id} is running")
-
-    return jsonify({"job_id": job_id})
+    return submit_job('global_mean_request')
 
 @webserver.route('/api/diff_from_mean', methods=['POST'])
 def diff_from_mean_request():
@@ -251,28 +378,7 @@ def diff_from_mean_request():
     # Log the request
     webserver.logger.info("Received diff_from_mean request")
 
-    # Get request data
-    data = request.json
-
-    # Check if server is in drain mode
-    if webserver.tasks_runner.shutdown_event.is_set():
-        return jsonify({"status": "Server is shutting down."}), 503
-
-    # Register job. Don't wait for task to finish
-    # Increment job_id counter
-    with webserver.lock:
-        job_id = webserver.job_counter
-        webserver.job_counter += 1
-
-    task = Task(job_id, data, webserver.data_ingestor, 'diff_from_mean_request')
-
-    # Return associated job_id
-    webserver.tasks_runner.add_task(task)
-
-    # Log the response
-    webserver.logger.info("Job_id: {job_id} is running")
-
-    return jsonify({"job_id": job_id})
+    return submit_job('diff_from_mean_request')
 
 @webserver.route('/api/state_diff_from_mean', methods=['POST'])
 def state_diff_from_mean_request():
@@ -283,30 +389,7 @@ def state_diff_from_mean_request():
     # Log the request
     webserver.logger.info("Received state_diff_from_mean request")
 
-    # Get request data
-    data = request.json
-
-    # Check if server is in drain mode
-    if webserver.tasks_runner.shutdown_event.is_set():
-        # Log the response
-        webserver.logger.info("Server is shutting down.")
-        return jsonify({"status": "Server is shutting down."}), 503
-
-    # Register job. Don't wait for task to finish
-    # Increment job_id counter
-    with webserver.lock:
-        job_id = webserver.job_counter
-        webserver.job_counter += 1
-
-    task = Task(job_id, data, webserver.data_ingestor, 'state_diff_from_mean_request')
-
-    # Return associated job_id
-    webserver.tasks_runner.add_task(task)
-
-    # Log the response
-    webserver.logger.info("Job_id: {job_id} is running")
-
-    return jsonify({"job_id": job_id})
+    return submit_job('state_diff_from_mean_request')
 
 @webserver.route('/api/mean_by_category', methods=['POST'])
 def mean_by_category_request():
@@ -317,30 +400,7 @@ def mean_by_category_request():
     # Log the request
     webserver.logger.info("Received mean_by_category request")
 
-    # Get request data
-    data = request.json
-
-    # Check if server is in drain mode
-    if webserver.tasks_runner.shutdown_event.is_set():
-        # Log the response
-        webserver.logger.info("Server is shutting down.")
-        return jsonify({"status": "Server is shutting down."}), 503
-
-    # Register job. Don't wait for task to finish
-    # Increment job_id counter
-    with webserver.lock:
-        job_id = webserver.job_counter
-        webserver.job_counter += 1
-
-    task = Task(job_id, data, webserver.data_ingestor, 'mean_by_category_request')
-
-    # Return associated job_id
-    webserver.tasks_runner.add_task(task)
-
-    # Log the response
-    webserver.logger.info("Job_id: {job_id} is running")
-
-    return jsonify({"job_id": job_id})
+    return submit_job('mean_by_category_request')
 
 @webserver.route('/api/state_mean_by_category', methods=['POST'])
 def state_mean_by_category_request():
@@ -351,51 +411,54 @@ def state_mean_by_category_request():
     # Log the request
     webserver.logger.info("Received state_mean_by_category request")
 
-    # Get request data
-    data = request.json
-
-    # Check if server is in drain mode
-    if webserver.tasks_runner.shutdown_event.is_set():
-        return jsonify({"status": "Server is shutting down."}), 503
-
-    # Register job. Don't wait for task to finish
-    # Increment job_id counter
-    with webserver.lock:
-        job_id = webserver.job_counter
-        webserver.job_counter += 1
-
-    task = Task(job_id, data, webserver.data_ingestor, 'state_mean_by_category_request')
+    return submit_job('state_mean_by_category_request')
 
-    # Return associated job_id
-    webserver.tasks_runner.add_task(task)
+@webserver.route('/api/batch', methods=['POST'])
+def batch_request():
+    """
+    batch_request is a POST endpoint that receives a list of {request_type, question, state}
+    items in the request body and returns a single job_id; the result of the job is the list of
+    the results of the items, in the same order.
+    """
+    # Log the request
+    webserver.logger.info("Received batch request")
 
-    # Log the response
-    webserver.logger.info("Job_id: {job_id} is running")
+    # The body must be a list of requests
+    if not isinstance(request.json, list):
+        return jsonify({'status': 'error', 'message': 'Expected a list of requests'}), 400
 
-    return jsonify({"job_id": job_id})
+    return submit_job('batch_request')
 
 @webserver.route('/api/jobs', methods=['GET'])
 def jobs():
     """
-    jobs method is a GET endpoint that returns the status of all jobs.
+    jobs method is a GET endpoint that returns the status of the live jobs (running, or finished
+    and not expired yet). The list can be paged with the limit query parameter (jobs per page)
+    and the after query parameter (the last job_id of the previous page); a limited page that is
+    not the last one has the job_id to pass as after in next.
     """
     # Log the request
     webserver.logger.info("Received request for all jobs")
 
-    jobs_status = []
-    with webserver.lock:
-        for job_id in range(webserver.job_counter):
-            if (os.path.exists(f"results/{job_id}.json")
-                and job_id in webserver.tasks_runner.task_done
-                and webserver.tasks_runner.task_done[job_id]):
-                jobs_status.append({job_id: 'done'})
-            else:
-                jobs_status.append({job_id: 'running'})
+    # Check if after and limit are integers
+    try:
+        after = int(request.args.get('after', 0))
+        limit = max(int(request.args.get('limit', 0)), 0)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Invalid after or limit'}), 400
+
+    # Get one job more than the page to know if there is a next page
+    live_jobs = webserver.tasks_runner.jobs.jobs(after, limit + 1 if limit else 0)
+    response = {"status": "done"}
+    if limit and len(live_jobs) > limit:
+        live_jobs = live_jobs[:limit]
+        response["next"] = live_jobs[-1][0]
+    response["data"] = [{job_id: state} for job_id, state in live_jobs]
 
     # Log the response
     webserver.logger.info("Returning status of all jobs")
 
-    return jsonify({"status": "done", "data": jobs_status})
+    return jsonify(response)
 
 @webserver.route('/api/num_jobs', methods=['GET'])
 def num_jobs():
@@ -413,10 +476,117 @@ def num_jobs():
             jobs_counter += 1
 
     # Log the response
-    webserver.logger.info("Returning number of jobs: {jobs_counter}")
+    webserver.logger.info("Returning number of jobs: %s", jobs_counter)
 
     return jsonify({"num_jobs": jobs_counter})
 
+@webserver.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    metrics method is a GET endpoint that returns the metrics of the server in the Prometheus text
+    format: the latency of the jobs per phase and request type, the worker utilization, the queue
+    depth, the result cache hit rate and the size of the result store.
+    """
+    return Response(render_metrics(webserver), mimetype='text/plain; version=0.0.4')
+
+@webserver.route('/api/admin/profile', methods=['GET', 'POST', 'DELETE'])
+def profile():
+    """
+    profile method is an admin endpoint for the profiles of the sampled jobs (keyed by request
+    type) and requests (keyed by request:<endpoint>). A GET returns, for the key query parameter
+    or for every key, the format query parameter: summary (default), pstats (a .pstats file),
+    text (the functions with the highest cumulative time) or collapsed (stacks for a
+    flamegraph). A POST sets the sample rate to the sample_rate of the JSON body and a DELETE
+    drops the profiles.
+    """
+    # Log the request
+    webserver.logger.info("Received request for profile")
+
+    profiler = webserver.tasks_runner.profiler
+    if request.method == 'DELETE':
+        profiler.reset()
+        return jsonify(profiler.summary())
+
+    if request.method == 'POST':
+        sample_rate = (request.get_json(silent=True) or {}).get('sample_rate')
+        if not isinstance(sample_rate, (int, float)) or not 0 <= sample_rate <= 1:
+            return jsonify({'status': 'error', 'message': 'Invalid sample_rate'}), 400
+        profiler.set_sample_rate(sample_rate)
+        return jsonify(profiler.summary())
+
+    key = request.args.get('key')
+    output_format = request.args.get('format', 'summary')
+    if output_format == 'summary':
+        return jsonify(profiler.summary())
+    if output_format == 'collapsed':
+        return Response(profiler.collapsed_stacks(key), mimetype='text/plain')
+    if output_format not in ('pstats', 'text'):
+        return jsonify({'status': 'error', 'message': 'Invalid format'}), 400
+
+    headers = {}
+    if output_format == 'text':
+        report = profiler.text_report(key)
+        mimetype = 'text/plain'
+    else:
+        report = profiler.pstats_data(key)
+        mimetype = 'application/octet-stream'
+        filename = (key or 'all').replace(':', '-')
+        headers['Content-Disposition'] = f"attachment; filename={filename}.pstats"
+    if report is None:
+        return jsonify({'status': 'error', 'message': 'No profile'}), 404
+
+    return Response(report, mimetype=mimetype, headers=headers)
+
+@webserver.route('/api/admin/reload', methods=['GET', 'POST'])
+def reload_dataset():
+    """
+    reload_dataset method is an admin endpoint that reloads the dataset without downtime. A POST
+    starts building the new dataset in the background (409 if a reload is already running) and a
+    GET returns the version in use and the state of the reloads.
+    """
+    # Log the request
+    webserver.logger.info("Received request for dataset reload")
+
+    reloader = webserver.dataset_reloader
+    if request.method == 'GET':
+        return jsonify(reloader.status())
+
+    if not reloader.reload():
+        return jsonify({'status': 'error', 'message': 'Reload already running'}), 409
+
+    # Log the response
+    webserver.logger.info("Reloading the dataset")
+
+    return jsonify({'status': 'reloading', **reloader.status()}), 202
+
+@webserver.route('/api/admin/append', methods=['POST'])
+def append_rows():
+    """
+    append_rows method is an admin endpoint that appends rows to the dataset in place. A body of
+    CSV lines (with or without the header line) is appended to the CSV file and then to the
+    data; an empty body appends the lines that were written at the end of the CSV file since it
+    was read. The aggregates are updated incrementally and the dataset gets a new version.
+    """
+    # Log the request
+    webserver.logger.info("Received request for append")
+
+    data_ingestor = webserver.data_ingestor
+    try:
+        text = request.get_data(as_text=True)
+        if text.strip():
+            count = data_ingestor.append_csv(text)
+        else:
+            count = data_ingestor.append_tail()
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    # Log the response
+    webserver.logger.info("Appended %s rows", count)
+
+    # The rows went to the DataIngestor that replaced this one if a reload swapped it meanwhile
+    return jsonify({'status': 'done', 'rows': count,
+                    'version': webserver.data_ingestor.version})
+
 @webserver.route('/api/graceful_shutdown', methods=['GET'])
 def graceful_shutdown():
     """
@@ -426,14 +596,14 @@ def graceful_shutdown():
     webserver.logger.info("Received request for graceful shutdown")
 
     # Call function to initiate shutdown
+    webserver.dataset_reloader.stop_watching()
     webserver.tasks_runner.shutdown()
 
     # Log the response
     webserver.logger.info("Shutting down gracefully")
 
-    # Delete all files in the results directory
-    for file in os.listdir("results"):
-        os.remove(os.path.join("results", file))
+    # Delete all the results
+    webserver.tasks_runner.result_store.clear()
 
     return jsonify({"status": "Shutting down gracefully"})
 
@@ -0,0 +1,176 @@
+"""
+snapshot.py module contains the functions used to save the parsed dataset as a binary snapshot
+and to load it back instead of parsing the CSV file again.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from app.column_store import ColumnStore
+
+# Bump when the layout of the snapshot changes, older snapshots are then ignored
+SNAPSHOT_VERSION = 1
+
+def snapshot_dir():
+    """
+    snapshot_dir function to get the directory where the snapshots are kept. The directory is set
+    by the environment variable DATA_SNAPSHOT_DIR, an empty value disables the snapshots.
+    """
+    return os.getenv('DATA_SNAPSHOT_DIR', 'snapshots')
+
+def snapshot_mmap():
+    """
+    snapshot_mmap function to check if the snapshot columns should be memory-mapped instead of
+    read into memory. It is enabled by setting the environment variable DATA_SNAPSHOT_MMAP to 1.
+    The mapped files are read-only and backed by the page cache, so every worker process that
+    maps the same snapshot shares one copy of the data.
+    """
+    return os.getenv('DATA_SNAPSHOT_MMAP', '0') == '1'
+
+def snapshot_path(csv_path: str):
+    """
+    snapshot_path function to get the path of the snapshot of a CSV file.
+    """
+    key = hashlib.sha1(os.path.abspath(csv_path).encode('utf-8')).hexdigest()
+    return os.path.join(snapshot_dir(), key)
+
+def file_sha256(path: str):
+    """
+    file_sha256 function to get the SHA-256 of a file.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_snapshot(csv_path: str, stat=None):
+    """
+    load_snapshot function to load the ColumnStore of a CSV file from its snapshot. Returns None if
+    snapshots are disabled or there is no valid snapshot. A snapshot is valid if it has the current
+    version and was taken from the same file: same size and either the same modification time or,
+    if the file was only touched, the same content hash. The file is compared as of stat, the
+    os.stat_result the caller took of it (a new one by default). The columns are memory-mapped
+    when snapshot_mmap is enabled.
+    """
+    if not snapshot_dir():
+        return None
+
+    path = snapshot_path(csv_path)
+    try:
+        with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as file:
+            meta = json.load(file)
+
+        if stat is None:
+            stat = os.stat(csv_path)
+        if meta['version'] != SNAPSHOT_VERSION or meta['size'] != stat.st_size:
+            return None
+        if meta['mtime_ns'] != stat.st_mtime_ns and meta['sha256'] != file_sha256(csv_path):
+            return None
+
+        return read_store(path, meta['columns'])
+    except (OSError, ValueError, KeyError):
+        return None
+
+def read_store(path: str, columns: list):
+    """
+    read_store function to read the columns and strings of a ColumnStore saved in a directory.
+    The columns are memory-mapped when snapshot_mmap is enabled.
+    """
+    with open(os.path.join(path, 'strings.json'), 'r', encoding='utf-8') as file:
+        strings = json.load(file)
+
+    mmap_mode = 'r' if snapshot_mmap() else None
+    return ColumnStore({column: np.load(os.path.join(path, f"{column}.npy"), mmap_mode=mmap_mode)
+                        for column in columns}, strings)
+
+def write_snapshot(csv_path: str, store: ColumnStore, stat):
+    """
+    write_snapshot function to save the ColumnStore of a CSV file as a snapshot. stat is the
+    os.stat_result of the file taken before it was parsed: the snapshot is labelled with it, and
+    it is not written at all if the file changed since then, as its rows would not be the rows of
+    the file. The snapshot is written to a temporary directory first and then renamed, so a
+    process never sees a partially written snapshot. Returns True if the snapshot was written.
+    """
+    if not snapshot_dir():
+        return False
+
+    # Hash the file as it was parsed, so it must not have changed since stat either
+    sha256 = file_sha256(csv_path)
+    current = os.stat(csv_path)
+    if (current.st_size, current.st_mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+        return False
+
+    save_store(store, snapshot_path(csv_path), {
+        'version': SNAPSHOT_VERSION,
+        'csv_path': os.path.abspath(csv_path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': sha256,
+        'columns': list(store.columns),
+    })
+    return True
+
+def save_store(store: ColumnStore, path: str, meta: dict):
+    """
+    save_store function to save the columns and strings of a ColumnStore and their meta.json in
+    the directory path. They are written to a temporary directory first and then renamed, so a
+    process never sees a partially written snapshot.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = tempfile.mkdtemp(dir=os.path.dirname(path))
+
+    try:
+        for column, values in store.columns.items():
+            np.save(os.path.join(tmp_path, f"{column}.npy"), values)
+
+        with open(os.path.join(tmp_path, 'strings.json'), 'w', encoding='utf-8') as file:
+            json.dump(store.strings, file)
+
+        # meta.json is written last, a snapshot without it is never loaded
+        with open(os.path.join(tmp_path, 'meta.json'), 'w', encoding='utf-8') as file:
+            json.dump(meta, file)
+
+        # Replace the previous snapshot, if any
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+def version_snapshot_path(name: str):
+    """
+    version_snapshot_path function to get the path of the snapshot of a version of a dataset.
+    """
+    return os.path.join(snapshot_dir(), 'versions', name)
+
+def write_version_snapshot(store: ColumnStore, name: str):
+    """
+    write_version_snapshot function to save the ColumnStore of a version of a dataset, as it is
+    in memory (with the rows appended since the CSV file was read), under a name unique to that
+    version. Returns the path of the snapshot, None if snapshots are disabled.
+    """
+    if not snapshot_dir():
+        return None
+
+    path = version_snapshot_path(name)
+    save_store(store, path, {'version': SNAPSHOT_VERSION, 'columns': list(store.columns)})
+    return path
+
+def load_version_snapshot(path: str):
+    """
+    load_version_snapshot function to load the ColumnStore saved by write_version_snapshot.
+    Returns None if there is no valid snapshot at path (e.g. it was deleted since).
+    """
+    try:
+        with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as file:
+            meta = json.load(file)
+        if meta['version'] != SNAPSHOT_VERSION:
+            return None
+        return read_store(path, meta['columns'])
+    except (OSError, ValueError, KeyError):
+        return None
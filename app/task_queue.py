@@ -0,0 +1,169 @@
+"""
+FairTaskQueue class to schedule the tasks by priority and, within a priority, fairly between the
+clients that submitted them.
+"""
+
+from collections import deque
+from threading import Condition
+
+# Estimated cost of every request type, relative to answering a single state
+REQUEST_COSTS = {
+    'state_mean_request': 1,
+    'global_mean_request': 1,
+    'state_diff_from_mean_request': 1,
+    'state_mean_by_category_request': 2,
+    'states_mean_request': 5,
+    'diff_from_mean_request': 5,
+    'best5_request': 6,
+    'worst5_request': 6,
+    'mean_by_category_request': 40,
+}
+
+# Priorities are clamped to this range, a higher priority is served first
+MIN_PRIORITY = 0
+MAX_PRIORITY = 9
+
+def request_cost(request_type):
+    """
+    request_cost function to get the estimated cost of a request type, given with or without the
+    _request suffix.
+    """
+    if not request_type.endswith('_request'):
+        request_type += '_request'
+    return REQUEST_COSTS.get(request_type, 1)
+
+def parse_priority(value):
+    """
+    parse_priority function to parse a priority header, MIN_PRIORITY if it is missing or invalid.
+    """
+    try:
+        return min(max(int(value), MIN_PRIORITY), MAX_PRIORITY)
+    except (TypeError, ValueError):
+        return MIN_PRIORITY
+
+class DeficitRoundRobin:
+    """
+    class DeficitRoundRobin to share a queue fairly between clients. Every client has its own FIFO
+    queue; the clients are visited in turn and every visit adds a quantum to the client's deficit,
+    which is spent on the costs of the tasks it dequeues. A client flooding the queue with costly
+    tasks only gets its share, while the cheap tasks of the other clients keep flowing.
+    """
+    def __init__(self, quantum):
+        """
+        Initialize the DeficitRoundRobin class with the quantum added on every visit.
+        """
+        self.quantum = quantum
+        # client_id -> deque of tasks, only for the clients with queued tasks
+        self.queues = {}
+        # client_id -> unspent cost
+        self.deficits = {}
+        # Clients with queued tasks, the one at the head is being visited
+        self.active = deque()
+        # Whether the client at the head already got its quantum for this visit
+        self.credited = False
+        self.size = 0
+
+    def put(self, task):
+        """
+        put method to queue a task of its client.
+        """
+        client_id = task.client_id
+        if client_id not in self.queues:
+            self.queues[client_id] = deque()
+            self.deficits[client_id] = 0
+            self.active.append(client_id)
+
+        self.queues[client_id].append(task)
+        self.size += 1
+
+    def pop(self):
+        """
+        pop method to dequeue the next task. The queue must not be empty.
+        """
+        while True:
+            client_id = self.active[0]
+            if not self.credited:
+                self.deficits[client_id] += self.quantum
+                self.credited = True
+
+            queue = self.queues[client_id]
+            cost = queue[0].cost()
+            if cost <= self.deficits[client_id]:
+                self.deficits[client_id] -= cost
+                self.size -= 1
+                task = queue.popleft()
+
+                # The client has nothing left, it leaves the round
+                if not queue:
+                    self.active.popleft()
+                    del self.queues[client_id]
+                    del self.deficits[client_id]
+                    self.credited = False
+
+                return task
+
+            # Not enough deficit left, visit the next client
+            self.active.rotate(-1)
+            self.credited = False
+
+class FairTaskQueue:
+    """
+    class FairTaskQueue to schedule the tasks of the ThreadPool. It has the put/get/qsize
+    interface of queue.Queue. Tasks with a higher priority are always served first; tasks with the
+    same priority are shared between the clients by deficit round robin, weighted by the
+    estimated cost of every task. None (the shutdown marker of the TaskRunner threads) is only
+    returned once there is no task left, so the queued tasks are drained first.
+    """
+    def __init__(self, quantum=max(REQUEST_COSTS.values())):
+        """
+        Initialize the FairTaskQueue class with the deficit round robin quantum.
+        """
+        self.quantum = quantum
+        # priority -> DeficitRoundRobin, only for the priorities with queued tasks
+        self.levels = {}
+        self.size = 0
+        self.stop_markers = 0
+        self.not_empty = Condition()
+
+    def put(self, task):
+        """
+        put method to queue a task.
+        """
+        with self.not_empty:
+            if task is None:
+                self.stop_markers += 1
+            else:
+                level = self.levels.get(task.priority)
+                if level is None:
+                    level = self.levels[task.priority] = DeficitRoundRobin(self.quantum)
+                level.put(task)
+                self.size += 1
+
+            self.not_empty.notify()
+
+    def get(self):
+        """
+        get method to dequeue the next task, waiting until there is one.
+        """
+        with self.not_empty:
+            self.not_empty.wait_for(lambda: self.size or self.stop_markers)
+
+            if not self.size:
+                self.stop_markers -= 1
+                return None
+
+            priority = max(self.levels)
+            level = self.levels[priority]
+            task = level.pop()
+            self.size -= 1
+
+            if not level.size:
+                del self.levels[priority]
+
+            return task
+
+    def qsize(self):
+        """
+        qsize method to get the number of queued tasks.
+        """
+        return self.size
@@ -2,12 +2,51 @@
 task_runner.py module contains the ThreadPool and TaskRunner classes that are used to manage
 the execution of tasks in the application.
 """
-from threading import Thread, Event
+from threading import Condition, Thread, Event
+import asyncio
+import json
 import multiprocessing
 import os
-import json
+import time
 from queue import Queue
 
+from app.data_ingestor import DataIngestor
+from app.job_registry import JobRegistry
+from app.metrics import JobMetrics
+from app.profiler import Profiler
+from app.result_encoding import EncodedResult
+from app.result_store import create_result_store
+from app.snapshot import load_version_snapshot
+from app.task_queue import FairTaskQueue, request_cost
+
+# DataIngestors of a worker process of the process backend, by the path of the version snapshot
+# they were loaded from
+worker_ingestors = {}
+# Versions a worker keeps loaded, so jobs of two versions do not reload them in turn
+WORKER_DATASETS = 2
+
+def compute_in_worker(csv_path, dataset, requests):
+    """
+    Compute the answers of (req_data, request_type) requests in a worker process of the process
+    backend, against the version of the dataset saved in the version snapshot at the path
+    dataset (see DataIngestor.dataset_snapshot). The worker loads a version the first time it is
+    used, memory-mapped and shared between the workers with DATA_SNAPSHOT_MMAP=1, and keeps the
+    last WORKER_DATASETS versions. Returns None if the snapshot cannot be loaded (it was deleted
+    since), the server then computes the requests itself.
+    """
+    data_ingestor = worker_ingestors.pop(dataset, None)
+    if data_ingestor is None:
+        data = load_version_snapshot(dataset)
+        if data is None:
+            return None
+        data_ingestor = DataIngestor(csv_path, data=data)
+        while len(worker_ingestors) >= WORKER_DATASETS:
+            del worker_ingestors[next(iter(worker_ingestors))]
+    # The most recently used version is the last one
+    worker_ingestors[dataset] = data_ingestor
+
+    return data_ingestor.compute_questions(requests)
+
 class ThreadPool:
     """
     ThreadPool class is used to manage the execution of tasks in the application.
@@ -16,28 +55,220 @@ class ThreadPool:
         """
         Initialize the thread pool with the number of threads specified in the environment variable
         TP_NUM_OF_THREADS. If the environment variable is not set, the number of threads will be set
-        to the number of CPUs on the system.
+        to the number of CPUs on the system. The results of the tasks are kept in the result store
+        configured by the RESULT_STORE environment variables.
+
+        With TP_BACKEND=process, the requests are computed by a pool of as many worker processes
+        instead, so they run in parallel without sharing the GIL; the threads only track the jobs.
+        The workers are forked here, before any thread is started.
+
+        The tasks are scheduled by a FairTaskQueue (by priority, then fairly between clients)
+        unless TP_SCHEDULER=fifo selects a plain FIFO queue.
         """
         self.num_threads = int(os.getenv('TP_NUM_OF_THREADS', multiprocessing.cpu_count()))
-        self.task_queue = Queue()
+        self.process_pool = None
+        if os.getenv('TP_BACKEND', 'thread') == 'process':
+            self.process_pool = multiprocessing.get_context('fork').Pool(self.num_threads)
+
+        if os.getenv('TP_SCHEDULER', 'fair') == 'fifo':
+            self.task_queue = Queue()
+        else:
+            self.task_queue = FairTaskQueue()
         self.shutdown_event = Event()
         self.threads = []
-        self.task_done = {}
+        # job_id -> Event set when the task finishes, only for the unfinished tasks
+        self.job_events = {}
+        # Notified every time a task finishes
+        self.task_finished = Condition()
+        # job_id -> functions called when the task finishes, only for the unfinished tasks
+        self.job_callbacks = {}
+        # Number of tasks that finished, to estimate the throughput
+        self.completed_tasks = 0
+        # coalesce key -> job_id of the running task computing it
+        self.inflight = {}
+        # job_id of a running task -> job_ids of the identical tasks attached to it
+        self.followers = {}
+        # Number of tasks that were attached to an identical task instead of being queued
+        self.coalesced_tasks = 0
+        self.result_store = create_result_store()
+        # State of the live jobs, the finished ones expire with their results
+        self.jobs = JobRegistry.from_env(self.result_store)
+        # Latency of the finished jobs and time the TaskRunners were busy
+        self.metrics = JobMetrics()
+        # Profiles of a sample of the tasks, per request type
+        self.profiler = Profiler.from_env()
 
         self.shutdown_event.clear()
 
         # Initialize and start threads
         for _ in range(self.num_threads):
-            thread = TaskRunner(self.task_queue, self.shutdown_event, self.task_done)
+            thread = TaskRunner(self)
             thread.start()
             self.threads.append(thread)
 
     def add_task(self, task):
         """
-        Add a task to the task queue.
+        Add a task to the task queue. If an identical task (same request type and payload) is
+        already running, the task is not queued: it is attached to that task and gets its result
+        when it finishes. A task is never attached to a queued task, whose place in the queue
+        depends on the priority and client of another submission.
+        """
+        if self.shutdown_event.is_set():
+            return
+
+        task.timestamps['enqueued'] = time.monotonic()
+        self.jobs.add(task.job_id)
+        with self.task_finished:
+            self.job_events[task.job_id] = Event()
+            if self.attach_to_inflight(task):
+                return
+
+        self.task_queue.put(task)
+
+    def attach_to_inflight(self, task):
+        """
+        Attach a task to the running task computing the same key, if there is one. Returns True
+        if the task was attached. Must hold task_finished.
+        """
+        leader = self.inflight.get(task.coalesce_key())
+        if leader is None:
+            return False
+
+        self.followers[leader].append(task.job_id)
+        self.coalesced_tasks += 1
+        return True
+
+    def start_task(self, task):
+        """
+        Register a task that is about to run as the computation of its key. Returns False if an
+        identical task started running since the task was queued: the task is then attached to
+        it instead, and can be waited for like a queued task.
+        """
+        with self.task_finished:
+            if self.attach_to_inflight(task):
+                self.job_events.setdefault(task.job_id, Event())
+                return False
+            self.inflight[task.coalesce_key()] = task.job_id
+            self.followers[task.job_id] = []
+        return True
+
+    def run_task(self, task):
+        """
+        Run a task in the calling thread: execute it, save its result (and the result of the
+        tasks attached to it) and mark them as done, or as errors if the task raised. If an
+        identical task is running, the task is attached to it instead.
+        """
+        self.jobs.add(task.job_id)
+        if not self.start_task(task):
+            return
+
+        job_ids = [task.job_id]
+        done = False
+        try:
+            task.timestamps['compute_started'] = time.monotonic()
+            try:
+                task.execute(self.process_pool)
+            finally:
+                # No task is attached to this one from now on
+                job_ids += self.detach_followers(task)
+            task.timestamps['compute_finished'] = time.monotonic()
+            for job_id in job_ids:
+                task.save_result(self.result_store, job_id)
+            task.timestamps['persisted'] = time.monotonic()
+            done = True
+        except Exception as e:  # pylint: disable=broad-except
+            # Any failure of a task (e.g. a malformed payload) marks its jobs as errors, the
+            # TaskRunner goes on with the next task
+            print(f"Error processing task {task.job_id}: {e!r}")
+        finally:
+            for job_id in job_ids:
+                self.jobs.finish(job_id, done)
+            self.metrics.observe_task(task, done, len(job_ids))
+            # Wake up whoever waits for the tasks, even if they failed
+            self.notify_finished(job_ids)
+
+    def detach_followers(self, task):
+        """
+        Stop attaching tasks to a task and return the job_ids of the tasks attached to it.
+        """
+        with self.task_finished:
+            key = task.coalesce_key()
+            if self.inflight.get(key) == task.job_id:
+                del self.inflight[key]
+            return self.followers.pop(task.job_id, [])
+
+    def notify_finished(self, job_ids):
+        """
+        Wake up the waiters and call the callbacks of finished tasks.
+        """
+        callbacks = []
+        with self.task_finished:
+            for job_id in job_ids:
+                event = self.job_events.pop(job_id, None)
+                if event is not None:
+                    event.set()
+                callbacks += self.job_callbacks.pop(job_id, [])
+            self.completed_tasks += 1
+            self.task_finished.notify_all()
+
+        for callback in callbacks:
+            try:
+                callback()
+            except RuntimeError as e:
+                # The event loop of the waiter is already closed
+                print(f"Error notifying tasks {job_ids}: {e}")
+
+    def wait_for_task(self, job_id, timeout):
+        """
+        Wait up to timeout seconds for a task to finish. Returns True if the task is done.
+        """
+        event = self.job_events.get(job_id)
+        if event is not None:
+            event.wait(timeout)
+
+        return self.jobs.is_done(job_id)
+
+    def completion_future(self, job_id):
+        """
+        Get a future of the running asyncio event loop that resolves, with True if the task is
+        done, when the task finishes. No thread waits for it: the TaskRunner that runs the task
+        resolves the future through the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def resolve():
+            if not future.done():
+                future.set_result(self.jobs.is_done(job_id))
+
+        with self.task_finished:
+            if job_id in self.job_events:
+                self.job_callbacks.setdefault(job_id, []).append(
+                    lambda: loop.call_soon_threadsafe(resolve))
+                return future
+
+        # The task already finished (or there is no such task)
+        resolve()
+        return future
+
+    def wait_for_any(self, job_ids, timeout):
+        """
+        Wait up to timeout seconds until at least one of the tasks is no longer pending. Returns
+        the job_ids that are no longer pending.
+        """
+        def finished():
+            return [job_id for job_id in job_ids if job_id not in self.job_events]
+
+        with self.task_finished:
+            self.task_finished.wait_for(finished, timeout)
+            return finished()
+
+    def job_status(self, job_id):
+        """
+        Get the status of a job: 'done', 'running' (queued or executing), 'error' (the task
+        failed) or None if there is no such job or it expired.
         """
-        if not self.shutdown_event.is_set():
-            self.task_queue.put(task)
+        return self.jobs.state(job_id)
 
     def shutdown(self):
         """ 
@@ -48,19 +279,22 @@ class ThreadPool:
             self.task_queue.put(None)
         for thread in self.threads:
             thread.join()
+        if self.process_pool is not None:
+            self.process_pool.close()
+            self.process_pool.join()
 
 class TaskRunner(Thread):
     """
     TaskRunner class is used to execute tasks in a separate thread.
     """
-    def __init__(self, task_queue, shutdown_event, task_done):
+    def __init__(self, thread_pool):
         """
-        Initialize the TaskRunner with the task queue, shutdown event, and task_done dictionary.
+        Initialize the TaskRunner with the thread pool it takes the tasks from.
         """
         super().__init__()
-        self.task_queue = task_queue
-        self.shutdown_event = shutdown_event
-        self.task_done = task_done
+        self.thread_pool = thread_pool
+        self.task_queue = thread_pool.task_queue
+        self.shutdown_event = thread_pool.shutdown_event
         self.has_task = False
 
     def run(self):
@@ -71,43 +305,122 @@ class TaskRunner(Thread):
             task = self.task_queue.get()
             if task is None:  # Allow exiting the thread
                 break
+            task.timestamps['dequeued'] = started = time.monotonic()
             try:
                 self.has_task = True
-                self.task_done[task.job_id] = False
-                task.execute()
-                task.save_result()
-                self.task_done[task.job_id] = True
-            except (IOError, ValueError) as e:
-                print(f"Error processing task {task.job_id}: {e}")
+                self.thread_pool.profiler.run(task.request_type, self.thread_pool.run_task, task)
+            except Exception as e:  # pylint: disable=broad-except
+                # run_task handles the failures of the task, this is a failure of the profiler:
+                # the TaskRunner goes on with the next task
+                print(f"Error profiling task {task.job_id}: {e!r}")
             finally:
                 self.has_task = False
+                self.thread_pool.metrics.observe_busy(time.monotonic() - started)
 
 
 class Task:
     """
     Task class is used to represent a task that needs to be executed.
     """
-    def __init__(self, job_id, data, data_ingestor, request_type):
+    def __init__(self, job_id, data, data_ingestor, request_type, client_id='', priority=0):
         self.job_id = job_id
         self.data = data
         self.data_ingestor = data_ingestor
         self.request_type = request_type
+        self.client_id = client_id
+        self.priority = priority
         self.result = None
+        # Result encoded once, for the task and the tasks attached to it
+        self.encoded_result = None
+        # Monotonic times the task was enqueued, dequeued, computed and its result persisted
+        self.timestamps = {}
+
+    def coalesce_key(self):
+        """
+        Get the key identifying the computation of the task: tasks with the same key have the
+        same result, so only one of them is computed at a time.
+        """
+        return (self.data_ingestor.version, self.request_type,
+                json.dumps(self.data, sort_keys=True))
+
+    def cost(self):
+        """
+        Get the estimated cost of the task, used to schedule it fairly.
+        """
+        return request_cost(self.request_type)
+
+    def is_cached(self):
+        """
+        Check if the result of the task is already cached, so executing it is only a lookup.
+        """
+        return self.data_ingestor.cached_result(self.data, self.request_type) is not None
 
-    def execute(self):
+    def compute_function(self, process_pool):
+        """
+        Get the function that computes the requests that are not cached: in a worker process of
+        the process pool if there is one, all of them in one round trip, against a snapshot of
+        the current version of the data of the task; in this thread otherwise, or if the
+        snapshot cannot be written or loaded.
+        """
+        if process_pool is None:
+            return None
+
+        ingestor = self.data_ingestor
+
+        def compute_many(requests):
+            results = None
+            dataset = ingestor.dataset_snapshot()
+            if dataset is not None:
+                results = process_pool.apply(compute_in_worker,
+                                             (ingestor.csv_path, dataset, requests))
+            if results is None:
+                results = ingestor.compute_questions(requests)
+            return results
+
+        return compute_many
+
+    def execute(self, process_pool=None):
         """
         Execute the task.
         """
         # Process the question with given data and request type
-        self.result = self.data_ingestor.process_question(self.data, self.request_type)
+        self.result = self.data_ingestor.process_question(
+            self.data, self.request_type, self.compute_function(process_pool))
+
+    def save_result(self, result_store, job_id=None):
+        """
+        Save the result to the result store, as the result of the given job (by default the
+        job of the task). The result is encoded to JSON on the first save only.
+        """
+        if self.encoded_result is None:
+            self.encoded_result = EncodedResult.encode(self.result)
+        result_store.put_encoded(self.job_id if job_id is None else job_id, self.encoded_result)
+
 
-    def save_result(self):
+class BatchTask(Task):
+    """
+    BatchTask class is used to represent a task that answers a batch of requests at once.
+    """
+    def __init__(self, job_id, items, data_ingestor, client_id='', priority=0):
+        super().__init__(job_id, items, data_ingestor, 'batch_request', client_id, priority)
+
+    def cost(self):
+        """
+        The cost of a batch is the cost of all its items.
+        """
+        return sum(request_cost(str(item.get('request_type', '')))
+                   for item in self.data if isinstance(item, dict))
+
+    def is_cached(self):
+        """
+        A batch is never answered from the cache as a whole.
         """
-        Save the result to a JSON file.
+        return False
+
+    def execute(self, process_pool=None):
+        """
+        Execute the task.
         """
-        # Save the result to a JSON file
-        result_dir = "results"
-        os.makedirs(result_dir, exist_ok=True)
-        result_path = os.path.join(result_dir, f"{self.job_id}.json")
-        with open(result_path, 'w', encoding='utf-8') as file:
-            json.dump(self.result, file)
+        # Process all the requests of the batch together
+        self.result = self.data_ingestor.process_batch(
+            self.data, self.compute_function(process_pool))
@@ -0,0 +1,4 @@
+"""
+benchmarks package contains the micro-benchmarks of the DataIngestor and the load generator of
+the job API. Every benchmark prints its results as JSON, so runs can be diffed.
+"""
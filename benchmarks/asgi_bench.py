@@ -0,0 +1,222 @@
+"""
+asgi_bench.py module compares how the ASGI variant (app/asgi.py, served by uvicorn) and the
+threaded Flask server hold many long-polling clients: it starts each server in its own process
+with every job slowed down to a fixed duration, submits one job and has N clients wait for its
+result with /api/get_results/<job_id>?wait=<seconds> at once. It prints, per server and number
+of clients, the clients that got the result, the time until the last one did, and the peak
+number of threads and resident memory of the server as JSON. The thread and memory figures are
+read from /proc, and are null elsewhere; the ASGI server is skipped when uvicorn is not
+installed.
+
+Run it from the repository root, e.g.:
+    python -m benchmarks.asgi_bench --clients 1000,5000 --job-seconds 8 --output asgi.json
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import time
+
+def parse_args(argv):
+    """
+    Parse the command line arguments.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--servers', default='asgi,flask',
+                        help='comma-separated servers to compare (asgi, flask)')
+    parser.add_argument('--clients', default='1000',
+                        help='comma-separated numbers of concurrent long-polling clients')
+    parser.add_argument('--job-seconds', type=float, default=8,
+                        help='seconds every job is slowed down to')
+    parser.add_argument('--wait', type=float, default=30,
+                        help='long poll wait of the clients, in seconds')
+    parser.add_argument('--port', type=int, default=5057, help='port the servers listen on')
+    parser.add_argument('--serve', choices=['asgi', 'flask'],
+                        help='run that server in this process (internal)')
+    parser.add_argument('--output', help='file the JSON results are written to (default stdout)')
+    return parser.parse_args(argv)
+
+def serve(args):
+    """
+    Run a server on args.port, with every job sleeping args.job_seconds before it is computed.
+    """
+    os.environ.setdefault('LOG_MODE', 'off')
+    # pylint: disable=import-outside-toplevel
+    from app.task_runner import Task
+
+    execute = Task.execute
+
+    def slow_execute(task, process_pool=None):
+        time.sleep(args.job_seconds)
+        execute(task, process_pool)
+
+    Task.execute = slow_execute
+
+    from app import webserver
+    if args.serve == 'asgi':
+        import uvicorn
+        uvicorn.run('app.asgi:application', port=args.port, log_level='error',
+                    backlog=16384)
+    else:
+        webserver.run(port=args.port, threaded=True)
+
+def proc_status(pid):
+    """
+    Read the number of threads and the peak resident memory (in bytes) of a process from
+    /proc/<pid>/status. Returns (None, None) without /proc.
+    """
+    try:
+        with open(f"/proc/{pid}/status", encoding='utf-8') as file:
+            fields = dict(line.split(':', 1) for line in file if ':' in line)
+    except OSError:
+        return None, None
+    return int(fields['Threads']), int(fields['VmHWM'].split()[0]) * 1024
+
+def http_request(method, path, port, body=b''):
+    """
+    Build an HTTP/1.1 request the server closes the connection after.
+    """
+    headers = [f"{method} {path} HTTP/1.1", f"Host: 127.0.0.1:{port}", 'Connection: close']
+    if body:
+        headers += ['Content-Type: application/json', f"Content-Length: {len(body)}"]
+    return ('\r\n'.join(headers) + '\r\n\r\n').encode('ascii') + body
+
+async def fetch(port, request, timeout):
+    """
+    Send a request on a new connection and read the response until the server closes it.
+    Returns the JSON body, or None if the request failed or timed out.
+    """
+    writer = None
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port),
+                                                timeout)
+        writer.write(request)
+        response = await asyncio.wait_for(reader.read(), timeout)
+        return json.loads(response.split(b'\r\n\r\n', 1)[1])
+    except (OSError, ValueError, IndexError, asyncio.TimeoutError):
+        return None
+    finally:
+        if writer is not None:
+            writer.close()
+
+async def poll_job(port, clients, args, server_pid):
+    """
+    Submit one job, then have the clients long-poll its result at once while the threads and
+    memory of the server are sampled. Returns the measurements.
+    """
+    body = json.dumps({'question': 'Percent of adults aged 18 years and older who have '
+                                   'obesity'}).encode('utf-8')
+    submitted = await fetch(port, http_request('POST', '/api/best5', port, body), 10)
+    job_id = submitted['job_id']
+
+    peak_threads = 0
+    finished = asyncio.Event()
+
+    async def sample():
+        nonlocal peak_threads
+        while not finished.is_set():
+            threads, _ = proc_status(server_pid)
+            peak_threads = max(peak_threads, threads or 0)
+            await asyncio.sleep(0.1)
+
+    async def client():
+        result = await fetch(port, http_request('GET', f"/api/get_results/{job_id}?wait="
+                                                f"{args.wait:g}", port), args.wait + 10)
+        return result is not None and result.get('status') == 'done', time.perf_counter()
+
+    started = time.perf_counter()
+    sampler = asyncio.create_task(sample())
+    answers = await asyncio.gather(*(client() for _ in range(clients)))
+    finished.set()
+    await sampler
+
+    done = [answered_at - started for ok, answered_at in answers if ok]
+    _, peak_rss = proc_status(server_pid)
+    return {
+        'done': len(done),
+        'failed': clients - len(done),
+        'last_done_seconds': max(done) if done else None,
+        'peak_threads': peak_threads or None,
+        'peak_rss_mb': peak_rss / 2 ** 20 if peak_rss else None,
+    }
+
+def wait_for_port(port, timeout=30):
+    """
+    Wait until a server accepts connections on the port.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"No server is listening on port {port}")
+
+def run_server(server, clients, args):
+    """
+    Start a server in a new process, run the clients against it and stop it. Returns the
+    measurements.
+    """
+    command = [sys.executable, '-m', 'benchmarks.asgi_bench', '--serve', server,
+               '--port', str(args.port), '--job-seconds', str(args.job_seconds)]
+    process = subprocess.Popen(command, env={**os.environ, 'LOG_MODE': 'off'},
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(args.port)
+        return asyncio.run(poll_job(args.port, clients, args, process.pid))
+    finally:
+        process.kill()
+        process.wait()
+
+def main(argv=None):
+    """
+    Run the benchmark and print or write its JSON results.
+    """
+    args = parse_args(argv)
+
+    if args.serve:
+        serve(args)
+        return
+
+    # Every client holds a connection, and the file descriptor of its socket
+    _, hard_limit = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard_limit, hard_limit))
+
+    servers = args.servers.split(',')
+    if 'asgi' in servers and importlib.util.find_spec('uvicorn') is None:
+        print("uvicorn is not installed, skipping the ASGI server", file=sys.stderr)
+        servers.remove('asgi')
+
+    results = []
+    for server in servers:
+        for clients in map(int, args.clients.split(',')):
+            result = {'server': server, 'clients': clients, **run_server(server, clients, args)}
+            results.append(result)
+            print(f"{server}, {clients} clients: {result['done']} done, "
+                  f"{result['peak_threads']} server threads", file=sys.stderr)
+
+    report = {
+        'benchmark': 'asgi',
+        'python': platform.python_version(),
+        'job_seconds': args.job_seconds,
+        'wait_seconds': args.wait,
+        'results': results,
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(output + '\n')
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+backend_bench.py module compares the execution backends of the thread pool (see TP_BACKEND): it
+runs a number of mean_by_category jobs with the thread and the process backend and 1, 2 and 4
+workers, each configuration in its own process with the result cache disabled, and prints the
+jobs per second of every configuration as JSON.
+
+Run it from the repository root, e.g.:
+    python -m benchmarks.backend_bench --workers 1,2,4 --jobs 2000 --output backend.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+def parse_args(argv):
+    """
+    Parse the command line arguments.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--backends', default='thread,process',
+                        help='comma-separated backends to compare')
+    parser.add_argument('--workers', default='1,2,4',
+                        help='comma-separated numbers of workers (TP_NUM_OF_THREADS)')
+    parser.add_argument('--jobs', type=int, default=2000, help='jobs per configuration')
+    parser.add_argument('--question', default='Percent of adults aged 18 years and older who '
+                        'have obesity',
+                        help='question of the mean_by_category jobs')
+    parser.add_argument('--child', action='store_true',
+                        help='run the jobs in this process and print their timing (internal)')
+    parser.add_argument('--output', help='file the JSON results are written to (default stdout)')
+    return parser.parse_args(argv)
+
+def run_jobs(args):
+    """
+    Run the jobs on the thread pool of this process, configured by the environment. Returns the
+    seconds from the first submission to the last job done.
+    """
+    os.environ.setdefault('LOG_MODE', 'off')
+    # pylint: disable=import-outside-toplevel
+    from app import webserver
+    from app.routes import create_task, next_job_id
+
+    thread_pool = webserver.tasks_runner
+
+    def submit(nonce):
+        # A nonce makes every job distinct, so none is attached to an identical running one
+        job_id = next_job_id()
+        data = {'question': args.question, 'nonce': nonce}
+        thread_pool.add_task(create_task(job_id, data, 'mean_by_category_request'))
+        return job_id
+
+    try:
+        # The workers of the process backend load the dataset on their first job
+        for job_id in [submit(-nonce) for nonce in range(1, thread_pool.num_threads + 1)]:
+            thread_pool.wait_for_task(job_id, 60)
+
+        started = time.perf_counter()
+        job_ids = [submit(nonce) for nonce in range(args.jobs)]
+        for job_id in job_ids:
+            if not thread_pool.wait_for_task(job_id, 60):
+                raise RuntimeError(f"Job {job_id} did not finish")
+        return time.perf_counter() - started
+    finally:
+        # Let the process exit: the TaskRunner threads of the webserver are not daemons
+        thread_pool.shutdown()
+
+def run_configuration(backend, workers, args):
+    """
+    Run the jobs with a backend and a number of workers, in a new process. Returns the seconds
+    they took.
+    """
+    env = {**os.environ, 'TP_BACKEND': backend, 'TP_NUM_OF_THREADS': str(workers),
+           'RESULT_CACHE_SIZE': '0', 'LOG_MODE': 'off'}
+    completed = subprocess.run([sys.executable, '-m', 'benchmarks.backend_bench', '--child',
+                                '--jobs', str(args.jobs), '--question', args.question],
+                               env=env, check=True, stdout=subprocess.PIPE, text=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1])['seconds']
+
+def main(argv=None):
+    """
+    Run the benchmark and print or write its JSON results.
+    """
+    args = parse_args(argv)
+
+    if args.child:
+        print(json.dumps({'seconds': run_jobs(args)}))
+        return
+
+    results = []
+    for backend in args.backends.split(','):
+        for workers in map(int, args.workers.split(',')):
+            seconds = run_configuration(backend, workers, args)
+            results.append({
+                'backend': backend,
+                'workers': workers,
+                'seconds': seconds,
+                'jobs_per_second': args.jobs / seconds,
+            })
+            print(f"{backend}, {workers} workers: {args.jobs / seconds:.0f} jobs/s",
+                  file=sys.stderr)
+
+    report = {
+        'benchmark': 'backend',
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'jobs': args.jobs,
+        'results': results,
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(output + '\n')
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+batch_bench.py module measures /api/batch against individual jobs: the time to submit N requests
+and get all their results, as N jobs polled one by one or as one batch job, with the result
+cache disabled. It prints the results as JSON.
+
+Run it from the repository root, e.g.:
+    python -m benchmarks.batch_bench --sizes 100,400 --repeat 5 --output batch.json
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+
+from benchmarks.load_generator import request_bodies
+from benchmarks.stats import summarize
+
+def parse_args(argv):
+    """
+    Parse the command line arguments.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='100,400',
+                        help='comma-separated numbers of requests per measurement')
+    parser.add_argument('--repeat', type=int, default=5, help='measurements per size and mode')
+    parser.add_argument('--data', default='nutrition_activity_obesity_usa_subset.csv',
+                        help='CSV file the questions and states of the requests are taken from')
+    parser.add_argument('--output', help='file the JSON results are written to (default stdout)')
+    return parser.parse_args(argv)
+
+def wait_result(client, job_id):
+    """
+    Long-poll the result of a job until it is no longer running.
+    """
+    while True:
+        result = client.get(f"/api/get_results/{job_id}?wait=10").get_json()
+        if result['status'] != 'running':
+            return result
+
+def run_individual(client, requests):
+    """
+    Submit every request as its own job, then poll the jobs. Returns their results.
+    """
+    job_ids = [client.post(f"/api/{endpoint}", json=body).get_json()['job_id']
+               for endpoint, body in requests]
+    return [wait_result(client, job_id)['data'] for job_id in job_ids]
+
+def run_batch(client, requests):
+    """
+    Submit the requests as one batch job, then poll it. Returns the results of its items.
+    """
+    items = [{'request_type': endpoint, **body} for endpoint, body in requests]
+    job_id = client.post('/api/batch', json=items).get_json()['job_id']
+    return wait_result(client, job_id)['data']
+
+def main(argv=None):
+    """
+    Run the benchmark and print or write its JSON results.
+    """
+    args = parse_args(argv)
+
+    # Every request is computed, and the fetches are not measured with the logging
+    os.environ.setdefault('RESULT_CACHE_SIZE', '0')
+    os.environ.setdefault('LOG_MODE', 'off')
+    from app import webserver  # pylint: disable=import-outside-toplevel
+
+    client = webserver.test_client()
+    results = []
+    for size in map(int, args.sizes.split(',')):
+        requests = list(itertools.islice(request_bodies(args.data, [
+            'states_mean', 'state_mean', 'best5', 'worst5', 'global_mean', 'diff_from_mean',
+            'state_diff_from_mean', 'mean_by_category', 'state_mean_by_category']), size))
+
+        timings = {'individual': [], 'batch': []}
+        answers = {}
+        for _ in range(args.repeat):
+            for mode, run in (('individual', run_individual), ('batch', run_batch)):
+                started = time.perf_counter()
+                answers[mode] = run(client, requests)
+                timings[mode].append(time.perf_counter() - started)
+
+        result = {
+            'requests': size,
+            'individual_ms': summarize(timings['individual'], scale=1e3),
+            'batch_ms': summarize(timings['batch'], scale=1e3),
+            'results_match': answers['individual'] == answers['batch'],
+        }
+        results.append(result)
+        print(f"{size} requests: {result['individual_ms']['p50']:.0f} ms as jobs, "
+              f"{result['batch_ms']['p50']:.0f} ms as a batch", file=sys.stderr)
+
+    report = {
+        'benchmark': 'batch',
+        'python': platform.python_version(),
+        'repeat': args.repeat,
+        'results': results,
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(output + '\n')
+    else:
+        print(output)
+
+    # Let the process exit: the TaskRunner threads of the webserver are not daemons
+    webserver.tasks_runner.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+datasets.py module contains the generation of the synthetic datasets used by the benchmarks.
+"""
+
+import csv
+import os
+import random
+
+# States the copies of the rows are spread over
+STATES = (
+    'Alabama', 'Alaska', 'Arizona', 'Arkansas', 'California', 'Colorado', 'Connecticut',
+    'Delaware', 'District of Columbia', 'Florida', 'Georgia', 'Hawaii', 'Idaho', 'Illinois',
+    'Indiana', 'Iowa', 'Kansas', 'Kentucky', 'Louisiana', 'Maine', 'Maryland', 'Massachusetts',
+    'Michigan', 'Minnesota', 'Mississippi', 'Missouri', 'Montana', 'Nebraska', 'Nevada',
+    'New Hampshire', 'New Jersey', 'New Mexico', 'New York', 'North Carolina', 'North Dakota',
+    'Ohio', 'Oklahoma', 'Oregon', 'Pennsylvania', 'Rhode Island', 'South Carolina',
+    'South Dakota', 'Tennessee', 'Texas', 'Utah', 'Vermont', 'Virginia', 'Washington',
+    'West Virginia', 'Wisconsin', 'Wyoming',
+)
+
+def scaled_dataset(base_path, scale, output_dir, seed=0):
+    """
+    Write a synthetic dataset with scale copies of every row of the base CSV file and return its
+    path. The copies are spread over the US states and the years of the 2011 - 2022 window, and
+    their data values are jittered, so the aggregates have a realistic number of groups. The
+    file is only written once per base file and scale.
+    """
+    name = os.path.splitext(os.path.basename(base_path))[0]
+    path = os.path.join(output_dir, f"{name}_x{scale}.csv")
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(output_dir, exist_ok=True)
+    rng = random.Random(seed)
+
+    with open(base_path, 'r', encoding='utf-8', newline='') as file:
+        rows = list(csv.reader(file))
+    header, rows = rows[0], rows[1:]
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+
+        for copy in range(scale):
+            for row in rows:
+                row = list(row)
+                row[4] = STATES[(copy + rng.randrange(len(STATES))) % len(STATES)]
+                row[1] = row[2] = str(2011 + rng.randrange(12))
+                try:
+                    row[11] = f"{float(row[11]) * rng.uniform(0.8, 1.2):.1f}"
+                except ValueError:
+                    pass
+                writer.writerow(row)
+
+    os.replace(tmp_path, path)
+    return path
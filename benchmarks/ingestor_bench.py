@@ -0,0 +1,124 @@
+"""
+ingestor_bench.py module micro-benchmarks the request methods of the DataIngestor on synthetic
+datasets scaled from a base CSV file, and prints the results as JSON.
+
+Run it from the repository root, e.g.:
+    python -m benchmarks.ingestor_bench --scales 1,10,100,1000 --output ingestor.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from benchmarks.datasets import scaled_dataset
+from benchmarks.stats import summarize
+
+# Request types of the DataIngestor, and whether they are answered for a single state
+REQUEST_TYPES = {
+    'states_mean_request': False,
+    'state_mean_request': True,
+    'best5_request': False,
+    'worst5_request': False,
+    'global_mean_request': False,
+    'diff_from_mean_request': False,
+    'state_diff_from_mean_request': True,
+    'mean_by_category_request': False,
+    'state_mean_by_category_request': True,
+}
+
+def parse_args(argv):
+    """
+    Parse the command line arguments.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--base', default='test_data.csv',
+                        help='CSV file the synthetic datasets are scaled from')
+    parser.add_argument('--scales', default='1,10,100,1000',
+                        help='comma-separated numbers of copies of the base rows')
+    parser.add_argument('--repeat', type=int, default=200,
+                        help='calls of every request method per question')
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'le_stats_bench'),
+                        help='directory the synthetic datasets are written to')
+    parser.add_argument('--output', help='file the JSON results are written to (default stdout)')
+    return parser.parse_args(argv)
+
+def bench_dataset(data_ingestor_class, csv_path, repeat):
+    """
+    Benchmark one dataset: the time to load it and the time of every request method, for every
+    question and (for the per-state requests) the first state of the question.
+    """
+    start = time.perf_counter()
+    ingestor = data_ingestor_class(csv_path)
+    load_seconds = time.perf_counter() - start
+
+    methods = {}
+    for request_type, per_state in REQUEST_TYPES.items():
+        timings = []
+        for question, states in ingestor.cube.state_totals.items():
+            req_data = {'question': question, 'state': next(iter(states)) if per_state else None}
+            for _ in range(repeat):
+                start = time.perf_counter()
+                ingestor.compute_question(req_data, request_type)
+                timings.append(time.perf_counter() - start)
+        methods[request_type] = summarize(timings, scale=1e6)
+
+    # A request answered from the result cache
+    timings = []
+    req_data = {'question': next(iter(ingestor.cube.state_totals), ''), 'state': None}
+    ingestor.process_question(req_data, 'states_mean_request')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        ingestor.process_question(req_data, 'states_mean_request')
+        timings.append(time.perf_counter() - start)
+    methods['cache_hit'] = summarize(timings, scale=1e6)
+
+    return {
+        'rows': len(ingestor.data),
+        'questions': len(ingestor.cube.state_totals),
+        'load_seconds': load_seconds,
+        'methods_us': methods,
+    }
+
+def main(argv=None):
+    """
+    Run the benchmark and print or write its JSON results.
+    """
+    args = parse_args(argv)
+
+    # Measure a cold load: no snapshot of the synthetic datasets
+    os.environ['DATA_SNAPSHOT_DIR'] = ''
+    from app import webserver  # pylint: disable=import-outside-toplevel
+    from app.data_ingestor import DataIngestor  # pylint: disable=import-outside-toplevel
+
+    results = []
+    for scale in (int(scale) for scale in args.scales.split(',')):
+        csv_path = scaled_dataset(args.base, scale, args.data_dir)
+        result = bench_dataset(DataIngestor, csv_path, args.repeat)
+        results.append({'scale': scale, **result})
+        print(f"x{scale}: {result['rows']} rows loaded in {result['load_seconds']:.3f}s",
+              file=sys.stderr)
+
+    report = {
+        'benchmark': 'ingestor',
+        'python': platform.python_version(),
+        'base': args.base,
+        'repeat': args.repeat,
+        'results': results,
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(output + '\n')
+    else:
+        print(output)
+
+    # Let the process exit: the TaskRunner threads of the webserver are not daemons
+    webserver.tasks_runner.shutdown()
+
+if __name__ == '__main__':
+    main()
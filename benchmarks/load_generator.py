@@ -0,0 +1,286 @@
+"""
+load_generator.py module drives the job API with concurrent clients doing submit-then-poll
+cycles, and prints the throughput, the submit and end-to-end latencies and the queue depth over
+time as JSON.
+
+Run it from the repository root, against the webserver in the same process (default) or against
+a running server, e.g.:
+    python -m benchmarks.load_generator --clients 8 --duration 10 --output load.json
+    python -m benchmarks.load_generator --url http://localhost:5000 --clients 32
+"""
+
+from threading import Event, Lock, Thread
+from urllib.parse import urlsplit
+import argparse
+import csv
+import http.client
+import itertools
+import json
+import platform
+import sys
+import time
+
+from benchmarks.stats import summarize
+
+# Job submission endpoints, and whether their requests are for a single state
+ENDPOINTS = {
+    'states_mean': False,
+    'state_mean': True,
+    'best5': False,
+    'worst5': False,
+    'global_mean': False,
+    'diff_from_mean': False,
+    'state_diff_from_mean': True,
+    'mean_by_category': False,
+    'state_mean_by_category': True,
+}
+
+class InProcessClient:
+    """
+    InProcessClient class sends the requests to the webserver of this process, through the
+    Flask test client.
+    """
+    def __init__(self, webserver):
+        """
+        Initialize the InProcessClient with a test client of the webserver.
+        """
+        self.client = webserver.test_client()
+
+    def post(self, path, body):
+        """
+        Send a POST request with a JSON body. Returns the status code and the JSON response.
+        """
+        response = self.client.post(path, json=body)
+        return response.status_code, response.get_json()
+
+    def get(self, path):
+        """
+        Send a GET request. Returns the status code and the JSON response.
+        """
+        response = self.client.get(path)
+        return response.status_code, response.get_json()
+
+class HttpClient:
+    """
+    HttpClient class sends the requests to a running server over HTTP, on a keep-alive
+    connection.
+    """
+    def __init__(self, base_url):
+        """
+        Initialize the HttpClient with the base URL of the server.
+        """
+        url = urlsplit(base_url)
+        self.prefix = url.path.rstrip('/')
+        self.connection = http.client.HTTPConnection(url.hostname, url.port or 80)
+
+    def request(self, method, path, body=None):
+        """
+        Send a request. Returns the status code and the JSON response.
+        """
+        headers = {}
+        if body is not None:
+            body = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+
+        self.connection.request(method, self.prefix + path, body, headers)
+        response = self.connection.getresponse()
+        return response.status, json.loads(response.read() or 'null')
+
+    def post(self, path, body):
+        """
+        Send a POST request with a JSON body. Returns the status code and the JSON response.
+        """
+        return self.request('POST', path, body)
+
+    def get(self, path):
+        """
+        Send a GET request. Returns the status code and the JSON response.
+        """
+        return self.request('GET', path)
+
+def parse_args(argv):
+    """
+    Parse the command line arguments.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', help='base URL of a running server (default: in-process)')
+    parser.add_argument('--clients', type=int, default=8, help='concurrent clients')
+    parser.add_argument('--duration', type=float, default=10, help='seconds of load')
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS),
+                        help='comma-separated job endpoints the requests are spread over')
+    parser.add_argument('--data', default='nutrition_activity_obesity_usa_subset.csv',
+                        help='CSV file the questions and states of the requests are taken from')
+    parser.add_argument('--poll-interval', type=float, default=0.005,
+                        help='seconds between two polls of a job')
+    parser.add_argument('--wait', type=float, default=0,
+                        help='long-poll the results with this wait, in seconds (default: poll)')
+    parser.add_argument('--sample-interval', type=float, default=0.1,
+                        help='seconds between two samples of the queue depth')
+    parser.add_argument('--output', help='file the JSON results are written to (default stdout)')
+    return parser.parse_args(argv)
+
+def request_bodies(csv_path, endpoints):
+    """
+    Get an endless cycle of (endpoint, body) requests over the endpoints and the questions and
+    states of a CSV file.
+    """
+    questions, states = {}, {}
+    with open(csv_path, 'r', encoding='utf-8') as file:
+        reader = csv.reader(file)
+        next(reader)
+        for row in reader:
+            questions[row[8]] = None
+            states[row[4]] = None
+
+    requests = []
+    for question, (index, endpoint) in itertools.product(questions, enumerate(endpoints)):
+        body = {'question': question}
+        if ENDPOINTS[endpoint]:
+            body['state'] = list(states)[index % len(states)]
+        requests.append((endpoint, body))
+
+    return itertools.cycle(requests)
+
+class LoadGenerator:
+    """
+    LoadGenerator class runs the clients and the queue depth sampler, and collects their
+    measurements.
+    """
+    def __init__(self, make_client, requests, args):
+        """
+        Initialize the LoadGenerator with the factory of the clients, the cycle of requests and
+        the options.
+        """
+        self.make_client = make_client
+        self.requests = requests
+        self.args = args
+        self.lock = Lock()
+        self.stop_event = Event()
+        self.submit_latencies = []
+        self.end_to_end_latencies = []
+        self.rejected = {}
+        self.errors = 0
+        self.queue_depth = []
+        self.started_at = 0
+
+    def next_request(self):
+        """
+        Get the next request of the cycle.
+        """
+        with self.lock:
+            return next(self.requests)
+
+    def run_client(self):
+        """
+        Submit a job, poll it until it is done and start again, until the load is over.
+        """
+        client = self.make_client()
+        query = f"?wait={self.args.wait}" if self.args.wait else ''
+
+        while not self.stop_event.is_set():
+            endpoint, body = self.next_request()
+            submitted_at = time.perf_counter()
+            status, response = client.post(f"/api/{endpoint}", body)
+            submit_latency = time.perf_counter() - submitted_at
+
+            if status != 200:
+                with self.lock:
+                    self.rejected[status] = self.rejected.get(status, 0) + 1
+                time.sleep(self.args.poll_interval)
+                continue
+
+            while True:
+                status, result = client.get(f"/api/get_results/{response['job_id']}{query}")
+                if status != 200 or result.get('status') != 'running':
+                    break
+                if not self.args.wait:
+                    time.sleep(self.args.poll_interval)
+
+            with self.lock:
+                if status == 200 and result.get('status') == 'done':
+                    self.submit_latencies.append(submit_latency)
+                    self.end_to_end_latencies.append(time.perf_counter() - submitted_at)
+                else:
+                    self.errors += 1
+
+    def sample_queue_depth(self):
+        """
+        Sample the number of queued and running jobs every sample_interval seconds.
+        """
+        client = self.make_client()
+        while not self.stop_event.wait(self.args.sample_interval):
+            _, response = client.get('/api/num_jobs')
+            self.queue_depth.append([round(time.perf_counter() - self.started_at, 3),
+                                     response['num_jobs']])
+
+    def run(self):
+        """
+        Run the load for the configured duration. Returns the JSON report.
+        """
+        threads = [Thread(target=self.run_client) for _ in range(self.args.clients)]
+        threads.append(Thread(target=self.sample_queue_depth))
+
+        self.started_at = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(self.args.duration)
+        self.stop_event.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - self.started_at
+
+        depths = [depth for _, depth in self.queue_depth]
+        return {
+            'benchmark': 'load',
+            'python': platform.python_version(),
+            'target': self.args.url or 'in-process',
+            'clients': self.args.clients,
+            'duration_seconds': elapsed,
+            'jobs': len(self.end_to_end_latencies),
+            'jobs_per_second': len(self.end_to_end_latencies) / elapsed,
+            'errors': self.errors,
+            'rejected': {str(status): count for status, count in sorted(self.rejected.items())},
+            'submit_latency_ms': summarize(self.submit_latencies, scale=1e3),
+            'end_to_end_latency_ms': summarize(self.end_to_end_latencies, scale=1e3),
+            'queue_depth': {
+                'max': max(depths, default=0),
+                'mean': sum(depths) / len(depths) if depths else 0,
+                'samples': self.queue_depth,
+            },
+        }
+
+def main(argv=None):
+    """
+    Run the load generator and print or write its JSON report.
+    """
+    args = parse_args(argv)
+    endpoints = args.endpoints.split(',')
+    requests = request_bodies(args.data, endpoints)
+
+    webserver = None
+    if args.url:
+        def make_client():
+            return HttpClient(args.url)
+    else:
+        from app import webserver  # pylint: disable=import-outside-toplevel
+
+        def make_client():
+            return InProcessClient(webserver)
+
+    report = LoadGenerator(make_client, requests, args).run()
+    print(f"{report['jobs']} jobs, {report['jobs_per_second']:.1f} jobs/s, "
+          f"p99 {report['end_to_end_latency_ms'].get('p99')} ms", file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(output + '\n')
+    else:
+        print(output)
+
+    # Let the process exit: the TaskRunner threads of the webserver are not daemons
+    if webserver is not None:
+        webserver.tasks_runner.shutdown()
+
+if __name__ == '__main__':
+    main()
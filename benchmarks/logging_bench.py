@@ -0,0 +1,94 @@
+"""
+logging_bench.py module measures the cost of logging on the job API: it runs the load generator
+against the in-process webserver once per logging mode (off, sync and queue, see LOG_MODE), each
+in its own process, and prints the throughput and latencies of every mode as JSON.
+
+Run it from the repository root, e.g.:
+    python -m benchmarks.logging_bench --clients 8 --duration 10 --output logging.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+
+def parse_args(argv):
+    """
+    Parse the command line arguments.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--modes', default='off,sync,queue',
+                        help='comma-separated logging modes to compare')
+    parser.add_argument('--clients', type=int, default=8, help='concurrent clients')
+    parser.add_argument('--duration', type=float, default=10, help='seconds of load per mode')
+    parser.add_argument('--wait', type=float, default=1,
+                        help='long poll wait of the clients, in seconds (0 to poll in a loop)')
+    parser.add_argument('--sample-rate', type=float, default=1,
+                        help='LOG_SAMPLE_RATE of the runs')
+    parser.add_argument('--output', help='file the JSON results are written to (default stdout)')
+    return parser.parse_args(argv)
+
+def run_mode(mode, args, work_dir):
+    """
+    Run the load generator with a logging mode, in a new process. Returns its JSON report and the
+    size of the log it wrote.
+    """
+    log_path = os.path.join(work_dir, f"{mode}.log")
+    report_path = os.path.join(work_dir, f"{mode}.json")
+    env = {**os.environ, 'LOG_MODE': mode, 'LOG_FILE': log_path,
+           'LOG_SAMPLE_RATE': str(args.sample_rate)}
+
+    # The console output is part of the cost of logging, but not of the results
+    subprocess.run([sys.executable, '-m', 'benchmarks.load_generator',
+                    '--clients', str(args.clients), '--duration', str(args.duration),
+                    '--wait', str(args.wait), '--sample-interval', str(args.duration),
+                    '--output', report_path],
+                   env=env, check=True, stderr=subprocess.DEVNULL)
+
+    with open(report_path, encoding='utf-8') as file:
+        report = json.load(file)
+    log_bytes = os.path.getsize(log_path) if os.path.exists(log_path) else 0
+    return report, log_bytes
+
+def main(argv=None):
+    """
+    Run the benchmark and print or write its JSON results.
+    """
+    args = parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for mode in args.modes.split(','):
+            report, log_bytes = run_mode(mode, args, work_dir)
+            results.append({
+                'mode': mode,
+                'jobs': report['jobs'],
+                'jobs_per_second': report['jobs_per_second'],
+                'submit_latency_ms': report['submit_latency_ms'],
+                'end_to_end_latency_ms': report['end_to_end_latency_ms'],
+                'log_bytes': log_bytes,
+            })
+            print(f"{mode}: {report['jobs_per_second']:.1f} jobs/s, submit p99 "
+                  f"{report['submit_latency_ms'].get('p99')} ms", file=sys.stderr)
+
+    report = {
+        'benchmark': 'logging',
+        'python': platform.python_version(),
+        'clients': args.clients,
+        'duration_seconds': args.duration,
+        'sample_rate': args.sample_rate,
+        'results': results,
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(output + '\n')
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
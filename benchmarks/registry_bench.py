@@ -0,0 +1,131 @@
+"""
+registry_bench.py module measures the JobRegistry under concurrent submissions and listings:
+submitter threads allocate, register and finish jobs while reader threads list the live jobs as
+/api/jobs does, with all of them or a page of them. It runs every configuration with a single
+shard (one lock for the whole registry) and with the sharded registry, and prints the
+registrations and listings per second and the registration latency percentiles as JSON.
+
+Run it from the repository root, e.g.:
+    python -m benchmarks.registry_bench --shards 1,16 --duration 2 --output registry.json
+"""
+
+from threading import Event, Thread
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+from benchmarks.stats import summarize
+
+def parse_args(argv):
+    """
+    Parse the command line arguments.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--shards', default='1,16',
+                        help='comma-separated numbers of shards (JOB_REGISTRY_SHARDS)')
+    parser.add_argument('--submitters', type=int, default=4, help='submitting threads')
+    parser.add_argument('--readers', type=int, default=2,
+                        help='listing threads, in the configurations that have readers')
+    parser.add_argument('--limits', default='0,100',
+                        help='comma-separated page sizes of the listings (0 lists all the jobs)')
+    parser.add_argument('--live', type=int, default=20000,
+                        help='live jobs the registry keeps (JOB_REGISTRY_MAX_JOBS)')
+    parser.add_argument('--duration', type=float, default=2, help='seconds per configuration')
+    parser.add_argument('--output', help='file the JSON results are written to (default stdout)')
+    return parser.parse_args(argv)
+
+def run_configuration(registry, readers, limit, args):
+    """
+    Run the submitters and the readers against a registry for args.duration seconds. Returns
+    the registration latencies (in seconds) and the number of listings.
+    """
+    stop = Event()
+    latencies = [[] for _ in range(args.submitters)]
+    listings = [0] * readers
+
+    def submit(samples):
+        while not stop.is_set():
+            started = time.perf_counter()
+            job_id = registry.next_job_id()
+            registry.add(job_id)
+            registry.finish(job_id, True)
+            samples.append(time.perf_counter() - started)
+
+    def read(index):
+        while not stop.is_set():
+            registry.jobs(0, limit)
+            listings[index] += 1
+
+    threads = [Thread(target=submit, args=(samples,)) for samples in latencies]
+    threads += [Thread(target=read, args=(index,)) for index in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    return [latency for samples in latencies for latency in samples], sum(listings)
+
+def main(argv=None):
+    """
+    Run the benchmark and print or write its JSON results.
+    """
+    args = parse_args(argv)
+
+    os.environ.setdefault('LOG_MODE', 'off')
+    # pylint: disable=import-outside-toplevel
+    from app import webserver
+    from app.job_registry import JobRegistry
+
+    # Without readers, then with readers listing every page size
+    configurations = [(0, 0)] + [(args.readers, int(limit)) for limit in args.limits.split(',')]
+
+    results = []
+    for num_shards in map(int, args.shards.split(',')):
+        for readers, limit in configurations:
+            # Fill the registry with its live jobs first, it then stays at that size
+            registry = JobRegistry(ttl=0, max_jobs=args.live, num_shards=num_shards)
+            for _ in range(args.live):
+                job_id = registry.next_job_id()
+                registry.add(job_id)
+                registry.finish(job_id, True)
+
+            latencies, listings = run_configuration(registry, readers, limit, args)
+            result = {
+                'shards': num_shards,
+                'readers': readers,
+                'limit': limit if readers else None,
+                'registrations_per_second': len(latencies) / args.duration,
+                'listings_per_second': listings / args.duration if readers else None,
+                'registration_latency_ms': summarize(latencies, scale=1e3),
+            }
+            results.append(result)
+            print(f"{num_shards} shards, {readers} readers, limit {limit}: "
+                  f"{result['registrations_per_second']:.0f} registrations/s, "
+                  f"{listings / args.duration:.0f} listings/s", file=sys.stderr)
+
+    report = {
+        'benchmark': 'registry',
+        'python': platform.python_version(),
+        'submitters': args.submitters,
+        'live_jobs': args.live,
+        'duration_seconds': args.duration,
+        'results': results,
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(output + '\n')
+    else:
+        print(output)
+
+    # Let the process exit: the TaskRunner threads of the webserver are not daemons
+    webserver.tasks_runner.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+result_bench.py module measures the fetch of a done result, /api/get_results/<job_id>: the bytes
+on the wire and the CPU time per fetch, uncompressed, gzip, deflate and revalidated with
+If-None-Match (304), against the previous path that serialized the result again with jsonify on
+every fetch. It prints the results as JSON.
+
+Run it from the repository root, e.g.:
+    python -m benchmarks.result_bench --repeat 500 --output result.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+# Request types measured, and whether they are answered for a single state
+REQUEST_TYPES = {
+    'mean_by_category': False,
+    'state_mean_by_category': True,
+    'states_mean': False,
+    'best5': False,
+    'global_mean': False,
+}
+
+QUESTION = 'Percent of adults aged 18 years and older who have obesity'
+
+def parse_args(argv):
+    """
+    Parse the command line arguments.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=500, help='fetches per measurement')
+    parser.add_argument('--output', help='file the JSON results are written to (default stdout)')
+    return parser.parse_args(argv)
+
+def measure(client, path, headers, repeat):
+    """
+    Fetch a path repeat times. Returns the status code and size of the response body and the
+    CPU time per fetch, in microseconds.
+    """
+    response = client.get(path, headers=headers)
+    started = time.process_time()
+    for _ in range(repeat):
+        client.get(path, headers=headers)
+    cpu = (time.process_time() - started) / repeat
+
+    return {'status': response.status_code, 'bytes': len(response.data), 'cpu_us': cpu * 1e6}
+
+def main(argv=None):
+    """
+    Run the benchmark and print or write its JSON results.
+    """
+    args = parse_args(argv)
+
+    # Quiet, so the fetches are not measured with the logging
+    os.environ.setdefault('LOG_MODE', 'off')
+    from flask import jsonify  # pylint: disable=import-outside-toplevel
+    from app import webserver  # pylint: disable=import-outside-toplevel
+
+    # The previous path: the same checks as /api/get_results, then the decoded result
+    # serialized again on every fetch
+    legacy_results = {}
+
+    def legacy_get_results(job_id):
+        job_id = int(job_id)
+        jobs = webserver.tasks_runner.jobs
+        if jobs.is_expired(job_id) or not jobs.is_done(job_id):
+            return jsonify({'status': 'error'}), 404
+        return jsonify({'status': 'done', 'data': legacy_results[job_id]})
+
+    webserver.add_url_rule('/bench/legacy_results/<job_id>', view_func=legacy_get_results)
+    client = webserver.test_client()
+
+    results = []
+    for endpoint, per_state in REQUEST_TYPES.items():
+        body = {'question': QUESTION, **({'state': 'Ohio'} if per_state else {})}
+        job_id = client.post(f"/api/{endpoint}", json=body).get_json()['job_id']
+        webserver.tasks_runner.wait_for_task(job_id, 10)
+        legacy_results[job_id] = webserver.tasks_runner.result_store.get(job_id)
+
+        path = f"/api/get_results/{job_id}"
+        etag = client.get(path).headers['ETag']
+        result = {
+            'request_type': f"{endpoint}_request",
+            'legacy': measure(client, f"/bench/legacy_results/{job_id}", {}, args.repeat),
+            'identity': measure(client, path, {}, args.repeat),
+            'gzip': measure(client, path, {'Accept-Encoding': 'gzip'}, args.repeat),
+            'deflate': measure(client, path, {'Accept-Encoding': 'deflate'}, args.repeat),
+            'not_modified': measure(client, path, {'If-None-Match': etag}, args.repeat),
+        }
+        results.append(result)
+        print(f"{endpoint}: {result['legacy']['bytes']} bytes in "
+              f"{result['legacy']['cpu_us']:.0f} us before, {result['gzip']['bytes']} bytes in "
+              f"{result['gzip']['cpu_us']:.0f} us gzipped", file=sys.stderr)
+
+    report = {
+        'benchmark': 'result',
+        'python': platform.python_version(),
+        'repeat': args.repeat,
+        'results': results,
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(output + '\n')
+    else:
+        print(output)
+
+    # Let the process exit: the TaskRunner threads of the webserver are not daemons
+    webserver.tasks_runner.shutdown()
+
+if __name__ == '__main__':
+    main()
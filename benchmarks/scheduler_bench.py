@@ -0,0 +1,141 @@
+"""
+scheduler_bench.py module measures how the scheduler of the thread pool (see TP_SCHEDULER) keeps
+light jobs fast under a flood of heavy ones: one client queues many mean_by_category jobs, then
+other clients submit state_mean jobs a little apart. It runs once per scheduler (fifo and fair),
+each in its own process with the result cache disabled, and prints the latency percentiles of
+the light and the heavy jobs, from their submission to their result being saved, as JSON.
+
+Run it from the repository root, e.g.:
+    python -m benchmarks.scheduler_bench --heavy 10000 --light 300 --output scheduler.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from benchmarks.stats import summarize
+
+def parse_args(argv):
+    """
+    Parse the command line arguments.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--schedulers', default='fifo,fair',
+                        help='comma-separated schedulers to compare')
+    parser.add_argument('--threads', type=int, default=2, help='TP_NUM_OF_THREADS of the runs')
+    parser.add_argument('--heavy', type=int, default=10000,
+                        help='mean_by_category jobs queued by the flooding client')
+    parser.add_argument('--light', type=int, default=300, help='state_mean jobs')
+    parser.add_argument('--light-clients', type=int, default=5,
+                        help='clients the state_mean jobs are spread over')
+    parser.add_argument('--interval', type=float, default=0.001,
+                        help='seconds between two state_mean submissions')
+    parser.add_argument('--question', default='Percent of adults aged 18 years and older who '
+                        'have obesity', help='question of the jobs')
+    parser.add_argument('--state', default='Ohio', help='state of the state_mean jobs')
+    parser.add_argument('--child', action='store_true',
+                        help='run the jobs in this process and print their latencies (internal)')
+    parser.add_argument('--output', help='file the JSON results are written to (default stdout)')
+    return parser.parse_args(argv)
+
+def run_jobs(args):
+    """
+    Run the jobs on the thread pool of this process, configured by the environment. Returns the
+    latencies of the light and the heavy jobs, in seconds.
+    """
+    os.environ.setdefault('LOG_MODE', 'off')
+    # pylint: disable=import-outside-toplevel
+    from app import webserver
+    from app.routes import create_task, next_job_id
+
+    thread_pool = webserver.tasks_runner
+
+    def submit(data, request_type, client_id):
+        task = create_task(next_job_id(), data, request_type, client_id)
+        thread_pool.add_task(task)
+        return task
+
+    try:
+        # A nonce makes every job distinct, so none is attached to an identical running one
+        heavy = [submit({'question': args.question, 'nonce': nonce}, 'mean_by_category_request',
+                        'heavy') for nonce in range(args.heavy)]
+        light = []
+        for nonce in range(args.light):
+            light.append(submit({'question': args.question, 'state': args.state, 'nonce': nonce},
+                                'state_mean_request', f"light-{nonce % args.light_clients}"))
+            time.sleep(args.interval)
+
+        for task in light + heavy:
+            if not thread_pool.wait_for_task(task.job_id, 600):
+                raise RuntimeError(f"Job {task.job_id} did not finish")
+    finally:
+        # Let the process exit: the TaskRunner threads of the webserver are not daemons
+        thread_pool.shutdown()
+
+    def latencies(tasks):
+        return [task.timestamps['persisted'] - task.timestamps['enqueued'] for task in tasks]
+
+    return {'light': latencies(light), 'heavy': latencies(heavy)}
+
+def run_scheduler(scheduler, args):
+    """
+    Run the jobs with a scheduler, in a new process. Returns the latencies of the light and the
+    heavy jobs, in seconds.
+    """
+    env = {**os.environ, 'TP_SCHEDULER': scheduler, 'TP_NUM_OF_THREADS': str(args.threads),
+           'RESULT_CACHE_SIZE': '0', 'LOG_MODE': 'off'}
+    completed = subprocess.run([sys.executable, '-m', 'benchmarks.scheduler_bench', '--child',
+                                '--heavy', str(args.heavy), '--light', str(args.light),
+                                '--light-clients', str(args.light_clients),
+                                '--interval', str(args.interval), '--question', args.question,
+                                '--state', args.state],
+                               env=env, check=True, stdout=subprocess.PIPE, text=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def main(argv=None):
+    """
+    Run the benchmark and print or write its JSON results.
+    """
+    args = parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run_jobs(args)))
+        return
+
+    results = []
+    for scheduler in args.schedulers.split(','):
+        latencies = run_scheduler(scheduler, args)
+        result = {
+            'scheduler': scheduler,
+            'light_latency_ms': summarize(latencies['light'], scale=1e3),
+            'heavy_latency_ms': summarize(latencies['heavy'], scale=1e3),
+        }
+        results.append(result)
+        print(f"{scheduler}: light p50 {result['light_latency_ms']['p50']:.1f} ms, p99 "
+              f"{result['light_latency_ms']['p99']:.1f} ms, heavy p50 "
+              f"{result['heavy_latency_ms']['p50']:.0f} ms", file=sys.stderr)
+
+    report = {
+        'benchmark': 'scheduler',
+        'python': platform.python_version(),
+        'threads': args.threads,
+        'heavy_jobs': args.heavy,
+        'light_jobs': args.light,
+        'light_clients': args.light_clients,
+        'interval_seconds': args.interval,
+        'results': results,
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(output + '\n')
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+"""
+stats.py module contains the functions used to summarize the measurements of the benchmarks.
+"""
+
+def percentile(values, fraction):
+    """
+    Get the value below which the given fraction of the sorted values lies (nearest rank).
+    """
+    if not values:
+        return None
+    index = min(int(fraction * len(values)), len(values) - 1)
+    return values[index]
+
+def summarize(values, scale=1):
+    """
+    Summarize measurements: their count, mean, p50, p95, p99 and max, multiplied by scale (e.g.
+    1000 to report seconds as milliseconds).
+    """
+    values = sorted(value * scale for value in values)
+    if not values:
+        return {'count': 0}
+
+    return {
+        'count': len(values),
+        'mean': sum(values) / len(values),
+        'p50': percentile(values, 0.50),
+        'p95': percentile(values, 0.95),
+        'p99': percentile(values, 0.99),
+        'max': values[-1],
+    }
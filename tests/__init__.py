@@ -0,0 +1,21 @@
+"""
+Unit tests of the webserver. Run them from the repository root with python -m unittest.
+"""
+
+import os
+import threading
+
+# The tests are not logged to webserver.log
+os.environ.setdefault('LOG_MODE', 'off')
+
+from app import webserver  # pylint: disable=wrong-import-position
+
+def shutdown_after_main_thread():
+    """
+    Shut down the thread pool of the webserver once the main thread is done, so the test run
+    can exit: the TaskRunner threads are not daemons.
+    """
+    threading.main_thread().join()
+    webserver.tasks_runner.shutdown()
+
+threading.Thread(target=shutdown_after_main_thread, daemon=True).start()
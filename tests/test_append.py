@@ -0,0 +1,177 @@
+"""
+test_append.py module checks that rows appended to a DataIngestor give the same dataset and the
+same answers as a full rebuild, including rows appended while the dataset is reloaded.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+
+from app.data_ingestor import DataIngestor
+from app.dataset_reloader import DatasetReloader
+from benchmarks.datasets import scaled_dataset
+
+REQUEST_TYPES = (
+    'states_mean_request',
+    'state_mean_request',
+    'best5_request',
+    'worst5_request',
+    'global_mean_request',
+    'diff_from_mean_request',
+    'state_diff_from_mean_request',
+    'mean_by_category_request',
+    'state_mean_by_category_request',
+)
+
+class AppendTest(unittest.TestCase):
+    """
+    AppendTest class loads the first rows of a CSV file, appends the others and compares the
+    result with a DataIngestor of the whole file.
+    """
+    def setUp(self):
+        """
+        Work in a temporary directory, snapshots included.
+        """
+        self.work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.work_dir)
+        patcher = mock.patch.dict(os.environ, {'DATA_SNAPSHOT_DIR':
+                                               os.path.join(self.work_dir, 'snapshots')})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def append_in_parts(self, csv_path):
+        """
+        Load the header and the first half of the lines of a CSV file, then append the others:
+        a quarter through append_csv, the rest written to the file and read with append_tail,
+        with a line split between two writes. Returns the DataIngestor.
+        """
+        with open(csv_path, 'r', encoding='utf-8') as file:
+            header, *lines = file.readlines()
+        first, second = len(lines) // 2, len(lines) * 3 // 4
+
+        path = os.path.join(self.work_dir, 'appended.csv')
+        with open(path, 'w', encoding='utf-8') as file:
+            file.writelines([header, *lines[:first]])
+        data_ingestor = DataIngestor(path)
+        version = data_ingestor.version
+
+        self.assertEqual(data_ingestor.append_csv(''.join([header, *lines[first:second]])),
+                         second - first)
+
+        tail = ''.join(lines[second:])
+        split = len(tail) - len(lines[-1]) // 2
+        with open(path, 'a', encoding='utf-8') as file:
+            file.write(tail[:split])
+        self.assertEqual(data_ingestor.append_tail(), len(lines) - second - 1)
+        with open(path, 'a', encoding='utf-8') as file:
+            file.write(tail[split:])
+        self.assertEqual(data_ingestor.append_tail(), 1)
+
+        self.assertEqual(len(data_ingestor.data), len(lines))
+        self.assertGreater(data_ingestor.version, version)
+        return data_ingestor
+
+    def assert_same_dataset(self, appended, rebuilt):
+        """
+        Check that two DataIngestors have the same columns, aggregates and answers.
+        """
+        self.assertEqual(appended.data.strings, rebuilt.data.strings)
+        self.assertEqual(appended.data.columns.keys(), rebuilt.data.columns.keys())
+        for column, values in rebuilt.data.columns.items():
+            self.assertTrue(np.array_equal(appended.data.columns[column], values,
+                                           equal_nan=True), column)
+        self.assertEqual(vars(appended.cube), vars(rebuilt.cube))
+
+        for question in rebuilt.data.strings['Question']:
+            for state in rebuilt.data.strings['LocationDesc']:
+                for request_type in REQUEST_TYPES:
+                    req_data = {'question': question, 'state': state}
+                    # json.dumps compares the order of the keys too
+                    self.assertEqual(
+                        json.dumps(appended.compute_question(req_data, request_type)),
+                        json.dumps(rebuilt.compute_question(req_data, request_type)),
+                        (question, state, request_type))
+
+    def test_append_equals_rebuild(self):
+        """
+        The appended rows of test_data.csv, and of a scaled copy of it spread over the states
+        and years, give the dataset of a full rebuild.
+        """
+        for csv_path in ('test_data.csv',
+                         scaled_dataset('test_data.csv', 200, self.work_dir)):
+            with self.subTest(csv_path=os.path.basename(csv_path)):
+                appended = self.append_in_parts(csv_path)
+                self.assert_same_dataset(appended, DataIngestor(csv_path))
+
+    def test_versions_are_unique(self):
+        """
+        A DataIngestor built to replace another one never gets a version the other one had or
+        gets by appending rows.
+        """
+        with open('test_data.csv', 'r', encoding='utf-8') as file:
+            header, *lines = file.readlines()
+        path = os.path.join(self.work_dir, 'data.csv')
+        with open(path, 'w', encoding='utf-8') as file:
+            file.writelines([header, *lines[:2]])
+
+        current = DataIngestor(path)
+        versions = {current.version}
+        replacement = DataIngestor(path, current.versions)
+        versions.add(replacement.version)
+        current.append_csv(lines[2])
+        versions.add(current.version)
+        self.assertEqual(len(versions), 3)
+
+    def test_reload_keeps_concurrent_appends(self):
+        """
+        Rows appended to the current DataIngestor while a reload builds the new one, and through
+        the current one after the swap, are in the new one, and the current one no longer
+        changes.
+        """
+        csv_path = scaled_dataset('test_data.csv', 200, self.work_dir)
+        with open(csv_path, 'r', encoding='utf-8') as file:
+            header, *lines = file.readlines()
+        first, second = len(lines) // 3, len(lines) * 2 // 3
+
+        path = os.path.join(self.work_dir, 'reloaded.csv')
+        with open(path, 'w', encoding='utf-8') as file:
+            file.writelines([header, *lines[:first]])
+        current = DataIngestor(path)
+        server = SimpleNamespace(data_ingestor=current)
+
+        def build_while_appending(csv_path, versions):
+            data_ingestor = DataIngestor(csv_path, versions)
+            current.append_csv(''.join(lines[first:second]))
+            return data_ingestor
+
+        with mock.patch('app.dataset_reloader.DataIngestor', side_effect=build_while_appending):
+            DatasetReloader(server).run_reload()
+        self.assertIsNot(server.data_ingestor, current)
+
+        current.append_csv(''.join(lines[second:]))
+        self.assertEqual(len(current.data), second)
+        self.assert_same_dataset(server.data_ingestor, DataIngestor(csv_path))
+
+    def test_reload_of_empty_file(self):
+        """
+        Reloading an empty CSV file fails with an error and keeps the current DataIngestor.
+        """
+        path = os.path.join(self.work_dir, 'data.csv')
+        shutil.copy('test_data.csv', path)
+        current = DataIngestor(path)
+        server = SimpleNamespace(data_ingestor=current)
+        open(path, 'w', encoding='utf-8').close()
+
+        reloader = DatasetReloader(server)
+        reloader.run_reload()
+        self.assertIs(server.data_ingestor, current)
+        self.assertTrue(reloader.last_error)
+
+if __name__ == '__main__':
+    unittest.main()
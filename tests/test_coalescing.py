@@ -0,0 +1,115 @@
+"""
+test_coalescing.py module checks the coalescing of identical jobs by the ThreadPool.
+"""
+
+from threading import Event, Lock, Thread
+import os
+import unittest
+from unittest import mock
+
+from app import webserver
+from app.task_runner import Task, ThreadPool
+
+QUESTION = 'Percent of adults aged 18 years and older who have obesity'
+
+class RecordingTask(Task):
+    """
+    RecordingTask class is a task whose computation is recorded and can be held until a test
+    releases it.
+    """
+    def __init__(self, job_id, question, recorder, client_id='', priority=0):
+        super().__init__(job_id, {'question': question}, webserver.data_ingestor, 'best5_request',
+                         client_id, priority)
+        self.recorder = recorder
+
+    def execute(self, process_pool=None):
+        """
+        Record the computation, wait until the recorder releases it and answer the question.
+        """
+        self.recorder.record(self)
+        self.recorder.release.wait(10)
+        self.result = {'question': self.data['question']}
+
+class Recorder:
+    """
+    Recorder class keeps the job_ids of the tasks that were computed, in order.
+    """
+    def __init__(self):
+        self.computed = []
+        self.lock = Lock()
+        self.started = Event()
+        self.release = Event()
+
+    def record(self, task):
+        """
+        Record the computation of a task.
+        """
+        with self.lock:
+            self.computed.append(task.job_id)
+        self.started.set()
+
+class CoalescingTest(unittest.TestCase):
+    """
+    CoalescingTest class submits identical jobs to a ThreadPool of its own.
+    """
+    def create_pool(self, threads):
+        """
+        Create a ThreadPool of the given number of TaskRunners, shut down after the test.
+        """
+        with mock.patch.dict(os.environ, {'TP_NUM_OF_THREADS': str(threads),
+                                          'TP_BACKEND': 'thread', 'TP_SCHEDULER': 'fair'}):
+            thread_pool = ThreadPool()
+        self.addCleanup(thread_pool.shutdown)
+        return thread_pool
+
+    def test_concurrent_identical_jobs_computed_once(self):
+        """
+        N identical jobs submitted while the first one runs are answered by one computation.
+        """
+        thread_pool = self.create_pool(4)
+        recorder = Recorder()
+        self.addCleanup(recorder.release.set)
+        count = 16
+
+        thread_pool.add_task(RecordingTask(1, QUESTION, recorder))
+        self.assertTrue(recorder.started.wait(10))
+
+        submitters = [Thread(target=thread_pool.add_task,
+                             args=(RecordingTask(job_id, QUESTION, recorder, f"client{job_id}"),))
+                      for job_id in range(2, count + 1)]
+        for submitter in submitters:
+            submitter.start()
+        for submitter in submitters:
+            submitter.join()
+        recorder.release.set()
+
+        for job_id in range(1, count + 1):
+            self.assertTrue(thread_pool.wait_for_task(job_id, 10))
+            self.assertEqual(thread_pool.result_store.get(job_id), {'question': QUESTION})
+        self.assertEqual(recorder.computed, [1])
+        self.assertEqual(thread_pool.coalesced_tasks, count - 1)
+
+    def test_queued_duplicate_keeps_its_priority(self):
+        """
+        A job identical to a queued job of another client is not held back behind it: it is
+        scheduled with its own priority.
+        """
+        thread_pool = self.create_pool(1)
+        recorder = Recorder()
+        self.addCleanup(recorder.release.set)
+
+        # Keep the only TaskRunner busy while the queue fills up
+        thread_pool.add_task(RecordingTask(1, 'blocker', recorder))
+        self.assertTrue(recorder.started.wait(10))
+
+        for job_id in range(2, 12):
+            thread_pool.add_task(RecordingTask(job_id, f"question {job_id}", recorder, 'a'))
+        thread_pool.add_task(RecordingTask(12, 'question 11', recorder, 'b', priority=9))
+        recorder.release.set()
+
+        for job_id in range(1, 13):
+            self.assertTrue(thread_pool.wait_for_task(job_id, 10))
+        self.assertEqual(recorder.computed[:2], [1, 12])
+
+if __name__ == '__main__':
+    unittest.main()
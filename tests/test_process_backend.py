@@ -0,0 +1,148 @@
+"""
+test_process_backend.py module checks that the worker processes of the process backend compute
+every job against the version of the dataset of the job, across reloads of the CSV file.
+"""
+
+from threading import Event
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from app import webserver
+from app.data_ingestor import DataIngestor
+from app.task_runner import BatchTask, Task, ThreadPool
+from benchmarks.datasets import scaled_dataset
+
+QUESTION = 'Percent of adults aged 18 years and older who have obesity'
+
+class HeldTask(Task):
+    """
+    HeldTask class is a task that keeps its TaskRunner busy until a test releases it.
+    """
+    def __init__(self, job_id, release):
+        super().__init__(job_id, {'question': QUESTION}, webserver.data_ingestor, 'best5_request')
+        self.release = release
+
+    def execute(self, process_pool=None):
+        """
+        Wait until the test releases the task.
+        """
+        self.release.wait(10)
+        self.result = {}
+
+class ProcessBackendTest(unittest.TestCase):
+    """
+    ProcessBackendTest class runs jobs of two versions of a CSV file on a process backend of one
+    worker, with the result cache disabled so every job is computed by the worker.
+    """
+    def setUp(self):
+        """
+        Work in a temporary directory, snapshots included, and create the thread pool.
+        """
+        self.work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.work_dir)
+        patcher = mock.patch.dict(os.environ, {
+            'DATA_SNAPSHOT_DIR': os.path.join(self.work_dir, 'snapshots'),
+            'RESULT_CACHE_SIZE': '0', 'TP_BACKEND': 'process', 'TP_NUM_OF_THREADS': '1'})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.thread_pool = ThreadPool()
+        self.addCleanup(self.thread_pool.shutdown)
+        self.job_ids = iter(range(1, 1000))
+
+    def write_dataset(self, csv_path, scale, seed):
+        """
+        Write the rows of test_data.csv, scaled and jittered, to csv_path.
+        """
+        source_dir = os.path.join(self.work_dir, f"seed{seed}")
+        os.makedirs(source_dir, exist_ok=True)
+        shutil.copy(scaled_dataset('test_data.csv', scale, source_dir, seed), csv_path)
+
+    def submit(self, data_ingestor, request_type, data=None):
+        """
+        Submit a job on a dataset. Returns its job_id.
+        """
+        job_id = next(self.job_ids)
+        self.thread_pool.add_task(Task(job_id, data or {'question': QUESTION}, data_ingestor,
+                                       request_type))
+        return job_id
+
+    def result(self, job_id):
+        """
+        Wait for a job and get its result.
+        """
+        self.assertTrue(self.thread_pool.wait_for_task(job_id, 30))
+        self.assertTrue(self.thread_pool.jobs.is_done(job_id))
+        return self.thread_pool.result_store.get(job_id)
+
+    def test_jobs_in_flight_keep_their_version(self):
+        """
+        Jobs of the old dataset that are queued while the CSV file is replaced, reloaded and
+        then half-written again are computed against the old dataset, alternating with jobs of
+        the new one.
+        """
+        csv_path = os.path.join(self.work_dir, 'data.csv')
+        self.write_dataset(csv_path, 2, seed=0)
+        old = DataIngestor(csv_path)
+        request_types = ('states_mean_request', 'mean_by_category_request')
+        expected_old = {request_type: old.compute_question({'question': QUESTION}, request_type)
+                        for request_type in request_types}
+
+        # The worker has the old version loaded
+        for request_type in request_types:
+            self.assertEqual(self.result(self.submit(old, request_type)),
+                             expected_old[request_type])
+
+        # Keep the only TaskRunner busy while the jobs of the old version are queued
+        release = Event()
+        self.addCleanup(release.set)
+        self.thread_pool.add_task(HeldTask(next(self.job_ids), release))
+        in_flight = [(self.submit(old, request_type), request_type)
+                     for request_type in request_types]
+
+        self.write_dataset(csv_path, 3, seed=1)
+        new = DataIngestor(csv_path, old.versions)
+        expected_new = {request_type: new.compute_question({'question': QUESTION}, request_type)
+                        for request_type in request_types}
+        self.assertNotEqual(expected_new, expected_old)
+        # A line still being written, that neither dataset holds
+        with open(csv_path, 'a', encoding='utf-8') as file:
+            file.write('0,2020,2020,OH,Ohio')
+
+        alternating = [(self.submit(data_ingestor, request_type), request_type, expected)
+                       for data_ingestor, expected in ((new, expected_new), (old, expected_old))
+                       * 2 for request_type in request_types]
+        release.set()
+
+        for job_id, request_type in in_flight:
+            self.assertEqual(self.result(job_id), expected_old[request_type])
+        for job_id, request_type, expected in alternating:
+            self.assertEqual(self.result(job_id), expected[request_type])
+
+    def test_batch_computed_in_one_round_trip(self):
+        """
+        The items of a batch that are not cached go to the worker together, in one call, and
+        get the answers computed in this process.
+        """
+        csv_path = os.path.join(self.work_dir, 'data.csv')
+        self.write_dataset(csv_path, 2, seed=0)
+        data_ingestor = DataIngestor(csv_path)
+        items = [{'request_type': request_type, 'question': QUESTION, 'state': state}
+                 for request_type in ('state_mean', 'best5', 'mean_by_category')
+                 for state in ('Ohio', 'Indiana')]
+        items.append({'request_type': 'best5'})
+
+        process_pool = self.thread_pool.process_pool
+        with mock.patch.object(process_pool, 'apply', wraps=process_pool.apply) as apply:
+            job_id = next(self.job_ids)
+            self.thread_pool.add_task(BatchTask(job_id, items, data_ingestor))
+            result = self.result(job_id)
+
+        self.assertEqual(apply.call_count, 1)
+        self.assertEqual(result, data_ingestor.process_batch(items))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+"""
+test_profiler.py module checks that calls sampled by the Profiler at the same time all run, even
+where only one profiler can be active in the process at a time.
+"""
+
+from threading import Barrier, Lock, Thread
+import cProfile
+import os
+import unittest
+from unittest import mock
+
+from app import webserver
+from app.profiler import Profiler
+from app.task_runner import Task, ThreadPool
+
+class ExclusiveProfile(cProfile.Profile):
+    """
+    ExclusiveProfile class is a cProfile.Profile that follows the rule of Python 3.12 and later,
+    where enabling a profile while another one is enabled raises ValueError, on every version.
+    """
+    lock = Lock()
+    enabled = None
+
+    def enable(self, *args, **kwargs):
+        """
+        Enable the profile, unless another one is enabled.
+        """
+        with ExclusiveProfile.lock:
+            if ExclusiveProfile.enabled is not None:
+                raise ValueError("Another profiling tool is already active")
+            ExclusiveProfile.enabled = self
+        super().enable(*args, **kwargs)
+
+    def disable(self):
+        """
+        Disable the profile.
+        """
+        super().disable()
+        with ExclusiveProfile.lock:
+            if ExclusiveProfile.enabled is self:
+                ExclusiveProfile.enabled = None
+
+class MeetingTask(Task):
+    """
+    MeetingTask class is a task that only finishes once the other tasks of its barrier run too.
+    """
+    def __init__(self, job_id, barrier):
+        super().__init__(job_id, {'question': f"question {job_id}"}, webserver.data_ingestor,
+                         'best5_request')
+        self.barrier = barrier
+
+    def execute(self, process_pool=None):
+        """
+        Wait for the other tasks of the barrier, then answer.
+        """
+        self.barrier.wait(10)
+        self.result = {'job_id': self.job_id}
+
+class ProfilerTest(unittest.TestCase):
+    """
+    ProfilerTest class samples every call of concurrent callers.
+    """
+    def setUp(self):
+        """
+        Let only one profile be enabled at a time, as from Python 3.12.
+        """
+        patcher = mock.patch.object(cProfile, 'Profile', ExclusiveProfile)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_concurrent_sampled_calls_run(self):
+        """
+        Two calls sampled at the same time both run, the second one unprofiled.
+        """
+        profiler = Profiler(sample_rate=1)
+        barrier = Barrier(2)
+        results = []
+
+        def meet(value):
+            barrier.wait(10)
+            return value
+
+        def call(value):
+            results.append(profiler.run('key', meet, value))
+
+        callers = [Thread(target=call, args=(value,)) for value in ('a', 'b')]
+        for caller in callers:
+            caller.start()
+        for caller in callers:
+            caller.join()
+
+        self.assertEqual(sorted(results), ['a', 'b'])
+        self.assertEqual(profiler.summary()['profiled'], {'key': 1})
+        self.assertEqual(profiler.active, set())
+
+    def test_concurrent_sampled_jobs_finish(self):
+        """
+        Two jobs sampled at the same time both finish, and the TaskRunners go on.
+        """
+        with mock.patch.dict(os.environ, {'TP_NUM_OF_THREADS': '2', 'TP_BACKEND': 'thread',
+                                          'PROFILE_SAMPLE_RATE': '1'}):
+            thread_pool = ThreadPool()
+        self.addCleanup(thread_pool.shutdown)
+
+        barrier = Barrier(2)
+        for job_id in (1, 2):
+            thread_pool.add_task(MeetingTask(job_id, barrier))
+        for job_id in (1, 2):
+            self.assertTrue(thread_pool.wait_for_task(job_id, 10))
+            self.assertEqual(thread_pool.result_store.get(job_id), {'job_id': job_id})
+
+        thread_pool.add_task(MeetingTask(3, Barrier(1)))
+        self.assertTrue(thread_pool.wait_for_task(3, 10))
+        self.assertTrue(all(thread.is_alive() for thread in thread_pool.threads))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+"""
+test_snapshot_mmap.py module checks that worker processes mapping the same snapshot with
+DATA_SNAPSHOT_MMAP=1 share one copy of the dataset.
+"""
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from app.column_store import ColumnStore
+from app.snapshot import load_snapshot, write_snapshot
+
+WORKERS = 4
+# Rows of the test dataset, about 25 MB of columns
+ROWS = 2_000_000
+
+def pss_kib():
+    """
+    Get the proportional set size of the calling process, in KiB: its private pages plus its
+    share of the pages it shares with other processes.
+    """
+    with open('/proc/self/smaps_rollup', 'r', encoding='utf-8') as file:
+        for line in file:
+            if line.startswith('Pss:'):
+                return int(line.split()[1])
+    raise ValueError('No Pss in smaps_rollup')
+
+def load_in_worker(csv_path, mmap, barrier, results):
+    """
+    Load the snapshot of csv_path in a worker process, read every column and report how much
+    the proportional set size of the worker grew while all the workers hold the dataset.
+    """
+    os.environ['DATA_SNAPSHOT_MMAP'] = '1' if mmap else '0'
+    barrier.wait()
+    before = pss_kib()
+    barrier.wait()
+
+    store = load_snapshot(csv_path)
+    # Fault every page of the columns in
+    for values in store.columns.values():
+        values.sum()
+
+    barrier.wait()
+    results.put(pss_kib() - before)
+    barrier.wait()
+
+@unittest.skipUnless(os.path.exists('/proc/self/smaps_rollup'), 'needs /proc/<pid>/smaps_rollup')
+class SharedSnapshotTest(unittest.TestCase):
+    """
+    SharedSnapshotTest class compares the memory of WORKERS processes holding the same dataset,
+    mapped from the snapshot or read into private copies.
+    """
+    def setUp(self):
+        """
+        Write the snapshot of a dataset of ROWS rows, the rows of test_data.csv repeated.
+        """
+        self.snapshot_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.snapshot_dir)
+        patcher = mock.patch.dict(os.environ, {'DATA_SNAPSHOT_DIR': self.snapshot_dir})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.csv_path = os.path.join(self.snapshot_dir, 'data.csv')
+        shutil.copy('test_data.csv', self.csv_path)
+        store = ColumnStore.from_csv(self.csv_path)
+        repeats = -(-ROWS // len(store))
+        store.columns = {column: np.tile(values, repeats)
+                         for column, values in store.columns.items()}
+        self.assertTrue(write_snapshot(self.csv_path, store, os.stat(self.csv_path)))
+        self.dataset_kib = sum(values.nbytes for values in store.columns.values()) // 1024
+
+    def total_growth_kib(self, mmap):
+        """
+        Get the sum of the proportional set size growth of WORKERS processes loading the
+        snapshot.
+        """
+        context = multiprocessing.get_context('fork')
+        barrier = context.Barrier(WORKERS)
+        results = context.Queue()
+        workers = [context.Process(target=load_in_worker,
+                                   args=(self.csv_path, mmap, barrier, results))
+                   for _ in range(WORKERS)]
+        for worker in workers:
+            worker.start()
+        growth = sum(results.get(timeout=60) for _ in workers)
+        for worker in workers:
+            worker.join(60)
+            self.assertEqual(worker.exitcode, 0)
+        return growth
+
+    def test_mapped_snapshot_is_shared(self):
+        """
+        The mapped workers hold about one copy of the dataset in total, the private ones one
+        copy each.
+        """
+        private = self.total_growth_kib(mmap=False)
+        mapped = self.total_growth_kib(mmap=True)
+
+        self.assertGreater(private, (WORKERS - 0.5) * self.dataset_kib)
+        self.assertLess(mapped, 1.5 * self.dataset_kib)
+
+if __name__ == '__main__':
+    unittest.main()